@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读取时复权
+etf_prices / stock_daily 保存不复权的 OHLCV，除权除息事件单独保存在很小的 adj_factors 表中，
+读取时按需要的复权方式（不复权 / 前复权 qfq / 后复权 hfq）换算价格。分红、拆分只需要追加一条事件，
+不再需要重新获取并重写全部历史的复权价格。
+
+  - 事件推算: 不复权日线中，除权除息日的涨跌额以交易所公布的除权参考价为基准，
+    因此 ratio = 前一交易日收盘价 / (收盘价 - 涨跌额)；普通交易日两者相等（ratio = 1），不记录
+  - 后复权因子: 各标的事件的 ratio 按日期累乘，hfq = 不复权价格 × 当日生效的累计因子
+  - 前复权: qfq = hfq / 最新的累计因子（最新价格不变，历史价格向下调整）
+  - 换算是按 (标的, 日期) 的 as-of 连接，全部向量化；只调整开高低收，成交量、涨跌幅等保持原值
+  - 不复权的行 price_adjust = 'raw'；v2 之前写入的行本身就是后复权价格（price_adjust = 'hfq'），
+    更新脚本会重新获取这些标的的不复权数据。在此之前全部是旧行的标的按 hfq 原样返回，
+    同一标的混有两种行时拒绝复权（衔接处会有跳变）
+
+用法:
+    from adjust import read_adjusted
+    df = read_adjusted('data', 'etf_prices', columns=['close'], keys=['513100'], adjust='qfq')
+
+    python adjust.py rebuild etf_prices          从已存储的不复权日线重新推算全部事件
+    python adjust.py show etf_prices 513100      列出一个标的的事件和累计因子
+    python adjust.py verify 513100               与 akshare 的后复权价格对比（需要网络）
+"""
+
+import os
+import sys
+import json
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from catalog import read_table, update_catalog
+from schemas import get_schema
+from storage import save_partitioned
+
+# --- 配置 ---
+# Parquet文件的根目录（默认使用本文件旁边的 data 目录，便于从 strategy/ 下的 notebook 调用）
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+FACTOR_TABLE = 'adj_factors'
+# 保存不复权价格、读取时复权的表
+ADJUSTED_TABLES = ('etf_prices', 'stock_daily')
+# 复权时换算的价格列
+PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+# 支持的复权方式
+ADJUST_METHODS = ('none', 'qfq', 'hfq')
+# price_adjust 列中不复权价格的标记（'none' 在写入规整时会被视为缺失值）
+RAW = 'raw'
+# 记录仍有旧版后复权行的标的及其最早日期的状态文件（位于 OUTPUT_DIR 下）
+LEGACY_STATE = os.path.join('_state', '{table}_legacy.json')
+# 最小价格变动单位；前收盘价与除权参考价相差超过半个单位才视为除权除息事件
+PRICE_TICK = 0.001
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+EVENT_COLUMNS = ['date', 'symbol', 'table_name', 'ratio', 'prev_close', 'ref_price']
+
+
+def derive_events(bars: pd.DataFrame, table_name: str, tick: float = PRICE_TICK) -> pd.DataFrame:
+    """
+    从不复权日线推算除权除息事件。
+
+    每个标的的第一根K线没有前收盘价，不产生事件；增量更新时获取窗口与上次重叠，窗口内第一天的事件
+    在上一次更新中已经推算过。
+
+    Returns:
+        [date, symbol, table_name, ratio, prev_close, ref_price]，每个事件一行。
+    """
+    if 'price_adjust' in bars.columns:
+        bars = bars[bars['price_adjust'].astype(str) == RAW]
+    df = bars[['date', 'symbol', 'close', 'change_amount']].dropna(subset=['close', 'change_amount'])
+    df = df.assign(date=pd.to_datetime(df['date']), symbol=df['symbol'].astype(str))
+    df = df.drop_duplicates(subset=['symbol', 'date'], keep='last').sort_values(['symbol', 'date'])
+
+    prev_close = df.groupby('symbol', sort=False)['close'].shift(1)
+    ref_price = df['close'] - df['change_amount']
+    mask = prev_close.notna() & (ref_price > 0) & ((prev_close - ref_price).abs() > tick / 2)
+    events = pd.DataFrame({
+        'date': df['date'][mask],
+        'symbol': df['symbol'][mask],
+        'table_name': table_name,
+        'ratio': (prev_close / ref_price)[mask],
+        'prev_close': prev_close[mask],
+        'ref_price': ref_price[mask],
+    }, columns=EVENT_COLUMNS)
+    return events.reset_index(drop=True)
+
+
+def save_events(events: pd.DataFrame, output_dir: str = OUTPUT_DIR) -> List[str]:
+    """合并写入事件（按 table_name + symbol + date 去重），返回写入的分区月份"""
+    from warehouse import refresh_after_write
+
+    if events.empty:
+        return []
+    schema = get_schema(FACTOR_TABLE)
+    written = save_partitioned(events, output_dir, FACTOR_TABLE, schema.date_column, schema.unique_columns,
+                               skip_unchanged=True, schema=schema)
+    update_catalog(output_dir, FACTOR_TABLE, written)
+    refresh_after_write(output_dir, FACTOR_TABLE)
+    logger.info(f"已写入 {len(events)} 条除权除息事件（{len(written)} 个分区有变化）")
+    return written
+
+
+def load_events(table_name: str, keys: Optional[Iterable[str]] = None, output_dir: str = OUTPUT_DIR) -> pd.DataFrame:
+    """读取一张表（可限定标的）的全部事件；前复权以最新因子为基准，因此总是读取完整历史"""
+    events = read_table(output_dir, FACTOR_TABLE, keys=keys)
+    if events.empty:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+    events = events[events['table_name'].astype(str) == table_name]
+    return events.assign(symbol=events['symbol'].astype(str), date=pd.to_datetime(events['date']))
+
+
+def cumulative_factors(events: pd.DataFrame) -> pd.DataFrame:
+    """
+    每个事件日起生效的累计后复权因子。
+
+    Returns:
+        [symbol, date, factor, latest]：factor 为截至该事件的 ratio 累乘，latest 为该标的最新的累计因子。
+    """
+    events = events.sort_values(['symbol', 'date'])
+    factor = events.groupby('symbol', sort=False)['ratio'].cumprod()
+    latest = factor.groupby(events['symbol'], sort=False).transform('last')
+    return pd.DataFrame({'symbol': events['symbol'], 'date': events['date'], 'factor': factor, 'latest': latest})
+
+
+def apply_adjustment(bars: pd.DataFrame, events: pd.DataFrame, adjust: Optional[str] = 'qfq',
+                     columns: Iterable[str] = PRICE_COLUMNS) -> pd.DataFrame:
+    """
+    把不复权价格换算为指定的复权方式（按标的、日期 as-of 连接累计因子，向量化计算）。
+
+    Args:
+        bars: 含 date / symbol 和价格列的不复权数据（行顺序保持不变）。
+        events: load_events / derive_events 返回的事件。
+        adjust: 'qfq'、'hfq'，'none' 或 None 表示不复权。
+
+    Raises:
+        ValueError: 同一标的混有旧版本的后复权行和不复权行（见 _check_legacy）。
+    """
+    adjust = adjust or 'none'
+    if adjust not in ADJUST_METHODS:
+        raise ValueError(f"不支持的复权方式: {adjust}，可选: {ADJUST_METHODS}")
+    columns = [col for col in columns if col in bars.columns]
+    legacy = bars['price_adjust'].astype(str) != RAW if 'price_adjust' in bars.columns else None
+    if legacy is not None and not legacy.any():
+        legacy = None
+    if adjust == 'none' or bars.empty or not columns:
+        if legacy is not None:
+            logger.warning(f"{int(legacy.sum())} 行是旧版本保存的后复权价格，原样返回；重新获取后即为不复权数据")
+        return bars
+    if legacy is not None:
+        _check_legacy(bars['symbol'].astype(str), legacy, adjust)
+
+    factors = cumulative_factors(events) if len(events) else None
+    if factors is None:
+        multiplier = np.ones(len(bars))
+    else:
+        left = pd.DataFrame({'date': pd.to_datetime(bars['date']).astype('datetime64[ns]').to_numpy(),
+                             'symbol': bars['symbol'].astype(str).to_numpy(dtype=object),
+                             'row': np.arange(len(bars))})
+        right = factors.assign(date=factors['date'].astype('datetime64[ns]'),
+                               symbol=factors['symbol'].to_numpy(dtype=object))
+        merged = pd.merge_asof(left.sort_values('date'), right.sort_values('date'), on='date', by='symbol',
+                               direction='backward').sort_values('row')
+        factor = merged['factor'].fillna(1.0).to_numpy()
+        if adjust == 'hfq':
+            multiplier = factor
+        else:
+            latest = factors.groupby('symbol')['latest'].last()
+            multiplier = factor / merged['symbol'].map(latest).fillna(1.0).to_numpy()
+    if legacy is not None:
+        multiplier = np.where(legacy.to_numpy(), 1.0, multiplier)
+
+    bars = bars.copy()
+    for col in columns:
+        bars[col] = bars[col].to_numpy(dtype='float64', na_value=np.nan) * multiplier
+    return bars
+
+
+def _check_legacy(symbols: pd.Series, legacy: pd.Series, adjust: str):
+    """
+    旧版本的后复权行与不复权行不能混在同一个标的的序列中：两种价格的基准不同，衔接处会出现跳变。
+    全部是旧行的标的本身就是数据源的后复权序列，hfq 原样返回；qfq 需要事件，无法换算。
+
+    Raises:
+        ValueError: 存在混合的标的，或请求 qfq 时存在旧行。
+    """
+    counts = pd.crosstab(symbols, legacy)
+    mixed = sorted(counts.index[(counts.get(True, 0) > 0) & (counts.get(False, 0) > 0)])
+    if mixed:
+        raise ValueError(f"标的 {mixed} 同时有旧版本的后复权行和不复权行，无法得到连续的复权序列；"
+                         f"请先重新获取不复权数据（update_etf.py / backfill.py）")
+    legacy_symbols = sorted(counts.index[counts.get(True, 0) > 0])
+    if adjust != 'hfq':
+        raise ValueError(f"标的 {legacy_symbols} 仍是旧版本保存的后复权价格，无法换算为 {adjust}；"
+                         f"请先重新获取不复权数据（update_etf.py / backfill.py）")
+    logger.warning(f"标的 {legacy_symbols} 仍是旧版本保存的后复权价格，原样作为 hfq 返回")
+
+
+def read_adjusted(output_dir: str, table_name: str, columns: Optional[List[str]] = None,
+                  start: Optional[str] = None, end: Optional[str] = None, keys: Optional[Iterable[str]] = None,
+                  adjust: Optional[str] = 'qfq') -> pd.DataFrame:
+    """
+    catalog.read_table 加上读取时复权，参数与 read_table 相同。
+
+    Args:
+        adjust: 'qfq'（默认）、'hfq'，'none' 或 None 表示不复权。
+    """
+    keys = list(map(str, keys)) if keys is not None else None
+    read_columns = list(dict.fromkeys(list(columns) + ['price_adjust'])) if columns is not None else None
+    df = read_table(output_dir, table_name, columns=read_columns, start=start, end=end, keys=keys)
+    if df.empty:
+        return df
+    df = apply_adjustment(df, load_events(table_name, keys, output_dir), adjust)
+    if columns is not None and 'price_adjust' not in columns:
+        df = df.drop(columns=['price_adjust'])
+    return df
+
+
+def scan_legacy(output_dir: str, table_name: str, keys: Optional[Iterable[str]] = None) -> Dict[str, pd.Timestamp]:
+    """从已存储的数据中找出仍有非不复权行（旧版本保存的后复权价格）的标的，返回各标的这些行的最早日期"""
+    df = read_table(output_dir, table_name, columns=['price_adjust'], keys=keys)
+    if df.empty:
+        return {}
+    df = df[df['price_adjust'].astype(str) != RAW]
+    return {str(symbol): pd.Timestamp(date) for symbol, date in df.groupby(df['symbol'].astype(str))['date'].min().items()}
+
+
+def _legacy_path(output_dir: str, table_name: str) -> str:
+    return os.path.join(output_dir, LEGACY_STATE.format(table=table_name))
+
+
+def load_legacy(output_dir: str, table_name: str) -> Dict[str, pd.Timestamp]:
+    """
+    读取待重新获取不复权数据的标的。状态文件不存在时从数据中扫描一次并保存；
+    之后只有重新获取成功、数据确认已是不复权价格的标的才会被移除（见 clear_legacy）。
+    """
+    path = _legacy_path(output_dir, table_name)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return {symbol: pd.Timestamp(value) for symbol, value in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取 {path} 失败，将从数据中重新扫描: {e}")
+    legacy = scan_legacy(output_dir, table_name)
+    save_legacy(output_dir, table_name, legacy)
+    if legacy:
+        logger.info(f"{table_name} 中有 {len(legacy)} 个标的仍是旧版本的后复权价格，需要重新获取不复权数据")
+    return legacy
+
+
+def save_legacy(output_dir: str, table_name: str, legacy: Dict[str, pd.Timestamp]):
+    path = _legacy_path(output_dir, table_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({symbol: ts.strftime('%Y-%m-%d') for symbol, ts in sorted(legacy.items())}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def clear_legacy(output_dir: str, table_name: str, legacy: Dict[str, pd.Timestamp],
+                 refetched: Iterable[str]) -> Dict[str, pd.Timestamp]:
+    """
+    重新获取成功后更新状态：重新扫描 refetched 中的待处理标的，已全部改写为不复权价格的移除。
+    数据源不再提供的日期上残留的旧行无法通过重新获取改写，这些标的记录错误后同样移除（不再反复全量获取）。
+    """
+    refetched = [symbol for symbol in refetched if symbol in legacy]
+    if not refetched:
+        return legacy
+    remaining = scan_legacy(output_dir, table_name, keys=refetched)
+    for symbol in refetched:
+        if symbol in remaining:
+            logger.error(f"{table_name} {symbol} 重新获取后仍有 {remaining[symbol]:%Y-%m-%d} 起的旧版后复权行"
+                         f"（数据源不再提供这些日期），读取时复权会拒绝该标的，需要手动删除这些行")
+        legacy.pop(symbol, None)
+    save_legacy(output_dir, table_name, legacy)
+    logger.info(f"{table_name} 已有 {len(refetched)} 个标的改为不复权数据，还剩 {len(legacy)} 个待重新获取")
+    return legacy
+
+
+def rebuild_events(table_name: str, symbols: Optional[Iterable[str]] = None, output_dir: str = OUTPUT_DIR) -> int:
+    """从已存储的不复权日线重新推算全部事件（例如分块回填之后，块边界上的事件需要完整的前收盘价）"""
+    bars = read_table(output_dir, table_name, columns=['close', 'change_amount', 'price_adjust'], keys=symbols)
+    if bars.empty:
+        return 0
+    events = derive_events(bars, table_name)
+    save_events(events, output_dir)
+    return len(events)
+
+
+def verify(symbol: str, start: str = '20200101', end: Optional[str] = None) -> float:
+    """
+    用 akshare 同时获取一只 ETF 的不复权和后复权日线，比较推算的后复权收益与数据源的后复权收益，
+    返回日收益率的最大绝对偏差（数据源的后复权可能采用加减法，偏差接近 0 即说明事件推算正确）。
+    """
+    import akshare as ak
+    from update_etf import COLUMN_MAPPING
+
+    end = end or pd.Timestamp.now().strftime('%Y%m%d')
+    raw = ak.fund_etf_hist_em(symbol=symbol, period='daily', start_date=start, end_date=end, adjust='')
+    hfq = ak.fund_etf_hist_em(symbol=symbol, period='daily', start_date=start, end_date=end, adjust='hfq')
+    raw = raw.rename(columns=COLUMN_MAPPING).assign(symbol=symbol)
+    hfq = hfq.rename(columns=COLUMN_MAPPING)[['date', 'close']]
+    events = derive_events(raw, 'etf_prices')
+    ours = apply_adjustment(raw, events, 'hfq')[['date', 'close']]
+    merged = ours.merge(hfq, on='date', suffixes=('_ours', '_source'))
+    returns = merged[['close_ours', 'close_source']].pct_change().iloc[1:]
+    deviation = float((returns['close_ours'] - returns['close_source']).abs().max()) if len(returns) else 0.0
+    print(f"{symbol}: {len(events)} 个事件，推算与数据源后复权的日收益率最大偏差 {deviation:.6f}")
+    return deviation
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = sys.argv[1:]
+    command = args[0] if args else None
+    if command == 'rebuild' and len(args) >= 2 and args[1] in ADJUSTED_TABLES:
+        count = rebuild_events(args[1], args[2:] or None)
+        logger.info(f"{args[1]} 共推算出 {count} 条除权除息事件")
+    elif command == 'show' and len(args) == 3:
+        events = load_events(args[1], [args[2]]).sort_values('date')
+        events['factor'] = events['ratio'].cumprod()
+        print(events.to_string(index=False) if len(events) else "没有事件")
+    elif command == 'verify' and len(args) == 2:
+        verify(args[1])
+    else:
+        print("用法: python adjust.py rebuild <表名> [标的 ...] | show <表名> <标的> | verify <ETF代码>")
+        sys.exit(1)
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A股个股历史数据的可恢复分块回填
+把 stock_daily（日线，ak.stock_zh_a_hist）和 stock_valuation（估值，ak.stock_value_em）存为与 etf_prices
+相同的按 year_month 分区的表，替代 notebook 中串行 tqdm 循环导出的 close.parquet / stock_valuation_data.parquet。
+
+  - 工作单元: 标的 × 日期区间（日线按自然年切分；估值接口只能返回完整历史，每个标的一个单元）
+  - 并发获取: 使用 fetch_pool.FetchExecutor（限速、重试、单个单元失败不影响其他单元）
+  - 批量写入: 每 BATCH_UNITS 个单元的结果合并为一批，以 append 模式追加增量文件，回填结束后统一压缩分区
+  - 断点续传: 一批数据写入成功后才把其中的单元记入检查点（data/_state/backfill_<表名>.json），
+    中断后重新运行会跳过已完成的单元；写入与检查点之间中断时该批会被重新获取，按唯一键去重，结果不变
+  - 检查点按单元（标的 × 年份，估值为标的）记录已获取到的日期，最晚为昨天（今天的数据尚未结束）；
+    之后的回填只获取该日期之后的尾部（估值接口仍返回完整历史，获取后截取尾部写入）
+
+用法:
+    python backfill.py stock_daily --index 932368 --start 2018-01-01
+    python backfill.py stock_valuation --symbols 600000,000001
+    python backfill.py stock_daily --index 000906 --start 2015-01-01   # 中证800
+    python backfill.py status stock_daily                             # 查看检查点
+    python backfill.py stock_daily --index 932368 --reset             # 清除检查点重新回填
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from adjust import ADJUSTED_TABLES, clear_legacy, load_legacy, rebuild_events
+from catalog import update_catalog
+from fetch_pool import FetchExecutor
+from run_metrics import start_run
+from schemas import get_schema
+from storage import IngestBatch, compact_table, save_partitioned
+from warehouse import refresh_after_write
+
+# --- 配置 ---
+# Parquet文件的根目录（默认使用本文件旁边的 data 目录）
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+STATE_DIR = os.path.join(OUTPUT_DIR, '_state')
+# 默认回填起始日期
+DEFAULT_START = '2018-01-01'
+# 日线的复权方式：与 etf_prices 一致保存不复权价格，复权在读取时计算（见 adjust.py）
+ADJUST = ''
+# 每批写入的工作单元数量，以及并发获取的线程数和限速主机名（见 fetch_pool.HOST_RATE_LIMITS）
+BATCH_UNITS = 50
+FETCH_WORKERS = 4
+FETCH_HOST = 'eastmoney'
+# akshare 返回的中文列名到存储列名的映射
+DAILY_COLUMN_MAPPING = {
+    '日期': 'date', '开盘': 'open', '收盘': 'close', '最高': 'high', '最低': 'low',
+    '成交量': 'volume', '成交额': 'turnover', '振幅': 'amplitude',
+    '涨跌幅': 'change_pct', '涨跌额': 'change_amount', '换手率': 'turnover_rate'
+}
+VALUATION_COLUMN_MAPPING = {
+    '数据日期': 'date', '当日收盘价': 'close', '当日涨跌幅': 'change_pct',
+    '总市值': 'total_market_cap', '流通市值': 'float_market_cap', '总股本': 'total_shares', '流通股本': 'float_shares',
+    'PE(TTM)': 'pe_ttm', 'PE(静)': 'pe_static', '市净率': 'pb', 'PEG值': 'peg', '市现率': 'pcfr', '市销率': 'psr'
+}
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+
+def fetch_stock_daily(symbol: str, start: str, end: str) -> Optional[pd.DataFrame]:
+    """获取一只股票 [start, end] 的日线（日期为 'YYYY-MM-DD'）"""
+    import akshare as ak
+
+    df = ak.stock_zh_a_hist(symbol=symbol, period='daily', start_date=start.replace('-', ''),
+                            end_date=end.replace('-', ''), adjust=ADJUST)
+    if df is None or df.empty:
+        return None
+    df = df.rename(columns=DAILY_COLUMN_MAPPING)
+    df['symbol'] = symbol
+    df['price_adjust'] = 'raw'
+    return df[[col for col in get_schema('stock_daily').fields if col in df.columns]]
+
+
+def fetch_stock_valuation(symbol: str, start: str, end: str) -> Optional[pd.DataFrame]:
+    """获取一只股票的估值历史（接口返回完整历史，截取 [start, end]）"""
+    import akshare as ak
+
+    df = ak.stock_value_em(symbol=symbol)
+    if df is None or df.empty:
+        return None
+    df = df.rename(columns=VALUATION_COLUMN_MAPPING)
+    df['date'] = pd.to_datetime(df['date'])
+    df = df[(df['date'] >= pd.Timestamp(start)) & (df['date'] <= pd.Timestamp(end))]
+    df['symbol'] = symbol
+    return df[[col for col in get_schema('stock_valuation').fields if col in df.columns]]
+
+
+@dataclass
+class BackfillSource:
+    """
+    一张回填表的数据源。
+
+    Args:
+        table: 表名（需在 schemas.py 中注册）。
+        fetch: fetch(symbol, start, end) -> DataFrame（列名已映射为存储列名），没有数据时返回 None。
+        chunk_by_year: 数据源支持按日期区间请求时按自然年切分工作单元；否则每个标的一个单元。
+    """
+    table: str
+    fetch: Callable[[str, str, str], Optional[pd.DataFrame]]
+    chunk_by_year: bool = True
+
+
+SOURCES = {
+    'stock_daily': BackfillSource('stock_daily', fetch_stock_daily, chunk_by_year=True),
+    'stock_valuation': BackfillSource('stock_valuation', fetch_stock_valuation, chunk_by_year=False),
+}
+
+
+# 不按年份切分的单元在检查点中的块名
+WHOLE_HISTORY = 'all'
+
+
+@dataclass(frozen=True)
+class WorkUnit:
+    """
+    一个工作单元：一个标的的一段日期区间（含两端）。
+
+    Args:
+        chunk: 单元所属的块（年份，或不切分时为 WHOLE_HISTORY）。检查点按 标的:块 记录，
+            与本次回填的起止日期无关，只获取尾部的单元与完整单元使用同一个键。
+    """
+    symbol: str
+    start: str
+    end: str
+    chunk: str = WHOLE_HISTORY
+
+    @property
+    def key(self) -> str:
+        return f"{self.symbol}:{self.chunk}"
+
+
+def _next_day(date: str) -> str:
+    return (pd.Timestamp(date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+def plan_units(symbols: Iterable[str], start: str, end: str, chunk_by_year: bool = True) -> List[WorkUnit]:
+    """
+    把 标的 × 日期范围 切分为工作单元。
+    按日期区间优先排序，同一批单元落在相同的月份分区中，写入时涉及的分区最少。
+    """
+    start = pd.Timestamp(start).strftime('%Y-%m-%d')
+    end = pd.Timestamp(end).strftime('%Y-%m-%d')
+    if chunk_by_year:
+        ranges = []
+        for year in range(int(start[:4]), int(end[:4]) + 1):
+            ranges.append((max(start, f'{year}-01-01'), min(end, f'{year}-12-31'), str(year)))
+    else:
+        ranges = [(start, end, WHOLE_HISTORY)]
+    return [WorkUnit(str(symbol), range_start, range_end, chunk)
+            for range_start, range_end, chunk in ranges for symbol in symbols]
+
+
+class Checkpoint:
+    """
+    回填检查点：各单元已获取的区间（起始日期、已获取到的日期、行数），最近一次失败的单元及错误信息。
+    """
+
+    def __init__(self, table: str, state_dir: str = STATE_DIR):
+        self.path = os.path.join(state_dir, f'backfill_{table}.json')
+        self.done: Dict[str, Dict] = {}
+        self.failed: Dict[str, str] = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                chunk_by_year = SOURCES[table].chunk_by_year if table in SOURCES else True
+                self.done = dict(self._migrate(key, value, chunk_by_year) for key, value in data.get('done', {}).items())
+                self.failed = dict(data.get('failed', {}))
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取回填检查点失败，将从头开始: {e}")
+
+    @staticmethod
+    def _migrate(key: str, value, chunk_by_year: bool):
+        """旧格式的记录（标的:起始:结束 -> 行数）转换为 标的:块 -> 区间"""
+        if isinstance(value, dict):
+            return key, value
+        symbol, start, end = key.split(':')
+        chunk = start[:4] if chunk_by_year else WHOLE_HISTORY
+        return f"{symbol}:{chunk}", {'start': start, 'through': end, 'rows': value}
+
+    def remaining(self, unit: WorkUnit) -> Optional[WorkUnit]:
+        """单元还需要获取的部分：没有记录时为整个单元，已获取到单元的结束日期时为 None，否则为之后的尾部"""
+        entry = self.done.get(unit.key)
+        if entry is None or entry['start'] > unit.start:
+            return unit
+        if entry['through'] >= unit.end:
+            return None
+        return replace(unit, start=max(unit.start, _next_day(entry['through'])))
+
+    def record(self, unit: WorkUnit, rows: int, through: str):
+        """记录单元已获取到 through（含）；获取的是已有记录之后的尾部时与已有记录合并"""
+        if through < unit.start:
+            return
+        entry = self.done.get(unit.key)
+        if entry is not None and entry['start'] < unit.start <= _next_day(entry['through']):
+            self.done[unit.key] = {'start': entry['start'], 'through': max(through, entry['through']),
+                                   'rows': entry['rows'] + rows}
+        else:
+            self.done[unit.key] = {'start': unit.start, 'through': through, 'rows': rows}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'updated_at': datetime.now().isoformat(timespec='seconds'),
+                       'done': self.done, 'failed': self.failed}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.done, self.failed = {}, {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _write_batch(table: pa.Table, units: List[WorkUnit], output_dir: str, table_name: str) -> List[WorkUnit]:
+    """
+    以 append 模式写入一批数据，返回数据全部写入成功的工作单元。
+    某个月份分区写入失败时，数据落在该分区的单元不算完成。
+    """
+    schema = get_schema(table_name)
+    written = save_partitioned(table, output_dir, table_name, schema.date_column, schema.unique_columns,
+                               mode='append', schema=schema)
+    update_catalog(output_dir, table_name, written)
+
+    year_month = pc.strftime(pc.cast(table[schema.date_column], pa.timestamp('ns')), format='%Y-%m')
+    failed_mask = pc.invert(pc.is_in(year_month, value_set=pa.array(written, pa.string())))
+    failed_symbols = set(table.filter(failed_mask)[schema.key_column].to_pylist())
+    return [unit for unit in units if unit.symbol not in failed_symbols]
+
+
+def backfill(table_name: str, symbols: Iterable[str], start: str = DEFAULT_START, end: Optional[str] = None,
+             output_dir: str = OUTPUT_DIR, batch_units: int = BATCH_UNITS, max_workers: int = FETCH_WORKERS,
+             source: Optional[BackfillSource] = None, checkpoint: Optional[Checkpoint] = None,
+             compact: bool = True) -> Dict[str, int]:
+    """
+    回填 symbols 在 [start, end] 内的历史数据，跳过检查点中已完成的工作单元，部分完成的单元只获取尾部。
+
+    Args:
+        table_name: 'stock_daily' 或 'stock_valuation'。
+        symbols: 股票代码列表。
+        start / end: 日期范围，end 默认为今天。
+        batch_units: 每批写入的工作单元数量。
+        source: 数据源，默认使用 SOURCES 中的定义。
+        checkpoint: 检查点，默认使用 data/_state/backfill_<表名>.json。
+        compact: 回填结束后把增量文件压缩回基础文件。
+
+    Returns:
+        Dict[str, int]: 本次完成的单元数、跳过的单元数、失败的单元数和写入行数。
+    """
+    source = source or SOURCES[table_name]
+    checkpoint = checkpoint or Checkpoint(table_name)
+    end = pd.Timestamp(end or datetime.now()).strftime('%Y-%m-%d')
+    # 今天的数据尚未结束，检查点最晚记录到昨天
+    yesterday = (pd.Timestamp(datetime.now().date()) - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    schema = get_schema(table_name)
+
+    units = plan_units(symbols, start, end, source.chunk_by_year)
+    # 仍有旧版后复权行的标的，覆盖这些行的单元即使已完成也重新获取不复权数据
+    legacy = load_legacy(output_dir, table_name) if table_name in ADJUSTED_TABLES else {}
+    legacy_until = {symbol: date.strftime('%Y-%m-%d') for symbol, date in legacy.items()}
+    pending = []
+    for unit in units:
+        rest = unit if unit.end >= legacy_until.get(unit.symbol, '9999') else checkpoint.remaining(unit)
+        if rest is not None:
+            pending.append(rest)
+    failed_symbols = set()
+    pending_symbols = {unit.symbol for unit in pending}
+    stats = {'units': len(units), 'skipped': len(units) - len(pending), 'done': 0, 'failed': 0, 'rows': 0}
+    logger.info(f"{table_name} 回填: 共 {len(units)} 个工作单元，已完成 {stats['skipped']} 个，待处理 {len(pending)} 个")
+
+    executor = FetchExecutor(max_workers=max_workers)
+    with start_run(table_name, output_dir) as run:
+        started = time.perf_counter()
+        for offset in range(0, len(pending), batch_units):
+            chunk = pending[offset:offset + batch_units]
+            by_key = {unit.key: unit for unit in chunk}
+            result = executor.fetch_all(
+                list(by_key), lambda key: source.fetch(by_key[key].symbol, by_key[key].start, by_key[key].end),
+                host=FETCH_HOST)
+
+            batch = IngestBatch(date_column=schema.date_column)
+            for df in result.ordered(by_key):
+                batch.add(df)
+            fetched = [by_key[key] for key in by_key if key not in result.errors]
+            completed = fetched
+            if len(batch) > 0:
+                with run.timer('save'):
+                    completed = _write_batch(batch.finish(), fetched, output_dir, table_name)
+
+            for key, error in result.errors.items():
+                checkpoint.failed[key] = str(error)
+            for unit in completed:
+                checkpoint.failed.pop(unit.key, None)
+                rows = result.results.get(unit.key)
+                checkpoint.record(unit, 0 if rows is None else len(rows), min(unit.end, yesterday))
+            checkpoint.save()
+
+            stats['done'] += len(completed)
+            stats['failed'] += len(chunk) - len(completed)
+            failed_symbols.update(unit.symbol for unit in set(chunk) - set(completed))
+            stats['rows'] += sum(len(result.results[unit.key]) for unit in completed if unit.key in result.results)
+            processed = offset + len(chunk)
+            elapsed = time.perf_counter() - started
+            eta = elapsed / processed * (len(pending) - processed)
+            logger.info(f"进度 {processed}/{len(pending)}，失败 {stats['failed']}，"
+                        f"已用 {elapsed:.0f} 秒，预计剩余 {eta:.0f} 秒")
+
+        run.records_count = stats['rows']
+        if stats['failed']:
+            run.fail(f"{stats['failed']} 个工作单元失败，重新运行即可续传")
+        if compact and stats['done']:
+            with run.timer('compact'):
+                compacted = compact_table(output_dir, table_name, schema.unique_columns, threshold=1, schema=schema)
+                update_catalog(output_dir, table_name, compacted)
+        if table_name in ADJUSTED_TABLES and stats['done']:
+            # 各块按年份分别获取，块边界上的事件需要前一块的收盘价，因此从已存储的完整日线重新推算
+            with run.timer('adjust'):
+                rebuild_events(table_name, sorted({unit.symbol for unit in units}), output_dir)
+            clear_legacy(output_dir, table_name, legacy,
+                         [symbol for symbol in legacy_until if symbol not in failed_symbols and symbol in pending_symbols])
+        refresh_after_write(output_dir, table_name)
+
+    logger.info(f"{table_name} 回填结束: 完成 {stats['done']}，跳过 {stats['skipped']}，失败 {stats['failed']}，"
+                f"写入 {stats['rows']} 行")
+    return stats
+
+
+def index_constituents(index_code: str) -> List[str]:
+    """中证指数成分股代码（如 932368 中证800自由现金流、000906 中证800）"""
+    import akshare as ak
+
+    df = ak.index_stock_cons_csindex(symbol=index_code)
+    return df['成分券代码'].astype(str).str.replace(r'\.SH|\.SZ', '', regex=True).tolist()
+
+
+def print_status(table_name: str):
+    checkpoint = Checkpoint(table_name)
+    symbols = {key.split(':', 1)[0] for key in checkpoint.done}
+    print(f"{table_name}: 已完成 {len(checkpoint.done)} 个工作单元（{len(symbols)} 个标的），"
+          f"共 {sum(entry['rows'] for entry in checkpoint.done.values())} 行；失败 {len(checkpoint.failed)} 个")
+    for key, error in sorted(checkpoint.failed.items())[:20]:
+        print(f"  {key}: {error}")
+    print(f"检查点: {checkpoint.path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.FileHandler('data_update.log', mode='a'), logging.StreamHandler()]
+    )
+    logging.getLogger('storage').setLevel(logging.WARNING)
+    args = sys.argv[1:]
+
+    def option(flag: str, default=None):
+        return args[args.index(flag) + 1] if flag in args else default
+
+    if args[:1] == ['status'] and len(args) == 2:
+        print_status(args[1])
+        sys.exit(0)
+    if not args or args[0] not in SOURCES:
+        print(f"用法: python backfill.py {{{'|'.join(SOURCES)}}} (--index 代码 | --symbols a,b,c) "
+              f"[--start YYYY-MM-DD] [--end YYYY-MM-DD] [--reset]")
+        sys.exit(2)
+
+    table_name = args[0]
+    if option('--symbols'):
+        symbols = option('--symbols').split(',')
+    elif option('--index'):
+        symbols = index_constituents(option('--index'))
+    else:
+        print("需要 --index 或 --symbols 指定股票池")
+        sys.exit(2)
+    checkpoint = Checkpoint(table_name)
+    if '--reset' in args:
+        checkpoint.reset()
+    stats = backfill(table_name, symbols, start=option('--start', DEFAULT_START), end=option('--end'),
+                     checkpoint=checkpoint)
+    sys.exit(1 if stats['failed'] else 0)
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据与策略热点路径的基准测试
+在临时目录中用 synthetic.py 生成确定性的合成数据，对以下路径计时，结果追加到 JSON 历史文件，
+并与同一规模的上一次结果比较，便于在不同提交之间对比、在每日任务变慢之前发现吞吐量回退：
+
+  save_initial      首次按月分区写入全部 ETF 历史（schema 规整 + zstd 编码）
+  save_merge_etf    每日ETF更新：重叠窗口 + 新一天合并进已有分区（skip_unchanged）
+  save_merge_cb     每日可转债快照合并进当月分区
+  read_glob         打开表内全部文件后按日期 / 标的过滤（目录引入之前的读法）
+  read_catalog      catalog.read_table 按目录裁剪分区后读取
+  bond_history      单只转债跨全部快照的时间序列（按排序布局、行组统计跳过无关数据）
+  snapshot_read     内存映射打开 etf_prices 快照并取得 date/symbol/close 数组（对比 read_catalog）
+  panel_pivot       load_panel 生成 日期 × 标的 面板（不使用缓存）
+  indicators        etf-momentum.py 的指标状态全量重算 + 增量推进一天
+  filter_and_sort   double-low.py 的单日筛选（filter_and_sort_data）
+  screen_history    double_low_backtest.screen 对全部快照一次性筛选
+  momentum_backtest MomentumTopN 回测（momentum_backtest.run_momentum_backtest）
+
+用法:
+    python benchmark.py                        默认规模（small）运行全部基准
+    python benchmark.py --scale medium --repeat 5
+    python benchmark.py --only read_glob,read_catalog
+    python benchmark.py --check                出现回退时以非零退出码结束（用于 CI / 定时任务）
+    python benchmark.py history                列出历史记录
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import logging
+import platform
+import tempfile
+import statistics
+import contextlib
+import subprocess
+import importlib.util
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from catalog import read_table, update_catalog
+from schemas import get_schema
+from storage import save_partitioned
+import synthetic
+
+# --- 配置 ---
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+STRATEGY_DIR = os.path.join(SCRIPT_DIR, '..', 'strategy')
+# 基准测试历史文件
+HISTORY_FILE = os.path.join(SCRIPT_DIR, 'data', '_state', 'benchmark_history.json')
+# 各规模的合成数据参数：ETF 标的数 × 年数，可转债数量 × 快照天数 × 快照列数（None 为全部列）
+SCALES = {
+    'small': {'n_symbols': 12, 'years': 3, 'n_bonds': 300, 'cb_days': 60, 'width': None},
+    'medium': {'n_symbols': 50, 'years': 10, 'n_bonds': 500, 'cb_days': 250, 'width': None},
+    'large': {'n_symbols': 200, 'years': 20, 'n_bonds': 600, 'cb_days': 1000, 'width': None},
+}
+DEFAULT_SCALE = 'small'
+DEFAULT_REPEAT = 3
+# 与上一次同规模结果相比，中位耗时超过该倍数视为回退；短于 MIN_SECONDS 的基准不判断（计时噪声）
+REGRESSION_THRESHOLD = 1.3
+MIN_SECONDS = 0.02
+# 读取基准查询的标的数量和日期范围（最近一年）
+READ_SYMBOLS = 3
+# 每日ETF更新重新获取的重叠天数（与 update_etf.OVERLAP_DAYS 一致）
+OVERLAP_DAYS = 7
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+
+def _load_strategy_module(file_name: str, module_name: str):
+    """导入 strategy 目录下的脚本（文件名中可能含 '-'，不能直接 import）"""
+    if STRATEGY_DIR not in sys.path:
+        sys.path.append(STRATEGY_DIR)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(STRATEGY_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Bench:
+    """一个基准：setup 在每次计时前准备输入（不计时），run 为被计时的操作，返回处理的行数"""
+
+    def __init__(self, name: str, run: Callable[[Any], int], setup: Optional[Callable[[], Any]] = None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+
+    def measure(self, repeat: int) -> Dict[str, float]:
+        timings, rows = [], 0
+        for _ in range(repeat):
+            state = self.setup() if self.setup is not None else None
+            started = time.perf_counter()
+            rows = self.run(state)
+            timings.append(time.perf_counter() - started)
+        median = statistics.median(timings)
+        return {
+            'median_s': round(median, 6),
+            'min_s': round(min(timings), 6),
+            'rows': int(rows),
+            'rows_per_s': round(rows / median, 1) if median > 0 else None,
+        }
+
+
+class Workspace:
+    """在临时目录中生成合成数据集，提供各基准共用的输入"""
+
+    def __init__(self, scale: Dict[str, Any], seed: int = 0):
+        self.scale = scale
+        self.seed = seed
+        self.root = tempfile.mkdtemp(prefix='quant-bench-')
+        self.data_dir = os.path.join(self.root, 'data')
+        self.etf = synthetic.etf_prices(scale['n_symbols'], scale['years'], seed=seed)
+        self.cb = synthetic.convertible_bonds(scale['n_bonds'], scale['cb_days'], width=scale['width'], seed=seed)
+        # 最后一个交易日之前的数据作为“已有历史”，最后一天作为每日更新的新数据
+        self.etf_last_day = self.etf['date'].max()
+        self.cb_last_day = self.cb['update_date'].max()
+        self._write(self.data_dir, 'etf_prices', self.etf[self.etf['date'] < self.etf_last_day])
+        self._write(self.data_dir, 'convertible_bonds', self.cb[self.cb['update_date'] < self.cb_last_day])
+        self.symbols = synthetic.etf_symbols(scale['n_symbols'])
+
+    @staticmethod
+    def _write(output_dir: str, table_name: str, df: pd.DataFrame) -> List[str]:
+        schema = get_schema(table_name)
+        written = save_partitioned(df.copy(), output_dir, table_name, schema.date_column, schema.unique_columns,
+                                   schema=schema)
+        update_catalog(output_dir, table_name, written)
+        return written
+
+    def fresh_copy(self, tables: Tuple[str, ...]) -> str:
+        """复制一份已有历史，供会改写分区的基准使用"""
+        target = tempfile.mkdtemp(prefix='run-', dir=self.root)
+        for table_name in tables + ('_catalog',):
+            source = os.path.join(self.data_dir, table_name)
+            if os.path.exists(source):
+                shutil.copytree(source, os.path.join(target, table_name))
+        return target
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def build_benches(ws: Workspace) -> List[Bench]:
+    etf_schema = get_schema('etf_prices')
+    cb_schema = get_schema('convertible_bonds')
+    read_symbols = ws.symbols[:READ_SYMBOLS]
+    read_start = (ws.etf_last_day - pd.Timedelta(days=365)).strftime('%Y-%m-%d')
+    window = ws.etf[ws.etf['date'] >= ws.etf_last_day - pd.Timedelta(days=OVERLAP_DAYS)]
+    cb_day = ws.cb[ws.cb['update_date'] == ws.cb_last_day]
+
+    def save_initial(output_dir):
+        df = ws.etf.copy()
+        save_partitioned(df, output_dir, 'etf_prices', 'date', etf_schema.unique_columns, schema=etf_schema)
+        return len(df)
+
+    def save_merge(table_name, df, schema, skip_unchanged):
+        def run(output_dir):
+            written = save_partitioned(df.copy(), output_dir, table_name, schema.date_column, schema.unique_columns,
+                                       skip_unchanged=skip_unchanged, schema=schema)
+            update_catalog(output_dir, table_name, written)
+            return len(df)
+        return run
+
+    def read_glob(_):
+        files = glob.glob(os.path.join(ws.data_dir, 'etf_prices', '*', '*.parquet'))
+        df = pd.concat([pd.read_parquet(path, columns=['date', 'symbol', 'close']) for path in files], ignore_index=True)
+        df = df[(df['date'] >= pd.Timestamp(read_start)) & df['symbol'].isin(read_symbols)]
+        return len(df)
+
+    def read_catalog(_):
+        return len(read_table(ws.data_dir, 'etf_prices', columns=['close'], start=read_start, keys=read_symbols))
+
+    lookup_bond = ws.cb['bond_id'].iloc[len(ws.cb) // 2]
+
+    def bond_history(_):
+        return len(read_table(ws.data_dir, 'convertible_bonds', columns=['price', 'premium_rt', 'dblow'],
+                              keys=[lookup_bond]))
+
+    def publish_snapshot():
+        from snapshot import publish
+        publish('etf_prices', ws.data_dir)
+
+    def snapshot_read(_):
+        from snapshot import snapshot_arrays
+        return len(snapshot_arrays('etf_prices', ['date', 'symbol', 'close'], ws.data_dir)['close'])
+
+    def panel_pivot(_):
+        from panel import load_panel
+        panels = load_panel('etf_prices', ['open', 'high', 'low', 'close'], symbols=ws.symbols,
+                            output_dir=ws.data_dir, fill=None, use_cache=False, adjust='none')
+        return panels['close'].size
+
+    momentum = _load_strategy_module('etf-momentum.py', 'etf_momentum')
+    history = ws.etf[['date', 'symbol', 'close']].copy()
+    history['date'] = history['date'].dt.strftime('%Y-%m-%d')
+    history = history.sort_values(['symbol', 'date'])
+    before = {symbol: rows.iloc[:-1] for symbol, rows in history.groupby('symbol')}
+    latest = {symbol: rows.iloc[-1] for symbol, rows in history.groupby('symbol')}
+
+    def indicators(_):
+        rows = 0
+        for symbol, rows_before in before.items():
+            rolling = momentum.rebuild(rows_before)
+            rolling.push(latest[symbol]['date'], float(latest[symbol]['close']))
+            rolling.indicators()
+            rows += len(rows_before) + 1
+        return rows
+
+    double_low = _load_strategy_module('double-low.py', 'double_low')
+
+    def filter_and_sort(_):
+        with contextlib.redirect_stdout(io.StringIO()):
+            double_low.filter_and_sort_data(cb_day.copy())
+        return len(cb_day)
+
+    backtest = _load_strategy_module('double_low_backtest.py', 'double_low_backtest')
+
+    def load_snapshots():
+        return backtest.load_snapshots(output_dir=ws.data_dir)
+
+    def screen_history(snapshots):
+        backtest.screen(snapshots)
+        return len(snapshots)
+
+    momentum_bt = _load_strategy_module('momentum_backtest.py', 'momentum_backtest')
+
+    def load_prices():
+        from panel import load_panel
+        return load_panel('etf_prices', ['open', 'high', 'low', 'close'], symbols=ws.symbols,
+                          output_dir=ws.data_dir, fill=None, use_cache=False, adjust='none')
+
+    def momentum_backtest(prices):
+        momentum_bt.run_momentum_backtest(prices, lookback_period=20, topn=4, rebalance_days=5)
+        return prices['close'].size
+
+    return [
+        Bench('save_initial', save_initial, setup=lambda: tempfile.mkdtemp(prefix='run-', dir=ws.root)),
+        Bench('save_merge_etf', save_merge('etf_prices', window, etf_schema, True),
+              setup=lambda: ws.fresh_copy(('etf_prices',))),
+        Bench('save_merge_cb', save_merge('convertible_bonds', cb_day, cb_schema, False),
+              setup=lambda: ws.fresh_copy(('convertible_bonds',))),
+        Bench('read_glob', read_glob),
+        Bench('read_catalog', read_catalog),
+        Bench('bond_history', bond_history),
+        Bench('snapshot_read', snapshot_read, setup=publish_snapshot),
+        Bench('panel_pivot', panel_pivot),
+        Bench('indicators', indicators),
+        Bench('filter_and_sort', filter_and_sort),
+        Bench('screen_history', screen_history, setup=load_snapshots),
+        Bench('momentum_backtest', momentum_backtest, setup=load_prices),
+    ]
+
+
+def git_revision() -> Dict[str, Any]:
+    """当前提交和工作区是否有未提交的修改"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=SCRIPT_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {'commit': commit, 'dirty': dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def load_history(path: str = HISTORY_FILE) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取基准测试历史失败: {e}")
+        return []
+
+
+def save_history(history: List[Dict[str, Any]], path: str = HISTORY_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def compare(current: Dict[str, Any], previous: Optional[Dict[str, Any]],
+            threshold: float = REGRESSION_THRESHOLD) -> List[Dict[str, Any]]:
+    """与上一次同规模结果比较，返回每个基准的变化；regression 为 True 表示回退"""
+    rows = []
+    for name, result in current['results'].items():
+        before = (previous or {}).get('results', {}).get(name)
+        ratio = result['median_s'] / before['median_s'] if before and before['median_s'] > 0 else None
+        rows.append({
+            'name': name,
+            'median_s': result['median_s'],
+            'previous_s': before['median_s'] if before else None,
+            'ratio': ratio,
+            'regression': ratio is not None and ratio > threshold and result['median_s'] >= MIN_SECONDS,
+        })
+    return rows
+
+
+def run_benchmarks(scale_name: str = DEFAULT_SCALE, repeat: int = DEFAULT_REPEAT,
+                   only: Optional[List[str]] = None, seed: int = 0) -> Dict[str, Any]:
+    """生成合成数据并运行基准，返回一条历史记录"""
+    scale = SCALES[scale_name]
+    t0 = time.perf_counter()
+    ws = Workspace(scale, seed=seed)
+    logger.info(f"合成数据生成完成（{scale_name}: ETF {len(ws.etf)} 行，可转债 {len(ws.cb)} 行），"
+                f"耗时 {time.perf_counter() - t0:.1f} 秒")
+    results = {}
+    try:
+        for bench in build_benches(ws):
+            if only and bench.name not in only:
+                continue
+            results[bench.name] = bench.measure(repeat)
+            logger.info(f"{bench.name:<18} {results[bench.name]['median_s'] * 1000:10.1f} ms")
+    finally:
+        ws.cleanup()
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        **git_revision(),
+        'scale': scale_name,
+        'params': scale,
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'results': results,
+    }
+
+
+def print_report(record: Dict[str, Any], rows: List[Dict[str, Any]]):
+    print(f"\n基准测试: {record['scale']}  提交 {record['commit']}{' (有未提交修改)' if record['dirty'] else ''}")
+    print(f"{'基准':<18} {'中位耗时(ms)':>12} {'上次(ms)':>10} {'倍数':>6}  {'行/秒':>12}")
+    for row in rows:
+        result = record['results'][row['name']]
+        previous = f"{row['previous_s'] * 1000:10.1f}" if row['previous_s'] is not None else f"{'-':>10}"
+        ratio = f"{row['ratio']:6.2f}" if row['ratio'] is not None else f"{'-':>6}"
+        flag = '  ⚠️ 回退' if row['regression'] else ''
+        throughput = f"{result['rows_per_s']:12,.0f}" if result['rows_per_s'] else f"{'-':>12}"
+        print(f"{row['name']:<18} {row['median_s'] * 1000:12.1f} {previous} {ratio}  {throughput}{flag}")
+
+
+def print_history(history: List[Dict[str, Any]]):
+    names = sorted({name for record in history for name in record['results']})
+    frame = pd.DataFrame(
+        [{'timestamp': record['timestamp'], 'commit': record['commit'], 'scale': record['scale'],
+          **{name: record['results'].get(name, {}).get('median_s') for name in names}} for record in history]
+    )
+    if frame.empty:
+        print("没有基准测试历史。")
+        return
+    pd.set_option('display.width', 200)
+    print(frame.set_index(['timestamp', 'commit', 'scale']).mul(1000).round(1).to_string())
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # 基准中的写入会输出大量分区日志，只保留本模块的日志
+    for name in ('storage', 'catalog', 'panel', 'schemas', 'synthetic'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    args = sys.argv[1:]
+    if args[:1] == ['history']:
+        print_history(load_history())
+        sys.exit(0)
+
+    def option(flag: str, default=None):
+        return args[args.index(flag) + 1] if flag in args else default
+
+    scale_name = option('--scale', DEFAULT_SCALE)
+    if scale_name not in SCALES:
+        print(f"未知的规模: {scale_name}，可选: {list(SCALES)}")
+        sys.exit(2)
+    only = option('--only')
+    record = run_benchmarks(scale_name, int(option('--repeat', DEFAULT_REPEAT)),
+                            only=only.split(',') if only else None)
+
+    history = load_history()
+    previous = next((item for item in reversed(history) if item['scale'] == scale_name), None)
+    rows = compare(record, previous)
+    print_report(record, rows)
+    if '--no-save' not in args:
+        history.append(record)
+        save_history(history)
+        print(f"\n结果已追加到 {HISTORY_FILE}")
+    if '--check' in args and any(row['regression'] for row in rows):
+        sys.exit(1)
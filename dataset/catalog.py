@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分区目录（catalog）
+为每张表维护一个 JSON 目录文件，记录每个 year_month 分区的文件列表、行数、日期范围、
+包含的标的代码集合和结构版本。查询时先按日期范围和标的代码裁剪分区，只打开需要的文件，
+冷查询的耗时不再随历史年份增长。
+用法: python catalog.py [表名 ...]    (重建目录，不传表名时重建所有已注册的表)
+"""
+
+import os
+import sys
+import json
+import fcntl
+import logging
+import tempfile
+import contextlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from schemas import SCHEMAS, file_schema_version, get_schema
+from storage import get_partition_path, list_partition_files, list_partitions
+
+# --- 配置 ---
+# Parquet文件的根目录
+OUTPUT_DIR = 'data'
+# 目录文件所在的子目录（位于 OUTPUT_DIR 下，不会被 **/*.parquet 匹配）
+CATALOG_DIR = '_catalog'
+# 目录文件格式版本
+CATALOG_FORMAT = 1
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+
+def catalog_path(output_dir: str, table_name: str) -> str:
+    """返回表的目录文件路径"""
+    return os.path.join(output_dir, CATALOG_DIR, f"{table_name}.json")
+
+
+def _file_schema_version(path: str) -> Optional[int]:
+    """读取文件元数据中记录的结构版本，旧文件没有记录时返回 None"""
+    metadata = pq.read_schema(path).metadata or {}
+    return file_schema_version(metadata) if b'schema_version' in metadata else None
+
+
+def _file_signature(output_dir: str, files: List[str]) -> List[tuple]:
+    """文件列表的签名（相对路径、大小、修改时间），用于判断分区是否变化"""
+    signature = []
+    for path in files:
+        stat = os.stat(path)
+        signature.append((os.path.relpath(path, output_dir), stat.st_size, stat.st_mtime_ns))
+    return signature
+
+
+def partition_version(files: List[Dict[str, Any]]) -> int:
+    """
+    分区的版本号：由文件签名（最新文件的修改时间加上文件大小之和）得到。
+    文件不变时重建目录后版本号不变，文件变化后版本号随之变化，面板缓存、数仓同步和快照据此判断分区是否变化。
+    """
+    return max(f['mtime_ns'] for f in files) + sum(f['bytes'] for f in files)
+
+
+def describe_partition(output_dir: str, table_name: str, year_month: str) -> Optional[Dict[str, Any]]:
+    """
+    统计一个分区：只读取日期列和标的代码列。
+
+    Returns:
+        分区目录项；分区不存在或没有文件时返回 None。
+    """
+    schema = get_schema(table_name)
+    partition_path = get_partition_path(output_dir, table_name, year_month)
+    files = list_partition_files(partition_path)
+    if not files:
+        return None
+
+    date_column, key_column = schema.date_column, schema.key_column
+    frames, file_entries = [], []
+    for path in files:
+        frame = schema.scan(path, [date_column, key_column]).to_pandas()
+        frames.append(frame)
+        stat = os.stat(path)
+        file_entries.append({
+            'path': os.path.relpath(path, output_dir),
+            'rows': len(frame),
+            'bytes': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'schema_version': _file_schema_version(path),
+        })
+
+    stats_df = pd.concat(frames, ignore_index=True)
+    dates = pd.to_datetime(stats_df[date_column])
+    if len(files) > 1:
+        row_count = len(stats_df.drop_duplicates(subset=[date_column, key_column]))
+    else:
+        row_count = len(stats_df)
+
+    return {
+        'year_month': year_month,
+        'files': file_entries,
+        'row_count': row_count,
+        'min_date': dates.min().strftime('%Y-%m-%d') if row_count else None,
+        'max_date': dates.max().strftime('%Y-%m-%d') if row_count else None,
+        'keys': sorted(stats_df[key_column].dropna().astype(str).unique().tolist()),
+        'schema_versions': sorted({entry['schema_version'] or 0 for entry in file_entries}),
+    }
+
+
+def load_catalog(output_dir: str, table_name: str, rebuild_if_missing: bool = True) -> Dict[str, Any]:
+    """读取表的目录；目录文件不存在时（可选）扫描全部分区重建"""
+    path = catalog_path(output_dir, table_name)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                catalog = json.load(f)
+        except ValueError as e:
+            logger.warning(f"目录文件损坏，重建 {table_name} 的目录: {e}")
+        else:
+            if catalog.get('format') == CATALOG_FORMAT:
+                return catalog
+            logger.warning(f"目录文件格式已变化，重建 {table_name} 的目录。")
+    elif not rebuild_if_missing:
+        return _empty_catalog(table_name)
+    return rebuild_catalog(output_dir, table_name)
+
+
+def _empty_catalog(table_name: str) -> Dict[str, Any]:
+    schema = get_schema(table_name)
+    return {
+        'format': CATALOG_FORMAT,
+        'table': table_name,
+        'schema_version': schema.version,
+        'date_column': schema.date_column,
+        'key_column': schema.key_column,
+        'partitions': {},
+    }
+
+
+def save_catalog(output_dir: str, catalog: Dict[str, Any]):
+    """原子写入目录文件"""
+    path = catalog_path(output_dir, catalog['table'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    catalog['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    # 每个写入方使用各自的临时文件，并发写入时不会互相覆盖未完成的内容
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{catalog['table']}.", suffix='.tmp', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(catalog, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextlib.contextmanager
+def catalog_lock(output_dir: str, table_name: str) -> Iterator[None]:
+    """
+    表目录的进程间排他锁（<表名>.lock 上的 flock）。
+    调度器的各任务在不同子进程中运行，可能同时更新同一张表（如 update_logs）的目录；
+    读取-修改-保存需要在锁内完成，否则后保存者会覆盖先保存者新增的分区。
+    """
+    path = os.path.join(output_dir, CATALOG_DIR, f"{table_name}.lock")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def update_catalog(output_dir: str, table_name: str, year_months: Iterable[str]):
+    """
+    刷新指定分区的目录项，由写入方在分区写入或压缩后调用；在 catalog_lock 内读取、修改和保存目录。
+
+    分区文件有变化时按新的文件签名更新其 version（见 partition_version），读取缓存可以据此判断分区是否变化；
+    没有变化的分区（例如 skip_unchanged 跳过的分区）保持原目录项。
+    """
+    if get_schema(table_name) is None:
+        return
+    year_months = list(year_months)
+    if not year_months:
+        return
+    with catalog_lock(output_dir, table_name):
+        catalog = load_catalog(output_dir, table_name)
+        for year_month in year_months:
+            previous = catalog['partitions'].get(year_month, {})
+            partition_path = get_partition_path(output_dir, table_name, year_month)
+            if previous and _file_signature(output_dir, list_partition_files(partition_path)) == \
+                    [(f['path'], f['bytes'], f['mtime_ns']) for f in previous['files']]:
+                continue
+            entry = describe_partition(output_dir, table_name, year_month)
+            if entry is None:
+                catalog['partitions'].pop(year_month, None)
+                continue
+            entry['version'] = partition_version(entry['files'])
+            catalog['partitions'][year_month] = entry
+        save_catalog(output_dir, catalog)
+    logger.info(f"已更新 {table_name} 目录中的 {len(year_months)} 个分区。")
+
+
+def rebuild_catalog(output_dir: str, table_name: str) -> Dict[str, Any]:
+    """扫描所有分区，重建目录文件"""
+    catalog = _empty_catalog(table_name)
+    for partition_path in list_partitions(output_dir, table_name):
+        year_month = os.path.basename(partition_path).split('=', 1)[1]
+        entry = describe_partition(output_dir, table_name, year_month)
+        if entry is not None:
+            entry['version'] = partition_version(entry['files'])
+            catalog['partitions'][year_month] = entry
+    save_catalog(output_dir, catalog)
+    logger.info(f"✅ 已重建 {table_name} 目录，共 {len(catalog['partitions'])} 个分区。")
+    return catalog
+
+
+def prune_partitions(catalog: Dict[str, Any], start: Optional[str] = None, end: Optional[str] = None,
+                     keys: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    """按日期范围和标的代码裁剪分区，只返回可能包含命中记录的分区（按月份升序）"""
+    start = pd.Timestamp(start).strftime('%Y-%m-%d') if start is not None else None
+    end = pd.Timestamp(end).strftime('%Y-%m-%d') if end is not None else None
+    key_set = set(map(str, keys)) if keys is not None else None
+
+    selected = []
+    for year_month in sorted(catalog['partitions']):
+        entry = catalog['partitions'][year_month]
+        if entry['min_date'] is None:
+            continue
+        if start is not None and entry['max_date'] < start:
+            continue
+        if end is not None and entry['min_date'] > end:
+            continue
+        if key_set is not None and key_set.isdisjoint(entry['keys']):
+            continue
+        selected.append(entry)
+    return selected
+
+
+def find_files(output_dir: str, table_name: str, start: Optional[str] = None, end: Optional[str] = None,
+               keys: Optional[Iterable[str]] = None) -> List[str]:
+    """返回查询需要打开的文件列表，可直接传给 DuckDB 的 read_parquet([...])"""
+    catalog = load_catalog(output_dir, table_name)
+    return [
+        os.path.join(output_dir, file_entry['path'])
+        for entry in prune_partitions(catalog, start, end, keys)
+        for file_entry in entry['files']
+    ]
+
+
+def read_table(output_dir: str, table_name: str, columns: Optional[List[str]] = None,
+               start: Optional[str] = None, end: Optional[str] = None,
+               keys: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    按目录裁剪后读取表数据。
+
+    只打开命中分区的文件，并在读取时按日期范围和标的代码过滤；旧结构版本的文件在读取时映射到当前结构
+    （TableSchema.scan）。分区内有增量文件时按唯一键去重（后写入者优先）。
+    """
+    schema = get_schema(table_name)
+    date_column, key_column = schema.date_column, schema.key_column
+    if columns is not None:
+        columns = list(dict.fromkeys([date_column, key_column] + list(columns)))
+
+    filters = []
+    if start is not None:
+        filters.append((date_column, '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append((date_column, '<=', pd.Timestamp(end)))
+    if keys is not None:
+        filters.append((key_column, 'in', list(map(str, keys))))
+
+    catalog = load_catalog(output_dir, table_name)
+    frames = []
+    for entry in prune_partitions(catalog, start, end, keys):
+        paths = [os.path.join(output_dir, file_entry['path']) for file_entry in entry['files']]
+        part_frames = [schema.scan(path, columns=columns, filters=filters).to_pandas() for path in paths]
+        part_df = pd.concat(part_frames, ignore_index=True) if len(part_frames) > 1 else part_frames[0]
+        if len(part_frames) > 1:
+            part_df = part_df.drop_duplicates(subset=schema.unique_columns, keep='last')
+        frames.append(part_df)
+
+    if not frames:
+        return pd.DataFrame(columns=columns or [])
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    for name in sys.argv[1:] or list(SCHEMAS):
+        rebuild_catalog(OUTPUT_DIR, name)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分区压缩脚本
+将 append 模式写入的增量文件合并回各分区的 data.parquet。
+用法: python compact.py [--all | --rewrite | --upgrade]
+    --all      忽略阈值，压缩所有含增量文件的分区
+    --rewrite  重写所有分区（把旧文件转换为按标的排序、带页索引和布隆过滤器的布局）
+    --upgrade  只重写含旧结构版本文件的分区（读取时已按版本映射，重写只是省去读取时的转换）
+"""
+
+import sys
+import logging
+
+from adjust import ADJUSTED_TABLES, load_legacy
+from catalog import load_catalog, update_catalog
+from schemas import get_schema
+from storage import COMPACT_THRESHOLD, compact_partition, compact_table, get_partition_path
+
+# --- 配置 ---
+# Parquet文件的根目录
+OUTPUT_DIR = 'data'
+# 需要压缩的表及其唯一键
+TABLES = {
+    'convertible_bonds': ['bond_id', 'update_date'],
+    'etf_prices': ['date', 'symbol'],
+    'etf_features': ['date', 'symbol'],
+    'stock_daily': ['date', 'symbol'],
+    'stock_valuation': ['date', 'symbol'],
+    'adj_factors': ['table_name', 'symbol', 'date'],
+    # 运行指标每次运行追加一个增量文件
+    'update_logs': ['run_id', 'seq'],
+}
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+
+def compact_all(threshold: int = COMPACT_THRESHOLD, rewrite: bool = False) -> int:
+    """压缩所有表中增量文件数量达到阈值的分区（rewrite 时重写全部分区），返回被压缩的分区总数"""
+    total = 0
+    for table_name, unique_columns in TABLES.items():
+        logger.info(f"--- 开始压缩表: {table_name} (阈值: {threshold}{', 重写全部分区' if rewrite else ''}) ---")
+        compacted = compact_table(OUTPUT_DIR, table_name, unique_columns, threshold=threshold,
+                                  schema=get_schema(table_name), rewrite=rewrite)
+        # 压缩删除了增量文件，目录中记录的文件列表需要同步
+        update_catalog(OUTPUT_DIR, table_name, compacted)
+        total += len(compacted)
+    return total
+
+
+def upgrade_all() -> int:
+    """把含旧结构版本文件的分区重写为当前结构，返回重写的分区总数"""
+    total = 0
+    for table_name, unique_columns in TABLES.items():
+        schema = get_schema(table_name)
+        if table_name in ADJUSTED_TABLES and load_legacy(OUTPUT_DIR, table_name):
+            # 升级会把读取时补上的 price_adjust='hfq' 写进当前版本的文件，等更新脚本重新获取不复权数据之后再升级
+            logger.info(f"--- {table_name}: 仍有标的是旧版本的后复权价格，重新获取不复权数据之前跳过结构升级 ---")
+            continue
+        catalog = load_catalog(OUTPUT_DIR, table_name)
+        outdated = sorted(
+            year_month for year_month, entry in catalog['partitions'].items()
+            if any(version != schema.version for version in entry['schema_versions'])
+        )
+        logger.info(f"--- {table_name}: {len(outdated)} 个分区含旧结构版本（当前 v{schema.version}）的文件 ---")
+        upgraded = []
+        for year_month in outdated:
+            partition_path = get_partition_path(OUTPUT_DIR, table_name, year_month)
+            try:
+                if compact_partition(partition_path, unique_columns, schema, rewrite=True):
+                    upgraded.append(year_month)
+            except Exception as e:
+                logger.error(f"❌ 重写分区 {partition_path} 时发生错误: {e}")
+        update_catalog(OUTPUT_DIR, table_name, upgraded)
+        total += len(upgraded)
+    return total
+
+
+if __name__ == "__main__":
+    # 日志配置只在直接运行时进行，调度器导入 TABLES 时不创建日志文件
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('data_update.log', mode='a'),
+            logging.StreamHandler()
+        ]
+    )
+    if '--upgrade' in sys.argv[1:]:
+        upgraded = upgrade_all()
+        logger.info(f"结构升级执行完毕，共重写 {upgraded} 个分区。")
+        sys.exit(0)
+    threshold = 1 if '--all' in sys.argv[1:] else COMPACT_THRESHOLD
+    compacted = compact_all(threshold, rewrite='--rewrite' in sys.argv[1:])
+    logger.info(f"压缩任务执行完毕，共压缩 {compacted} 个分区。")
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日频特征库
+把各策略 notebook 中每次从原始价格临时计算的滚动指标（MA200、13/20/60 日动量、回归斜率×R² 得分）
+预先计算好，存为与 etf_prices 相同按 year_month 分区的 etf_features 表。
+
+特征在 FEATURES 中声明，每个特征给出所需的历史窗口（K线数）。每次更新只计算新增日期：
+对每个标的只读取水位线之前 max(window) 根K线的尾部，外加 RECOMPUTE_BARS 根已计算过的K线
+（吸收价格更新时重叠窗口中的事后修正），没有变化的记录不会重写。
+价格按读取时后复权读取；水位线当天的收盘价与上次计算时不一致（价格基准变化）的标的全量重算。
+
+用法:
+    python features.py           增量更新特征
+    python features.py --full    按当前定义全量重算
+
+    from panel import load_panel
+    features = load_panel('etf_features', ['ma_200', 'momentum_20'], symbols=etfs, fill=None)
+"""
+
+import os
+import sys
+import json
+import math
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from adjust import read_adjusted
+from catalog import load_catalog, read_table, update_catalog
+from schemas import get_schema
+from storage import save_partitioned
+from warehouse import refresh_after_write
+
+# --- 配置 ---
+# Parquet文件的根目录
+OUTPUT_DIR = 'data'
+# 价格表和特征表
+SOURCE_TABLE = 'etf_prices'
+TABLE_NAME = 'etf_features'
+# 记录每个标的已计算到的日期和特征定义签名的状态文件
+STATE_FILE = os.path.join(OUTPUT_DIR, '_state', f'{TABLE_NAME}_state.json')
+# 每次重新计算水位线之前的K线数（与 update_etf.OVERLAP_DAYS 的重叠窗口对应）
+RECOMPUTE_BARS = 5
+# 增量读取价格时每根K线按多少自然日估算（覆盖周末和长假）
+CALENDAR_DAYS_PER_BAR = 1.6
+# 计算特征使用的价格：读取时后复权（新的除权除息事件不改变已计算K线的价格），写入定义签名
+PRICE_ADJUST = 'hfq'
+# 判断价格基准是否变化时的相对误差容忍度（与 etf-momentum.py 一致）
+BASIS_TOLERANCE = 1e-9
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FeatureDef:
+    """
+    一个特征的声明。
+
+    Args:
+        name: 列名（需在 schemas.ETF_FEATURES_SCHEMA 中声明）。
+        window: 计算一个值所需的K线数（含当日）。
+        func: 收盘价序列 -> 等长的特征序列，前 window-1 个值为 NaN。
+        description: 说明。
+        version: 计算方式变化时递增，已有特征会被全量重算。
+    """
+    name: str
+    window: int
+    func: Callable[[np.ndarray], np.ndarray]
+    description: str = ''
+    version: int = 1
+
+
+def _rolling_mean(close: np.ndarray, window: int) -> np.ndarray:
+    result = np.full(len(close), np.nan)
+    if len(close) >= window:
+        result[window - 1:] = sliding_window_view(close, window).mean(axis=1)
+    return result
+
+
+def _diff(close: np.ndarray, lag: int) -> np.ndarray:
+    result = np.full(len(close), np.nan)
+    result[lag:] = close[lag:] - close[:-lag]
+    return result
+
+
+def _pct_change(close: np.ndarray, lag: int) -> np.ndarray:
+    result = np.full(len(close), np.nan)
+    result[lag:] = (close[lag:] / close[:-lag] - 1) * 100
+    return result
+
+
+def _regression_score(close: np.ndarray, window: int) -> np.ndarray:
+    """y = close / 窗口首根收盘价 对 x = 1..window 做 OLS，得分 = 斜率 × R²（与 etf-mom.ipynb 的 MomentumTopN 一致）"""
+    result = np.full(len(close), np.nan)
+    if len(close) < window:
+        return result
+    windows = sliding_window_view(close, window)
+    y = windows / windows[:, :1]
+    x_centered = np.arange(1, window + 1, dtype='float64') - (window + 1) / 2
+    sxx = (x_centered ** 2).sum()
+    y_centered = y - y.mean(axis=1, keepdims=True)
+    sxy = (y_centered * x_centered).sum(axis=1)
+    syy = (y_centered ** 2).sum(axis=1)
+    r2 = np.where(syy > 0, sxy ** 2 / (sxx * np.where(syy > 0, syy, 1.0)), 1.0)
+    result[window - 1:] = sxy / sxx * r2
+    return result
+
+
+FEATURES = [
+    FeatureDef('ma_200', 200, lambda close: _rolling_mean(close, 200), '200日均线'),
+    FeatureDef('momentum_13', 14, lambda close: _diff(close, 13), '13日动量（收盘价差）'),
+    FeatureDef('momentum_20', 21, lambda close: _diff(close, 20), '20日动量（收盘价差）'),
+    FeatureDef('momentum_60', 61, lambda close: _pct_change(close, 60), '60日涨跌幅（%），同 signal.csv'),
+    FeatureDef('score_20', 20, lambda close: _regression_score(close, 20), '20日回归斜率×R²'),
+]
+
+_declared = [name for name in get_schema(TABLE_NAME).fields if name not in ('date', 'symbol')]
+if [feature.name for feature in FEATURES] != _declared:
+    raise RuntimeError(f"FEATURES 与 {TABLE_NAME} 的表结构不一致: {_declared}")
+
+# 所有特征共同需要的历史K线数
+MAX_WINDOW = max(feature.window for feature in FEATURES)
+
+
+def definition_signature() -> str:
+    """特征定义签名：特征增减、窗口、计算方式版本或价格的复权方式变化时改变"""
+    schema = get_schema(TABLE_NAME)
+    return json.dumps([schema.version, PRICE_ADJUST] + [[f.name, f.window, f.version] for f in FEATURES])
+
+
+def compute_features(close: np.ndarray) -> Dict[str, np.ndarray]:
+    """对一个标的按日期排序的收盘价计算全部特征"""
+    close = np.asarray(close, dtype='float64')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return {feature.name: feature.func(close) for feature in FEATURES}
+
+
+def _load_state() -> Dict:
+    if not os.path.exists(STATE_FILE):
+        return {}
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"读取特征状态文件失败，将从特征表中重新扫描: {e}")
+        return {}
+
+
+def _save_state(watermarks: Dict[str, pd.Timestamp], anchors: Dict[str, float]):
+    """anchors 记录各标的水位线当天计算时使用的收盘价，下次据此判断价格基准是否变化"""
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'signature': definition_signature(),
+            'watermarks': {symbol: ts.strftime('%Y-%m-%d') for symbol, ts in sorted(watermarks.items())},
+            'anchors': {symbol: anchors[symbol] for symbol in sorted(anchors) if symbol in watermarks},
+        }, f, indent=2)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def _scan_watermarks(output_dir: str, symbols: List[str]) -> Dict[str, pd.Timestamp]:
+    """从特征表最新的分区开始向前查找每个标的的最新日期"""
+    watermarks = {}
+    remaining = set(symbols)
+    catalog = load_catalog(output_dir, TABLE_NAME)
+    for year_month in sorted(catalog['partitions'], reverse=True):
+        if not remaining:
+            break
+        entry = catalog['partitions'][year_month]
+        if not remaining.intersection(entry['keys']):
+            continue
+        df = read_table(output_dir, TABLE_NAME, columns=[], start=entry['min_date'], end=entry['max_date'],
+                        keys=sorted(remaining))
+        for symbol, max_date in df.groupby('symbol')['date'].max().items():
+            watermarks[symbol] = pd.Timestamp(max_date)
+            remaining.discard(symbol)
+    return watermarks
+
+
+def _read_closes(output_dir: str, symbols: List[str], start: Optional[pd.Timestamp] = None) -> Dict[str, pd.DataFrame]:
+    if not symbols:
+        return {}
+    df = read_adjusted(output_dir, SOURCE_TABLE, columns=['close'], start=start, keys=symbols, adjust=PRICE_ADJUST)
+    if df.empty:
+        return {}
+    df = df.dropna(subset=['close']).assign(date=lambda d: pd.to_datetime(d['date']), symbol=lambda d: d['symbol'].astype(str))
+    return {symbol: group.sort_values('date').reset_index(drop=True) for symbol, group in df.groupby('symbol')}
+
+
+def _feature_rows(symbol: str, prices: pd.DataFrame, first: int) -> pd.DataFrame:
+    """计算 prices 中第 first 行及之后的特征；prices 需包含这些行之前至少 MAX_WINDOW-1 根K线（或完整历史）"""
+    offset = max(first - (MAX_WINDOW - 1), 0)
+    tail = prices.iloc[offset:]
+    values = compute_features(tail['close'].to_numpy())
+    rows = pd.DataFrame({'date': tail['date'].to_numpy(), 'symbol': symbol, **values})
+    return rows.iloc[first - offset:]
+
+
+def update_features(output_dir: str = OUTPUT_DIR, symbols: Optional[List[str]] = None,
+                    full: bool = False) -> List[str]:
+    """
+    增量更新特征表。
+
+    Args:
+        symbols: 需要计算的标的，默认为价格表目录中的全部标的。
+        full: 忽略水位线，按当前定义全量重算。
+
+    Returns:
+        List[str]: 写入成功的分区月份。
+    """
+    if symbols is None:
+        catalog = load_catalog(output_dir, SOURCE_TABLE)
+        symbols = sorted({key for entry in catalog['partitions'].values() for key in entry['keys']})
+
+    state = {} if full else _load_state()
+    if state and state.get('signature') != definition_signature():
+        logger.info("特征定义已变化，全量重算。")
+        full = True
+    anchors = {} if full else dict(state.get('anchors', {}))
+    if full:
+        watermarks = {}
+    elif state:
+        watermarks = {symbol: pd.Timestamp(value) for symbol, value in state.get('watermarks', {}).items()}
+    else:
+        watermarks = _scan_watermarks(output_dir, symbols)
+
+    # 有水位线的标的只读取尾部价格；估算的自然日数不足以覆盖窗口时（新上市等），该标的再读取完整历史
+    incremental = [symbol for symbol in symbols if symbol in watermarks]
+    full_symbols = [symbol for symbol in symbols if symbol not in watermarks]
+    lookback = pd.Timedelta(days=int((MAX_WINDOW + RECOMPUTE_BARS) * CALENDAR_DAYS_PER_BAR) + 30)
+    start = min(watermarks[symbol] for symbol in incremental) - lookback if incremental else None
+    prices = _read_closes(output_dir, incremental, start)
+
+    frames = []
+    for symbol in incremental:
+        symbol_prices = prices.get(symbol)
+        if symbol_prices is None:
+            continue
+        dates = symbol_prices['date'].to_numpy()
+        computed = int(np.searchsorted(dates, watermarks[symbol].to_datetime64(), side='right'))
+        # 水位线当天的收盘价与上次计算时不一致（重新获取了不复权数据、数据源修正了历史）时，已有特征的基准已经失效
+        anchor = anchors.get(symbol)
+        if computed == 0 or dates[computed - 1] != watermarks[symbol].to_datetime64() or anchor is None or \
+                not math.isclose(symbol_prices['close'].iat[computed - 1], anchor, rel_tol=BASIS_TOLERANCE):
+            logger.info(f"{symbol} 水位线处的价格与上次计算时不一致，全量重算")
+            full_symbols.append(symbol)
+            continue
+        if computed == len(symbol_prices):
+            continue
+        first = max(computed - RECOMPUTE_BARS, 0)
+        if first < MAX_WINDOW - 1:
+            full_symbols.append(symbol)
+            continue
+        frames.append(_feature_rows(symbol, symbol_prices, first))
+
+    if full_symbols:
+        logger.info(f"全量计算 {len(full_symbols)} 个标的的特征: {full_symbols}")
+    for symbol, symbol_prices in _read_closes(output_dir, full_symbols).items():
+        frames.append(_feature_rows(symbol, symbol_prices, 0))
+        prices[symbol] = symbol_prices
+
+    if not frames:
+        logger.info("没有新的价格数据，特征无需更新。")
+        _save_state(watermarks, anchors)
+        return []
+
+    features = pd.concat(frames, ignore_index=True)
+    schema = get_schema(TABLE_NAME)
+    written = save_partitioned(features, output_dir, TABLE_NAME, 'date', schema.unique_columns,
+                               skip_unchanged=True, schema=schema)
+    update_catalog(output_dir, TABLE_NAME, written)
+    refresh_after_write(output_dir, TABLE_NAME)
+
+    # 只推进所有分区都写入成功的标的的水位线
+    year_month = features['date'].dt.strftime('%Y-%m')
+    failed = set(features.loc[~year_month.isin(written), 'symbol'])
+    for symbol, max_date in features.groupby('symbol')['date'].max().items():
+        if symbol not in failed:
+            watermarks[symbol] = pd.Timestamp(max_date)
+            symbol_prices = prices[symbol]
+            anchors[symbol] = float(symbol_prices.loc[symbol_prices['date'] == max_date, 'close'].iat[-1])
+    _save_state(watermarks, anchors)
+    logger.info(f"✅ 特征更新完成: {features['symbol'].nunique()} 个标的，{len(features)} 行，{len(written)} 个分区。")
+    return written
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    update_features(full='--full' in sys.argv[1:])
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多标的并发数据获取
+为按标的逐个请求的数据源（akshare 的 fund_etf_hist_em / stock_zh_a_hist / stock_value_em 等）
+提供统一的获取执行器：有界线程池、按主机的令牌桶限速、带抖动的指数退避重试，以及按标的隔离的错误处理。
+"""
+
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from run_metrics import current_run
+
+# --- 配置 ---
+# 默认并发线程数
+DEFAULT_MAX_WORKERS = 8
+# 各数据源主机的限速（每秒请求数），未列出的主机使用 DEFAULT_RATE
+HOST_RATE_LIMITS = {
+    'eastmoney': 5.0,
+    'jisilu': 1.0,
+}
+DEFAULT_RATE = 5.0
+# 单个标的的最大重试次数（不含首次请求）
+DEFAULT_MAX_RETRIES = 3
+# 退避基准时间与上限（秒）
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 10.0
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """线程安全的令牌桶：按 rate 每秒补充令牌，最多积累 capacity 个"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate 必须大于 0")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """获取一个令牌，令牌不足时阻塞等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+@dataclass
+class FetchResult:
+    """一次批量获取的结果：成功的结果、失败的异常、每个标的的尝试次数和耗时（秒，含限速等待和重试）"""
+    results: Dict[str, Any] = field(default_factory=dict)
+    errors: Dict[str, Exception] = field(default_factory=dict)
+    attempts: Dict[str, int] = field(default_factory=dict)
+    latency: Dict[str, float] = field(default_factory=dict)
+
+    def ordered(self, symbols: Iterable[str]) -> List[Any]:
+        """按给定标的顺序返回成功的结果"""
+        return [self.results[symbol] for symbol in symbols if symbol in self.results]
+
+
+class FetchExecutor:
+    """
+    多标的并发获取执行器。
+
+    用法:
+        executor = FetchExecutor(max_workers=8)
+        result = executor.fetch_all(SYMBOLS, fetch_one, host='eastmoney')
+
+    fetch_one(symbol) 抛出的异常会被重试；重试耗尽后记录到 result.errors，不影响其他标的。
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE, backoff_max: float = BACKOFF_MAX,
+                 rate_limits: Optional[Dict[str, float]] = None,
+                 retry_on: Callable[[Exception], bool] = lambda e: True,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limits = dict(HOST_RATE_LIMITS if rate_limits is None else rate_limits)
+        self.retry_on = retry_on
+        self._sleep = sleep
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._buckets_lock = threading.Lock()
+
+    def _bucket(self, host: str) -> TokenBucket:
+        """同一主机在执行器内共享一个令牌桶"""
+        with self._buckets_lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate_limits.get(host, DEFAULT_RATE))
+            return self._buckets[host]
+
+    def _backoff(self, attempt: int) -> float:
+        """指数退避 + 全抖动"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _fetch_with_retry(self, symbol: str, fetch_fn: Callable[[str], Any], host: str):
+        bucket = self._bucket(host)
+        attempt = 0
+        started = time.perf_counter()
+        while True:
+            bucket.acquire()
+            try:
+                value = fetch_fn(symbol)
+                return value, attempt + 1, time.perf_counter() - started
+            except Exception as e:
+                if attempt >= self.max_retries or not self.retry_on(e):
+                    e.attempts = attempt + 1
+                    e.latency = time.perf_counter() - started
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"获取 {symbol} 失败（第 {attempt + 1} 次）: {e}，{delay:.2f} 秒后重试")
+                self._sleep(delay)
+                attempt += 1
+
+    def fetch_all(self, symbols: Iterable[str], fetch_fn: Callable[[str], Any],
+                  host: str = 'default') -> FetchResult:
+        """
+        并发获取所有标的的数据。
+
+        Args:
+            symbols: 标的列表。
+            fetch_fn: 单个标的的获取函数，返回 None 表示该标的没有数据。
+            host: 数据源主机名，用于选择限速令牌桶。
+        """
+        symbols = list(dict.fromkeys(symbols))
+        result = FetchResult()
+        if not symbols:
+            return result
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(symbols))) as pool:
+            futures = {pool.submit(self._fetch_with_retry, symbol, fetch_fn, host): symbol for symbol in symbols}
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    value, attempts, latency = future.result()
+                    result.attempts[symbol] = attempts
+                    result.latency[symbol] = latency
+                    if value is not None:
+                        result.results[symbol] = value
+                except Exception as e:
+                    result.attempts[symbol] = getattr(e, 'attempts', 1)
+                    result.latency[symbol] = getattr(e, 'latency', 0.0)
+                    result.errors[symbol] = e
+                    logger.error(f"获取 {symbol} 数据时发生错误: {e}")
+
+        run = current_run()
+        for symbol in symbols:
+            run.record('fetch', 'seconds', result.latency[symbol], unit='s', source=host, symbol=symbol)
+            run.record('fetch', 'attempts', result.attempts[symbol], unit='count', source=host, symbol=symbol)
+            if symbol in result.errors:
+                run.record('fetch', 'errors', 1, unit='count', source=host, symbol=symbol)
+
+        logger.info(f"批量获取完成: 成功 {len(result.results)}，失败 {len(result.errors)}，共 {len(symbols)} 个标的")
+        return result
+
+
+class StubDataSource:
+    """
+    本地模拟数据源，用于在不访问网络的情况下测试和压测获取流程。
+
+    每次调用先等待 latency 秒（带 jitter 抖动），再以 failure_rate 的概率抛出异常，
+    否则返回 payload(symbol)。fail_symbols 中的标的总是失败；每个标的的前 fail_first 次调用总是失败。
+    """
+
+    def __init__(self, payload: Callable[[str], Any], latency: float = 0.05, jitter: float = 0.0,
+                 failure_rate: float = 0.0, fail_symbols: Iterable[str] = (), fail_first: int = 0,
+                 seed: Optional[int] = None):
+        self.payload = payload
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.fail_symbols = set(fail_symbols)
+        self.fail_first = fail_first
+        self.calls: Dict[str, int] = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, symbol: str) -> Any:
+        with self._lock:
+            self.calls[symbol] = self.calls.get(symbol, 0) + 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fail = (symbol in self.fail_symbols or self.calls[symbol] <= self.fail_first
+                    or self._rng.random() < self.failure_rate)
+        time.sleep(delay)
+        if fail:
+            raise ConnectionError(f"模拟数据源请求失败: {symbol}")
+        return self.payload(symbol)
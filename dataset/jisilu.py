@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+集思录数据获取客户端与原始响应归档
+  - 进程内共用一个 requests.Session（连接池 + keep-alive），不再每次请求重新建立连接
+  - 每次成功的响应都以原始字节 gzip 压缩归档，按日期分目录、以内容的 sha256 命名，
+    同一天内容相同的响应只存一份；manifest.jsonl 按时间顺序记录每次获取
+  - 回放：从归档中按日期读取原始响应，离线重建任意历史日期的数据（修改处理逻辑或表结构后重新处理历史，
+    或作为基准测试的本地数据源）
+
+归档目录结构:
+    data/_raw/jisilu/cb_list/
+        manifest.jsonl                              {"date", "fetched_at", "sha256", "bytes"} 每次获取一行
+        date=2025-08-14/<sha256>.json.gz
+
+用法:
+    client = JisiluClient()
+    data = client.fetch_cb_list()                  # 请求 API 并归档
+
+    for day, data in replay_cb_list('2025-08-01', '2025-08-31'):
+        ...                                         # 离线回放
+
+    python jisilu.py                                列出归档的日期和响应数量
+"""
+
+import os
+import sys
+import json
+import gzip
+import hashlib
+import logging
+import threading
+from datetime import date, datetime
+from itertools import groupby
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from run_metrics import current_run
+
+# --- 配置 ---
+# 原始响应归档目录（默认使用本文件旁边的 data 目录）
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', '_raw', 'jisilu')
+CB_LIST_URL = 'https://www.jisilu.cn/webapi/cb/list/'
+CB_LIST_COLUMNS = '1,70,2,3,5,6,11,12,14,15,16,29,30,32,34,44,46,47,50,52,53,54,56,57,58,59,60,62,63,67'
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Referer': 'https://www.jisilu.cn/',
+}
+REQUEST_TIMEOUT = 10
+# 连接池大小
+POOL_SIZE = 4
+# 归档的 gzip 压缩级别
+ARCHIVE_COMPRESSLEVEL = 6
+# 从环境变量读取Cookie
+COOKIE = os.getenv("JISILU_COOKIE", "")
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+ENDPOINT_CB_LIST = 'cb_list'
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """进程内共享的 Session：复用 TCP/TLS 连接"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(HEADERS)
+            _session = session
+        return _session
+
+
+def _day_key(day: Union[str, date, datetime, None]) -> str:
+    if day is None:
+        day = datetime.now()
+    if isinstance(day, str):
+        return datetime.strptime(day.replace('-', '')[:8], '%Y%m%d').strftime('%Y-%m-%d')
+    return day.strftime('%Y-%m-%d')
+
+
+class RawArchive:
+    """按日期分目录、以内容哈希命名的 gzip 原始响应归档"""
+
+    def __init__(self, endpoint: str = ENDPOINT_CB_LIST, root: str = ARCHIVE_DIR):
+        self.endpoint = endpoint
+        self.path = os.path.join(root, endpoint)
+        self.manifest_path = os.path.join(self.path, 'manifest.jsonl')
+        self._lock = threading.Lock()
+
+    def object_path(self, day: str, sha256: str) -> str:
+        return os.path.join(self.path, f'date={day}', f'{sha256}.json.gz')
+
+    def put(self, content: bytes, day: Union[str, date, datetime, None] = None,
+            fetched_at: Optional[datetime] = None) -> str:
+        """归档一个原始响应，返回其 sha256；同一天已有相同内容时只追加 manifest 记录"""
+        day = _day_key(day)
+        fetched_at = fetched_at or datetime.now()
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self.object_path(day, sha256)
+        with self._lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = os.path.join(os.path.dirname(path), f'.{sha256}.tmp')
+                with gzip.open(tmp_path, 'wb', compresslevel=ARCHIVE_COMPRESSLEVEL) as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+            entry = {'date': day, 'fetched_at': fetched_at.isoformat(timespec='seconds'),
+                     'sha256': sha256, 'bytes': len(content)}
+            with open(self.manifest_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+        return sha256
+
+    def get(self, day: Union[str, date, datetime], sha256: str) -> bytes:
+        with gzip.open(self.object_path(_day_key(day), sha256), 'rb') as f:
+            return f.read()
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """
+        按获取时间排列的归档记录。
+        manifest 缺失时（如手工拷贝的归档）按文件修改时间从目录中重建。
+        """
+        if os.path.exists(self.manifest_path):
+            entries = []
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        entries.append(json.loads(line))
+            return entries
+
+        entries = []
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                if not name.startswith('date='):
+                    continue
+                for file_name in os.listdir(os.path.join(self.path, name)):
+                    if file_name.endswith('.json.gz'):
+                        file_path = os.path.join(self.path, name, file_name)
+                        entries.append({'date': name.split('=', 1)[1],
+                                        'fetched_at': datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat(timespec='seconds'),
+                                        'sha256': file_name[:-len('.json.gz')], 'bytes': None})
+        return sorted(entries, key=lambda entry: entry['fetched_at'])
+
+    def dates(self) -> List[str]:
+        return sorted({entry['date'] for entry in self.entries()})
+
+    def replay(self, start: Union[str, date, None] = None, end: Union[str, date, None] = None,
+               latest_only: bool = True) -> Iterator[Tuple[str, bytes]]:
+        """
+        按日期升序回放归档的原始响应。
+
+        Args:
+            start / end: 日期范围（含两端），None 表示不限。
+            latest_only: 每天只返回最后一次获取的响应（与当天写入存储的数据一致）；
+                False 时按获取顺序返回当天的全部响应。
+        """
+        start = _day_key(start) if start is not None else None
+        end = _day_key(end) if end is not None else None
+        by_day: Dict[str, List[str]] = {}
+        for entry in self.entries():
+            day = entry['date']
+            if (start is not None and day < start) or (end is not None and day > end):
+                continue
+            hashes = by_day.setdefault(day, [])
+            # 同一内容可能被获取多次，只保留最后一次出现的位置
+            if entry['sha256'] in hashes:
+                hashes.remove(entry['sha256'])
+            hashes.append(entry['sha256'])
+        for day in sorted(by_day):
+            for sha256 in (by_day[day][-1:] if latest_only else by_day[day]):
+                try:
+                    yield day, self.get(day, sha256)
+                except OSError as e:
+                    logger.warning(f"读取归档 {day}/{sha256} 失败: {e}")
+
+
+def is_valid_cb_list(data: Optional[Dict[str, Any]]) -> bool:
+    """响应是否为有效的可转债列表（Cookie 失效时接口同样返回 JSON，但 code 不为 200）"""
+    return isinstance(data, dict) and data.get('code') == 200 and isinstance(data.get('data'), list) and bool(data['data'])
+
+
+class JisiluClient:
+    """集思录 API 客户端：共享连接池，请求成功后归档原始响应"""
+
+    def __init__(self, cookie: Optional[str] = None, archive: Optional[RawArchive] = None,
+                 session: Optional[requests.Session] = None, timeout: float = REQUEST_TIMEOUT):
+        self.cookie = COOKIE if cookie is None else cookie
+        self.archive = archive if archive is not None else RawArchive(ENDPOINT_CB_LIST)
+        self.session = session if session is not None else get_session()
+        self.timeout = timeout
+
+    def fetch_cb_list(self, day: Union[str, date, datetime, None] = None) -> Dict[str, Any]:
+        """
+        请求可转债列表并归档原始响应，返回解析后的 JSON。
+
+        Args:
+            day: 归档日期（默认今天，与写入存储的 update_date 一致）。
+
+        Raises:
+            requests.exceptions.RequestException: 请求失败。
+            json.JSONDecodeError: 响应不是 JSON（此时不归档）。
+        """
+        headers = {'Columns': CB_LIST_COLUMNS, 'Init': '1', 'Cookie': self.cookie}
+        response = self.session.get(CB_LIST_URL, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+        content = response.content
+        current_run().record('fetch', 'bytes', len(content), unit='bytes', source='jisilu')
+        data = json.loads(content)
+        self.archive.put(content, day)
+        return data
+
+
+def replay_cb_list(start: Union[str, date, None] = None, end: Union[str, date, None] = None,
+                   archive: Optional[RawArchive] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    离线回放可转债列表：每天返回最后一次获取的有效响应（跳过 Cookie 失效等无效响应）。
+
+    Yields:
+        (日期 'YYYY-MM-DD', 解析后的 JSON)
+    """
+    archive = archive if archive is not None else RawArchive(ENDPOINT_CB_LIST)
+    run = current_run()
+    for day, items in groupby(archive.replay(start, end, latest_only=False), key=lambda item: item[0]):
+        latest = None
+        for _, content in items:
+            run.record('fetch', 'bytes', len(content), unit='bytes', source='archive')
+            try:
+                data = json.loads(content)
+            except ValueError as e:
+                logger.warning(f"归档 {day} 中的响应不是有效的 JSON: {e}")
+                continue
+            if is_valid_cb_list(data):
+                latest = data
+        if latest is None:
+            logger.warning(f"归档 {day} 中没有有效的可转债列表响应，跳过。")
+            continue
+        yield day, latest
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    archive = RawArchive(ENDPOINT_CB_LIST)
+    entries = archive.entries()
+    if not entries:
+        print(f"归档为空: {archive.path}")
+        sys.exit(0)
+    counts: Dict[str, int] = {}
+    for entry in entries:
+        counts[entry['date']] = counts.get(entry['date'], 0) + 1
+    for day, count in sorted(counts.items()):
+        print(f"{day}  {count} 次获取")
+    print(f"共 {len(counts)} 天，{len(entries)} 次获取: {archive.path}")
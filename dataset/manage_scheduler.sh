@@ -7,6 +7,8 @@ export TZ='Asia/Shanghai'
 SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 SCHEDULER_LOG="$SCRIPT_DIR/scheduler.log"
 PID_FILE="$SCRIPT_DIR/scheduler.pid"
+# 停止时等待调度器退出的秒数
+STOP_TIMEOUT=30
 
 case "$1" in
     start)
@@ -32,7 +34,16 @@ case "$1" in
         if [ -f "$PID_FILE" ]; then
             PID=$(cat "$PID_FILE")
             if ps -p $PID > /dev/null 2>&1; then
+                # 调度器收到 SIGTERM 后会先终止正在运行的任务子进程再退出
                 kill $PID
+                for _ in $(seq 1 $STOP_TIMEOUT); do
+                    ps -p $PID > /dev/null 2>&1 || break
+                    sleep 1
+                done
+                if ps -p $PID > /dev/null 2>&1; then
+                    echo "调度器未在 ${STOP_TIMEOUT} 秒内退出，强制结束"
+                    kill -9 $PID
+                fi
                 rm -f "$PID_FILE"
                 echo "调度器已停止"
             else
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+面板数据读取
+把分区表读取为 日期 × 标的 的 float64 矩阵（例如收盘价面板），代替各策略 notebook 中
+read_parquet + pivot + astype(float) + ffill 的重复代码。
+结果按 查询参数 + 命中分区的目录版本 缓存到磁盘，分区变化后自动失效。
+
+用法:
+    import sys; sys.path.append('../dataset')
+    from panel import load_panel
+
+    close = load_panel('etf_prices', 'close', symbols=etfs, start='2022-07-01', end='2025-08-13', adjust='hfq')
+    ohlcv = load_panel('etf_prices', ['open', 'high', 'low', 'close', 'volume'], symbols=etfs, adjust='qfq')
+    raw_close = load_panel('etf_prices', 'close', symbols=etfs, adjust='none')   # 存储的不复权价格（见 adjust.py）
+"""
+
+import os
+import io
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from catalog import load_catalog, prune_partitions, read_table
+from schemas import get_schema
+
+# --- 配置 ---
+# Parquet文件的根目录（默认使用本文件旁边的 data 目录，便于从 strategy/ 下的 notebook 调用）
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# 面板缓存目录（位于 OUTPUT_DIR 下）
+CACHE_DIR = os.path.join('_cache', 'panels')
+# 缓存格式版本，缓存文件结构变化时递增
+CACHE_FORMAT = 1
+# 缺失值处理方式: 'ffill' 沿日期前向填充（停牌日沿用上一交易日），'dropna' 删除任一标的缺失的日期，None 不处理
+FILL_METHODS = ('ffill', 'dropna', None)
+# 保存不复权价格的表（adjust.ADJUSTED_TABLES）未指定复权方式时的默认值；
+# 后复权与快照、特征库、数仓的 etf_prices_adj 一致，新的除权除息事件不改变已有价格
+DEFAULT_ADJUST = 'hfq'
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+
+def _cache_key(table: str, fields: List[str], symbols: Optional[List[str]], start: Optional[str],
+               end: Optional[str], fill: Optional[str], partitions: List[Dict], adjust: Optional[str] = None,
+               factor_partitions: Optional[List[Dict]] = None) -> str:
+    """缓存键：查询参数 + 命中分区的月份与目录版本（复权时还包括全部事件分区的版本）"""
+    payload = {
+        'format': CACHE_FORMAT,
+        'table': table,
+        'schema_version': get_schema(table).version,
+        'fields': fields,
+        'symbols': symbols,
+        'start': start,
+        'end': end,
+        'fill': fill,
+        'partitions': [[entry['year_month'], entry['version']] for entry in partitions],
+    }
+    if adjust is not None:
+        payload['adjust'] = adjust
+        payload['factor_partitions'] = [[entry['year_month'], entry['version']] for entry in factor_partitions or []]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _read_cache(path: str) -> Optional[Dict[str, pd.DataFrame]]:
+    try:
+        with np.load(path, allow_pickle=False) as cached:
+            index = cached['index']
+            columns = cached['columns'].tolist()
+            fields = cached['fields'].tolist()
+            index_name, columns_name = cached['axis_names'].tolist()
+            values = cached['values']
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"面板缓存 {path} 无法读取，重新计算: {e}")
+        return None
+    index = pd.DatetimeIndex(index, name=index_name)
+    columns = pd.Index(columns, dtype=object, name=columns_name)
+    return {
+        field: pd.DataFrame(values[i], index=index, columns=columns)
+        for i, field in enumerate(fields)
+    }
+
+
+def _write_cache(path: str, panels: Dict[str, pd.DataFrame]):
+    """原子写入缓存：所有字段共享同一日期索引和标的列，合并为一个三维数组保存"""
+    first = next(iter(panels.values()))
+    values = np.stack([panel.to_numpy(dtype='float64') for panel in panels.values()])
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        values=values,
+        index=first.index.values.astype('datetime64[ns]'),
+        columns=np.array([str(col) for col in first.columns]),
+        fields=np.array(list(panels)),
+        axis_names=np.array([first.index.name, first.columns.name]),
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, path)
+
+
+def _build_panels(output_dir: str, table: str, fields: List[str], symbols: Optional[List[str]],
+                  start: Optional[str], end: Optional[str], fill: Optional[str],
+                  adjust: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+    schema = get_schema(table)
+    date_column, key_column = schema.date_column, schema.key_column
+    if adjust is not None:
+        from adjust import read_adjusted
+        df = read_adjusted(output_dir, table, columns=fields, start=start, end=end, keys=symbols, adjust=adjust)
+    else:
+        df = read_table(output_dir, table, columns=fields, start=start, end=end, keys=symbols)
+
+    index = pd.DatetimeIndex(sorted(pd.to_datetime(df[date_column]).unique()), name=date_column) \
+        if len(df) else pd.DatetimeIndex([], name=date_column)
+    columns = symbols if symbols is not None else sorted(df[key_column].astype(str).unique()) if len(df) else []
+
+    df = df.assign(**{date_column: pd.to_datetime(df[date_column]), key_column: df[key_column].astype(str)})
+    row_pos = index.get_indexer(df[date_column])
+    col_pos = pd.Index(columns).get_indexer(df[key_column])
+
+    panels = {}
+    for field in fields:
+        values = np.full((len(index), len(columns)), np.nan, dtype='float64')
+        values[row_pos, col_pos] = pd.to_numeric(df[field], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        panels[field] = pd.DataFrame(values, index=index, columns=pd.Index(columns, name=key_column))
+
+    if fill == 'ffill':
+        panels = {field: panel.ffill() for field, panel in panels.items()}
+    elif fill == 'dropna':
+        keep = np.logical_and.reduce([panel.notna().all(axis=1).to_numpy() for panel in panels.values()])
+        panels = {field: panel[keep] for field, panel in panels.items()}
+
+    return panels
+
+
+def load_panel(table: str, fields: Union[str, Iterable[str]], symbols: Optional[Iterable[str]] = None,
+               start: Optional[str] = None, end: Optional[str] = None, fill: Optional[str] = 'ffill',
+               output_dir: str = OUTPUT_DIR, use_cache: bool = True,
+               adjust: Optional[str] = None) -> Union[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    """
+    读取 日期 × 标的 的 float64 面板。
+
+    Args:
+        table: 表名，例如 'etf_prices'、'convertible_bonds'。
+        fields: 单个字段名，或字段名列表。
+        symbols: 标的代码列表（列顺序与之一致）；None 表示目录中出现过的所有标的。
+        start / end: 日期范围（含两端），None 表示不限。
+        fill: 缺失值处理方式，见 FILL_METHODS。
+        output_dir: Parquet文件的根目录。
+        use_cache: 是否使用磁盘缓存。
+        adjust: 复权方式 'qfq' / 'hfq' / 'none'（只用于 adjust.ADJUSTED_TABLES 中保存不复权价格的表）；
+            None 时这些表默认按 DEFAULT_ADJUST 复权（存储的不复权价格在除权除息日有跳空），其他表按存储的原值读取。
+            'none' 读取存储的原值，迁移期间其中混有旧版本的后复权行时会记录警告。
+
+    Returns:
+        fields 为字符串时返回一个 DataFrame；为列表时返回 {字段名: DataFrame}。
+        所有面板共享同一日期索引和标的列，每个面板是单一的 float64 数据块，.to_numpy() 不产生拷贝。
+    """
+    if fill not in FILL_METHODS:
+        raise ValueError(f"不支持的缺失值处理方式: {fill}，可选: {FILL_METHODS}")
+    if get_schema(table) is None:
+        raise ValueError(f"未注册的表: {table}")
+
+    single = isinstance(fields, str)
+    field_list = [fields] if single else list(dict.fromkeys(fields))
+    symbol_list = list(dict.fromkeys(str(s) for s in symbols)) if symbols is not None else None
+    start = pd.Timestamp(start).strftime('%Y-%m-%d') if start is not None else None
+    end = pd.Timestamp(end).strftime('%Y-%m-%d') if end is not None else None
+
+    from adjust import ADJUSTED_TABLES, FACTOR_TABLE
+    if adjust is None and table in ADJUSTED_TABLES:
+        adjust = DEFAULT_ADJUST
+
+    factor_partitions = None
+    if adjust is not None:
+        if table not in ADJUSTED_TABLES:
+            raise ValueError(f"表 {table} 不支持读取时复权，可选: {ADJUSTED_TABLES}")
+        # 前复权以最新的累计因子为基准，任何一个事件分区变化都会影响结果
+        factor_partitions = prune_partitions(load_catalog(output_dir, FACTOR_TABLE))
+
+    partitions = prune_partitions(load_catalog(output_dir, table), start, end, symbol_list)
+    key = _cache_key(table, field_list, symbol_list, start, end, fill, partitions, adjust, factor_partitions)
+    cache_path = os.path.join(output_dir, CACHE_DIR, f"{table}-{key}.npz")
+
+    panels = _read_cache(cache_path) if use_cache and os.path.exists(cache_path) else None
+    if panels is None:
+        t0 = time.time()
+        panels = _build_panels(output_dir, table, field_list, symbol_list, start, end, fill, adjust)
+        logger.info(f"已生成 {table} 面板 {field_list}，耗时 {(time.time() - t0) * 1000:.0f} ms")
+        if use_cache:
+            _write_cache(cache_path, panels)
+
+    return panels[field_list[0]] if single else panels
+
+
+def clear_panel_cache(output_dir: str = OUTPUT_DIR, max_age_days: Optional[float] = None) -> int:
+    """
+    清理面板缓存文件。分区变化后旧缓存不会再被命中，可定期清理。
+
+    Args:
+        max_age_days: 只删除超过该天数未修改的缓存；None 表示全部删除。
+
+    Returns:
+        int: 删除的文件数量。
+    """
+    cache_dir = os.path.join(output_dir, CACHE_DIR)
+    if not os.path.isdir(cache_dir):
+        return 0
+    cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+    removed = 0
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if cutoff is None or os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed += 1
+    logger.info(f"已清理 {removed} 个面板缓存文件。")
+    return removed
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+更新运行指标
+每次 update_convertible_bonds / update_etf_data 运行时收集结构化指标，运行结束后写入 update_logs 表：
+  - 各数据源 / 标的的获取耗时、尝试次数、获取行数和字节数
+  - 每个分区的输入行数、新增 / 去重 / 未变化行数，读取和写入的字节数
+  - 合并（读取 + 去重）、变化比较和 zstd 编码写入各自的耗时
+  - 整次运行的耗时、状态和进程峰值内存（RSS）
+
+update_logs 为长表，每行一个指标：(run_id, seq, stage, source, partition, symbol, metric, value, unit)。
+stage='run'、metric='execution_time_ms' 的汇总行同时填写旧表的 table_name / records_count / status /
+error_message / execution_time_ms 列。每次运行以一个增量文件追加到 update_date 所在的分区。
+
+存储层和获取执行器通过 current_run() 记录指标，没有进行中的运行时不做任何事。
+
+用法:
+    with start_run('etf_prices') as run:
+        with run.timer('fetch', source='eastmoney'):
+            ...
+        run.record('fetch', 'rows', len(df), unit='rows', symbol=symbol)
+
+    python run_metrics.py [表名] [--runs N]   查看最近一次运行的汇总、耗时最多的分区/标的和性能回退
+"""
+
+import os
+import sys
+import glob
+import time
+import uuid
+import logging
+import threading
+import contextlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+
+# --- 配置 ---
+# Parquet文件的根目录（默认使用本文件旁边的 data 目录）
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+TABLE_NAME = 'update_logs'
+# 性能回退检查：与之前最近 BASELINE_RUNS 次运行的中位数比较，超过 REGRESSION_THRESHOLD 倍视为回退
+BASELINE_RUNS = 10
+MIN_BASELINE_RUNS = 3
+REGRESSION_THRESHOLD = 1.5
+# 参与回退检查的单位，以及各单位下视为噪声的最小增量
+REGRESSION_FLOORS = {'s': 0.5, 'ms': 500, 'MB': 50, 'bytes': 1 << 20}
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+LABELS = ['stage', 'source', 'partition', 'symbol', 'metric']
+LOG_COLUMNS = ['run_id', 'seq', 'table_name', 'update_date', 'created_at', 'stage', 'source', 'partition', 'symbol',
+               'metric', 'value', 'unit', 'records_count', 'status', 'error_message', 'execution_time_ms']
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+class RunMetrics:
+    """一次更新运行的指标收集器（线程安全，同一组标签的指标累加）"""
+
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self.run_id = uuid.uuid4().hex
+        self.created_at = datetime.now()
+        self.records_count = 0
+        self.status = 'SUCCESS'
+        self.error_message: Optional[str] = None
+        self._values: Dict[tuple, List] = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def record(self, stage: str, metric: str, value: float, unit: str = '', source: Optional[str] = None,
+               partition: Optional[str] = None, symbol: Optional[str] = None):
+        """记录一个指标；同一 (stage, source, partition, symbol, metric) 多次记录时累加"""
+        key = (stage, source, partition, symbol, metric)
+        with self._lock:
+            if key in self._values:
+                self._values[key][0] += value
+            else:
+                self._values[key] = [value, unit]
+
+    @contextlib.contextmanager
+    def timer(self, stage: str, metric: str = 'seconds', **labels):
+        """记录 with 块的耗时（秒）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, metric, time.perf_counter() - started, unit='s', **labels)
+
+    def fail(self, message: str):
+        self.status = 'FAILED'
+        self.error_message = message
+
+    def to_frame(self) -> pd.DataFrame:
+        """结束运行，生成写入 update_logs 的长表"""
+        elapsed_ms = int((time.perf_counter() - self._started) * 1000)
+        peak = _peak_rss_mb()
+        if peak is not None:
+            self.record('run', 'peak_rss_mb', peak, unit='MB')
+        rows = [{
+            'stage': 'run', 'metric': 'execution_time_ms', 'value': float(elapsed_ms), 'unit': 'ms',
+            'records_count': self.records_count, 'status': self.status,
+            'error_message': self.error_message, 'execution_time_ms': elapsed_ms,
+        }]
+        with self._lock:
+            for (stage, source, partition, symbol, metric), (value, unit) in self._values.items():
+                rows.append({'stage': stage, 'source': source, 'partition': partition, 'symbol': symbol,
+                             'metric': metric, 'value': float(value), 'unit': unit})
+        df = pd.DataFrame(rows).reindex(columns=LOG_COLUMNS)
+        df['run_id'] = self.run_id
+        df['seq'] = range(len(df))
+        df['table_name'] = self.table_name
+        df['update_date'] = pd.Timestamp(self.created_at.date())
+        df['created_at'] = pd.Timestamp(self.created_at)
+        return df
+
+
+class _NullRun:
+    """没有进行中的运行时使用，所有记录都被忽略"""
+
+    def record(self, *args, **kwargs):
+        pass
+
+    @contextlib.contextmanager
+    def timer(self, *args, **kwargs):
+        yield
+
+
+_NULL_RUN = _NullRun()
+_active: Optional[RunMetrics] = None
+
+
+def current_run():
+    """返回进行中的运行（没有时返回忽略所有记录的空对象）"""
+    return _active if _active is not None else _NULL_RUN
+
+
+@contextlib.contextmanager
+def start_run(table_name: str, output_dir: str = OUTPUT_DIR) -> Iterator[RunMetrics]:
+    """
+    开始一次运行：with 块内的存储层和获取执行器指标都记到这次运行上，结束时写入 update_logs 并检查性能回退。
+    with 块内抛出的异常会把运行标记为失败并继续向上抛出。
+    """
+    global _active
+    run = RunMetrics(table_name)
+    previous, _active = _active, run
+    try:
+        yield run
+    except BaseException as e:
+        run.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _active = previous
+        try:
+            write_run(run, output_dir)
+            for item in check_regressions(table_name, output_dir=output_dir).itertuples():
+                logger.warning(f"⚠️ 性能回退: {table_name} {item.label} {item.metric} = {item.latest:.2f}{item.unit}，"
+                               f"基准中位数 {item.baseline:.2f}{item.unit}（{item.ratio:.1f} 倍）")
+        except Exception as e:
+            logger.error(f"写入运行指标失败（不影响数据更新）: {e}")
+
+
+def write_run(run: RunMetrics, output_dir: str = OUTPUT_DIR) -> List[str]:
+    """把一次运行的指标作为增量文件追加到 update_logs"""
+    from catalog import update_catalog
+    from schemas import get_schema
+    from storage import save_partitioned
+    from warehouse import refresh_after_write
+
+    df = run.to_frame()
+    schema = get_schema(TABLE_NAME)
+    written = save_partitioned(df, output_dir, TABLE_NAME, schema.date_column, schema.unique_columns,
+                               mode='append', schema=schema)
+    update_catalog(output_dir, TABLE_NAME, written)
+    refresh_after_write(output_dir, TABLE_NAME)
+    logger.info(f"运行指标已写入 {TABLE_NAME}: run_id={run.run_id}，{len(df)} 项，状态 {run.status}")
+    return written
+
+
+def load_logs(output_dir: str = OUTPUT_DIR, table_name: Optional[str] = None,
+              start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+    """
+    读取 update_logs 的全部记录（含旧格式的逐次运行记录，其指标列为空）。
+
+    Args:
+        table_name: 只返回该数据表的运行。
+        start / end: update_date 的范围（含两端）。
+    """
+    files = sorted(glob.glob(os.path.join(output_dir, TABLE_NAME, 'year_month=*', '*.parquet')))
+    if start is not None or end is not None:
+        months = (start[:7] if start else '0000-00', end[:7] if end else '9999-99')
+        files = [f for f in files if months[0] <= os.path.basename(os.path.dirname(f)).split('=', 1)[1] <= months[1]]
+    frames = [pd.read_parquet(path) for path in files]
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=LOG_COLUMNS)
+    df = pd.concat([frame.reindex(columns=LOG_COLUMNS) for frame in frames], ignore_index=True)
+    for col in ('table_name', 'stage', 'source', 'metric', 'unit', 'status'):
+        df[col] = df[col].astype(object)
+    df['update_date'] = pd.to_datetime(df['update_date'])
+    df['created_at'] = pd.to_datetime(df['created_at'])
+    if table_name is not None:
+        df = df[df['table_name'] == table_name]
+    if start is not None:
+        df = df[df['update_date'] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df['update_date'] <= pd.Timestamp(end)]
+    return df.sort_values(['created_at', 'seq']).reset_index(drop=True)
+
+
+def load_runs(output_dir: str = OUTPUT_DIR, table_name: Optional[str] = None, **kwargs) -> pd.DataFrame:
+    """每次运行一行：run_id, table_name, created_at, status, records_count, execution_time_ms, error_message"""
+    df = load_logs(output_dir, table_name, **kwargs)
+    runs = df[((df['stage'] == 'run') & (df['metric'] == 'execution_time_ms')) | df['stage'].isna()]
+    return runs[['run_id', 'table_name', 'update_date', 'created_at', 'status', 'records_count',
+                 'execution_time_ms', 'error_message']].reset_index(drop=True)
+
+
+def load_metrics(output_dir: str = OUTPUT_DIR, table_name: Optional[str] = None, runs: Optional[int] = None,
+                 stage: Optional[str] = None, metric: Optional[str] = None, **kwargs) -> pd.DataFrame:
+    """
+    读取指标长表。
+
+    Args:
+        runs: 只保留每张数据表最近 runs 次运行。
+        stage / metric: 按阶段 / 指标名过滤。
+    """
+    df = load_logs(output_dir, table_name, **kwargs)
+    df = df[df['metric'].notna() & df['run_id'].notna()]
+    if runs is not None:
+        order = df.drop_duplicates('run_id').sort_values('created_at')
+        keep = order.groupby('table_name').tail(runs)['run_id']
+        df = df[df['run_id'].isin(keep)]
+    if stage is not None:
+        df = df[df['stage'] == stage]
+    if metric is not None:
+        df = df[df['metric'] == metric]
+    return df[['run_id', 'table_name', 'created_at'] + LABELS + ['value', 'unit']].reset_index(drop=True)
+
+
+def stage_summary(metrics: pd.DataFrame) -> pd.DataFrame:
+    """
+    每次运行各阶段的总耗时（秒）：行为运行，列为阶段。
+    阶段有不带分区/标的标签的总计时时取总计时，否则把各分区/标的的耗时相加。
+    """
+    timing = metrics[metrics['unit'] == 's'].copy()
+    timing['total'] = timing[['source', 'partition', 'symbol']].isna().all(axis=1)
+    has_total = timing.groupby(['run_id', 'stage'])['total'].transform('any')
+    timing = timing[timing['total'] | ~has_total]
+    return timing.pivot_table(index=['created_at', 'run_id'], columns='stage', values='value', aggfunc='sum')
+
+
+def top_contributors(metrics: pd.DataFrame, by: str = 'partition', metric: str = 'seconds',
+                     limit: int = 10) -> pd.DataFrame:
+    """按分区或标的汇总某个指标（各阶段相加），列出最近一次运行的值和多次运行的均值，按最近值降序"""
+    df = metrics[(metrics['metric'] == metric) & metrics[by].notna()]
+    if df.empty:
+        return pd.DataFrame(columns=['latest', 'mean', 'runs'])
+    per_run = df.groupby(['run_id', 'created_at', by])['value'].sum().reset_index()
+    latest_run = per_run.sort_values('created_at')['run_id'].iloc[-1]
+    summary = per_run.groupby(by)['value'].agg(mean='mean', runs='count')
+    summary['latest'] = per_run[per_run['run_id'] == latest_run].set_index(by)['value']
+    return summary[['latest', 'mean', 'runs']].sort_values('latest', ascending=False).head(limit)
+
+
+def check_regressions(table_name: str, output_dir: str = OUTPUT_DIR, baseline_runs: int = BASELINE_RUNS,
+                      threshold: float = REGRESSION_THRESHOLD) -> pd.DataFrame:
+    """
+    把最近一次运行的耗时 / 内存 / 字节数指标与之前 baseline_runs 次运行的中位数比较。
+
+    Returns:
+        超过 threshold 倍（且增量超过 REGRESSION_FLOORS 中的噪声下限）的指标，
+        列为 label, metric, unit, latest, baseline, ratio。
+    """
+    columns = ['label', 'metric', 'unit', 'latest', 'baseline', 'ratio']
+    metrics = load_metrics(output_dir, table_name, runs=baseline_runs + 1)
+    metrics = metrics[metrics['unit'].isin(list(REGRESSION_FLOORS))].copy()
+    metrics[LABELS] = metrics[LABELS].fillna('')
+    run_order = metrics.drop_duplicates('run_id').sort_values('created_at')['run_id'].tolist()
+    if len(run_order) < MIN_BASELINE_RUNS + 1:
+        return pd.DataFrame(columns=columns)
+
+    keys = LABELS
+    latest = metrics[metrics['run_id'] == run_order[-1]].set_index(keys)
+    history = metrics[metrics['run_id'] != run_order[-1]]
+    baseline = history.groupby(keys)['value'].agg(['median', 'count'])
+    joined = latest.join(baseline, how='inner')
+    joined = joined[joined['count'] >= MIN_BASELINE_RUNS]
+    floor = joined['unit'].map(REGRESSION_FLOORS)
+    flagged = joined[(joined['value'] > joined['median'] * threshold) & (joined['value'] - joined['median'] > floor)]
+
+    rows = []
+    for (stage, source, partition, symbol, metric), item in flagged.iterrows():
+        label = '/'.join(part for part in (stage, source, partition, symbol) if part)
+        rows.append({'label': label, 'metric': metric, 'unit': item['unit'], 'latest': item['value'],
+                     'baseline': item['median'], 'ratio': item['value'] / item['median'] if item['median'] else float('inf')})
+    return pd.DataFrame(rows, columns=columns).sort_values('ratio', ascending=False).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = sys.argv[1:]
+    count = int(args[args.index('--runs') + 1]) if '--runs' in args else BASELINE_RUNS
+    names = [arg for arg in args if not arg.startswith('--') and not arg.isdigit()]
+    pd.set_option('display.width', 200)
+
+    runs = load_runs(OUTPUT_DIR, names[0] if names else None)
+    print("最近的运行:")
+    print(runs.tail(count).to_string(index=False))
+    for table_name in ([names[0]] if names else sorted(runs['table_name'].dropna().unique())):
+        metrics = load_metrics(OUTPUT_DIR, table_name, runs=count)
+        if metrics.empty:
+            continue
+        print(f"\n=== {table_name} ===")
+        print("各阶段耗时（秒）:")
+        print(stage_summary(metrics).tail(count).round(3).to_string())
+        for by in ('partition', 'symbol'):
+            top = top_contributors(metrics, by=by)
+            if not top.empty:
+                print(f"\n耗时最多的{'分区' if by == 'partition' else '标的'}（秒）:")
+                print(top.round(3).to_string())
+        regressions = check_regressions(table_name, OUTPUT_DIR)
+        print("\n性能回退:" if not regressions.empty else "\n未发现性能回退。")
+        if not regressions.empty:
+            print(regressions.round(3).to_string(index=False))
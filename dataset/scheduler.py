@@ -2,90 +2,367 @@
 # -*- coding: utf-8 -*-
 """
 数据更新调度器
-支持定时自动更新数据
+基于 asyncio 的事件驱动调度：
+  - 按最近一个到期时间休眠，不再每分钟轮询
+  - 每个任务在独立的子进程中运行（python scheduler.py run <任务名>），互不阻塞；
+    超时后终止子进程，失败后按指数退避重试
+  - 任务依赖：上游任务当天成功后立即触发下游任务（如ETF价格更新后增量更新特征库）
+  - 资源锁：写同一张表的任务（如分区压缩与数据更新）不会同时运行
+  - 交易日门控：days='trading' 的任务只在交易日触发（trade_calendar 的本地交易日历）
+
+用法:
+    python scheduler.py              启动调度器（manage_scheduler.sh start）
+    python scheduler.py list         列出任务和下一次运行时间
+    python scheduler.py run etf      在当前进程中立即运行一个任务（不检查交易日历）
 """
 
-import schedule
+import os
+import sys
 import time
+import signal
+import asyncio
 import logging
-import os
-from datetime import datetime
-from update import QuantDataManager
-from update_etf import update_etf_data
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('scheduler.log'),
-        logging.StreamHandler()
-    ]
-)
+import contextlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from compact import TABLES as COMPACT_TABLES
+from trade_calendar import calendar_is_stale, is_trading_day, refresh_calendar
+
+# --- 配置 ---
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_PATH = os.path.abspath(__file__)
+LOG_FILE = 'scheduler.log'
+# 单次休眠的上限（秒），防止系统休眠或时钟调整后错过触发时间
+MAX_SLEEP = 3600
+# 超时或停止时，子进程收到 SIGTERM 后等待退出的时间（秒），超过后强制结束
+KILL_GRACE = 10
+# 分区压缩会改写 compact.TABLES 中的各表，需要与这些表的更新任务互斥
+COMPACT_LOCKS = tuple(COMPACT_TABLES)
+# --- 配置结束 ---
+
 logger = logging.getLogger(__name__)
 
 
-def daily_update_job():
+def setup_logging(job_name: Optional[str] = None):
+    """配置日志；任务子进程的日志带上任务名，便于区分并发任务的输出"""
+    prefix = f'[{job_name}] ' if job_name else ''
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - %(levelname)s - {prefix}%(message)s',
+        handlers=[
+            logging.FileHandler(os.path.join(SCRIPT_DIR, LOG_FILE)),
+            logging.StreamHandler()
+        ]
+    )
+
+
+# 任务函数在子进程中运行，返回 True 表示成功；各数据模块在任务中才导入，调度进程本身保持轻量
+
+def daily_update_job() -> bool:
     """每日可转债数据更新任务"""
+    from update import QuantDataManager
+
     logger.info("--- 开始执行每日可转债数据更新任务 ---")
-    try:
-        # QuantDataManager is now just a logical wrapper for the update process
-        data_manager = QuantDataManager()
-        success = data_manager.update_convertible_bonds()
-        
-        if success:
-            logger.info("--- 每日可转债数据更新任务调度成功 ---")
-        else:
-            logger.error("--- 每日可转债数据更新任务执行失败 ---")
-            
-    except Exception as e:
-        logger.error(f"每日可转债更新任务执行期间发生未捕获的异常: {e}")
+    success = QuantDataManager().update_convertible_bonds()
+    if success:
+        logger.info("--- 每日可转债数据更新任务调度成功 ---")
+    else:
+        logger.error("--- 每日可转债数据更新任务执行失败 ---")
+    return success
 
 
-def daily_update_etf_job():
+def daily_update_etf_job() -> bool:
     """每日ETF数据更新任务"""
+    from update_etf import update_etf_data
+
     logger.info("--- 开始执行每日ETF数据更新任务 ---")
-    try:
-        # The update_etf_data function now handles its own logging internally
-        update_etf_data()
+    success = update_etf_data()
+    if success:
         logger.info("--- 每日ETF数据更新任务调度成功 ---")
-        # Note: Success/failure is logged within update_etf_data itself.
-        # This log indicates the scheduler successfully completed the call.
-    except Exception as e:
-        logger.error(f"每日ETF更新任务执行期间发生未捕获的异常: {e}")
+    else:
+        logger.error("--- 每日ETF数据更新任务未获取到任何数据 ---")
+    return success
+
+
+def features_job() -> bool:
+    """特征库增量更新任务：只计算新增日期"""
+    from features import update_features
+
+    logger.info("--- 开始执行特征库增量更新任务 ---")
+    written = update_features()
+    logger.info(f"--- 特征库更新任务完成，写入 {len(written)} 个分区 ---")
+    return True
+
+
+def compact_job(threshold=None) -> bool:
+    """分区压缩任务：把增量文件合并回基础文件"""
+    from compact import compact_all
+
+    logger.info("--- 开始执行分区压缩任务 ---")
+    compacted = compact_all() if threshold is None else compact_all(threshold)
+    logger.info(f"--- 分区压缩任务完成，共压缩 {compacted} 个分区 ---")
+    return True
+
+
+def schema_upgrade_job() -> bool:
+    """把旧结构版本的文件重写为当前结构（读取时已按版本映射，这里只是在空闲时段消除读取时的转换）"""
+    from compact import upgrade_all
+
+    logger.info("--- 开始执行结构升级任务 ---")
+    upgraded = upgrade_all()
+    logger.info(f"--- 结构升级任务完成，共重写 {upgraded} 个分区 ---")
+    return True
+
+
+def calendar_job() -> bool:
+    """交易日历刷新任务（本地日历已是最新时跳过）"""
+    return refresh_calendar()
+
+
+@dataclass
+class Job:
+    """
+    一个调度任务。
+
+    Args:
+        name: 任务名（子进程按任务名查找任务）。
+        func: 任务函数，返回 True 表示成功。
+        at: 每天的触发时间 'HH:MM'（北京时间）；为 None 时只由上游任务触发。
+        days: 'trading' 只在交易日触发，'daily' 每天触发，或星期几的元组（0 为周一）。
+        after: 上游任务，全部在当天成功后触发本任务。
+        locks: 资源锁（表名），持有相同锁的任务不会同时运行。
+        timeout: 单次运行的超时时间（秒）。
+        retries: 失败后的重试次数。
+        retry_delay: 首次重试前的等待时间（秒），之后每次加倍。
+        kwargs: 传给任务函数的参数。
+    """
+    name: str
+    func: Callable[..., bool]
+    at: Optional[str] = None
+    days: Union[str, Tuple[int, ...]] = 'trading'
+    after: Tuple[str, ...] = ()
+    locks: Tuple[str, ...] = ()
+    timeout: float = 1800
+    retries: int = 2
+    retry_delay: float = 300
+    kwargs: Dict = field(default_factory=dict)
 
+    def next_run(self, now: datetime) -> Optional[datetime]:
+        """now 之后的下一次触发时间（交易日在触发时再判断）"""
+        if self.at is None:
+            return None
+        hour, minute = map(int, self.at.split(':'))
+        candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= now:
+            candidate += timedelta(days=1)
+        if isinstance(self.days, tuple):
+            while candidate.weekday() not in self.days:
+                candidate += timedelta(days=1)
+        return candidate
 
-def setup_schedule():
-    """设置定时任务"""
-    # 设置时区为东八区（北京时间）
+
+JOBS = [
+    Job('convertible_bonds', daily_update_job, at='15:30', locks=('convertible_bonds',),
+        timeout=20 * 60, retries=2, retry_delay=300),
+    # ETF 更新同时追加除权除息事件（adj_factors）
+    Job('etf', daily_update_etf_job, at='15:35', locks=('etf_prices', 'adj_factors'),
+        timeout=30 * 60, retries=2, retry_delay=300),
+    Job('features', features_job, after=('etf',), locks=('etf_features',),
+        timeout=20 * 60, retries=1, retry_delay=60),
+    # 每天16:30压缩增量文件达到阈值的分区，每周六压缩全部增量文件
+    Job('compact', compact_job, at='16:30', days='daily', locks=COMPACT_LOCKS, timeout=60 * 60, retries=0),
+    Job('compact_full', compact_job, at='03:00', days=(5,), locks=COMPACT_LOCKS, timeout=2 * 60 * 60, retries=0,
+        kwargs={'threshold': 1}),
+    # 每周日03:00把旧结构版本的文件重写为当前结构
+    Job('schema_upgrade', schema_upgrade_job, at='03:00', days=(6,), locks=COMPACT_LOCKS,
+        timeout=2 * 60 * 60, retries=0),
+    Job('trade_calendar', calendar_job, at='08:30', days='daily', timeout=5 * 60, retries=3, retry_delay=600),
+]
+
+
+class AsyncScheduler:
+    """事件驱动的任务调度器：定时触发、并发运行、超时与重试、任务依赖和资源锁"""
+
+    def __init__(self, jobs):
+        self.jobs = {job.name: job for job in jobs}
+        self.dependents = defaultdict(list)
+        for job in jobs:
+            for upstream in job.after:
+                if upstream not in self.jobs:
+                    raise ValueError(f"任务 {job.name} 依赖的任务 {upstream} 不存在")
+                self.dependents[upstream].append(job)
+        self._check_acyclic()
+        self.locks = defaultdict(asyncio.Lock)
+        self.succeeded: Dict[str, date] = {}
+        self.running: Dict[str, asyncio.Task] = {}
+        self.processes = set()
+        self.stop_event = asyncio.Event()
+
+    def _check_acyclic(self):
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"任务依赖存在环: {name}")
+            visiting.add(name)
+            for upstream in self.jobs[name].after:
+                visit(upstream)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.jobs:
+            visit(name)
+
+    def trigger(self, job: Job, run_date: date, gate: bool = True):
+        """启动一次任务运行（含重试和下游任务）"""
+        if gate and job.days == 'trading' and not is_trading_day(run_date):
+            logger.info(f"{run_date} 不是交易日，跳过任务 {job.name}")
+            return
+        if job.name in self.running:
+            logger.warning(f"任务 {job.name} 的上一次运行尚未结束，本次跳过")
+            return
+        task = asyncio.create_task(self._run_chain(job, run_date))
+        self.running[job.name] = task
+        task.add_done_callback(lambda _: self.running.pop(job.name, None))
+
+    async def _run_chain(self, job: Job, run_date: date):
+        success = await self._run_with_retries(job)
+        if success:
+            self.succeeded[job.name] = run_date
+        for dependent in self.dependents[job.name]:
+            if not success:
+                logger.warning(f"上游任务 {job.name} 失败，跳过任务 {dependent.name}")
+            elif all(self.succeeded.get(upstream) == run_date for upstream in dependent.after):
+                self.trigger(dependent, run_date, gate=False)
+
+    async def _run_with_retries(self, job: Job) -> bool:
+        for attempt in range(job.retries + 1):
+            if attempt:
+                delay = job.retry_delay * 2 ** (attempt - 1)
+                logger.info(f"任务 {job.name} 将在 {delay:.0f} 秒后第 {attempt} 次重试")
+                if await self._wait_stop(delay):
+                    return False
+            async with contextlib.AsyncExitStack() as stack:
+                # 按固定顺序获取多个锁，避免死锁
+                for name in sorted(job.locks):
+                    await stack.enter_async_context(self.locks[name])
+                if self.stop_event.is_set():
+                    return False
+                if await self._run_once(job):
+                    return True
+        logger.error(f"❌ 任务 {job.name} 在 {job.retries + 1} 次尝试后仍然失败")
+        return False
+
+    async def _run_once(self, job: Job) -> bool:
+        logger.info(f"▶ 开始任务 {job.name}")
+        started = time.monotonic()
+        proc = await asyncio.create_subprocess_exec(sys.executable, SCRIPT_PATH, 'run', job.name, cwd=SCRIPT_DIR)
+        self.processes.add(proc)
+        try:
+            code = await asyncio.wait_for(proc.wait(), timeout=job.timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"任务 {job.name} 超过 {job.timeout:.0f} 秒未完成，终止子进程")
+            await self._terminate(proc)
+            return False
+        finally:
+            self.processes.discard(proc)
+        elapsed = time.monotonic() - started
+        if code == 0:
+            logger.info(f"✅ 任务 {job.name} 完成，耗时 {elapsed:.1f} 秒")
+            return True
+        logger.error(f"任务 {job.name} 失败（退出码 {code}），耗时 {elapsed:.1f} 秒")
+        return False
+
+    @staticmethod
+    async def _terminate(proc):
+        if proc.returncode is not None:
+            return
+        proc.terminate()
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=KILL_GRACE)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+
+    async def _wait_stop(self, timeout: float) -> bool:
+        """等待 timeout 秒，期间收到停止信号时立即返回 True"""
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=max(timeout, 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop_event.set)
+
+        now = datetime.now()
+        schedule = {name: job.next_run(now) for name, job in self.jobs.items() if job.at is not None}
+        for name, when in sorted(schedule.items(), key=lambda item: item[1]):
+            logger.info(f"任务 {name} 下一次运行: {when:%Y-%m-%d %H:%M}")
+        # 本地交易日历缺失或过期时先刷新一次
+        if calendar_is_stale() and 'trade_calendar' in self.jobs:
+            self.trigger(self.jobs['trade_calendar'], now.date())
+
+        while not self.stop_event.is_set():
+            when = min(schedule.values())
+            delay = (when - datetime.now()).total_seconds()
+            if delay > 0:
+                if await self._wait_stop(min(delay, MAX_SLEEP)):
+                    break
+                continue
+            now = datetime.now()
+            for name, due in list(schedule.items()):
+                if due <= now:
+                    self.trigger(self.jobs[name], due.date())
+                    schedule[name] = self.jobs[name].next_run(now)
+
+        await self.shutdown()
+
+    async def shutdown(self):
+        logger.info("正在停止调度器...")
+        for proc in list(self.processes):
+            await self._terminate(proc)
+        for task in list(self.running.values()):
+            task.cancel()
+        await asyncio.gather(*self.running.values(), return_exceptions=True)
+
+
+def setup_timezone():
+    """设置时区为东八区（北京时间）"""
     os.environ['TZ'] = 'Asia/Shanghai'
     try:
         time.tzset()
         logger.info(f"✅ 时区设置成功: {time.tzname}")
     except AttributeError:
         logger.info("⚠️  tzset() 不可用，使用环境变量设置时区")
-    
-    # 每个工作日15:50更新数据（北京时间）
-    schedule.every().monday.at("15:30").do(daily_update_job)
-    schedule.every().tuesday.at("15:30").do(daily_update_job)
-    schedule.every().wednesday.at("15:30").do(daily_update_job)
-    schedule.every().thursday.at("15:30").do(daily_update_job)
-    schedule.every().friday.at("15:30").do(daily_update_job)
-
-    # 每个工作日17:35更新ETF数据（北京时间）
-    schedule.every().monday.at("15:35").do(daily_update_etf_job)
-    schedule.every().tuesday.at("15:35").do(daily_update_etf_job)
-    schedule.every().wednesday.at("15:35").do(daily_update_etf_job)
-    schedule.every().thursday.at("15:35").do(daily_update_etf_job)
-    schedule.every().friday.at("15:35").do(daily_update_etf_job)
-    
-    # 显示当前时区信息
-    current_time = datetime.now()
-    logger.info(f"当前时间: {current_time}")
-    logger.info(f"当前时区: {time.tzname}")
-    logger.info("定时任务设置完成")
-    logger.info("工作日 15:30 (北京时间) - 更新可转债数据")
-    logger.info("工作日 15:35 (北京时间) - 更新ETF数据")
+
+
+def run_job(name: str) -> int:
+    """在当前进程中运行一个任务，返回进程退出码"""
+    job = next((job for job in JOBS if job.name == name), None)
+    if job is None:
+        logger.error(f"未知任务: {name}，可用任务: {[job.name for job in JOBS]}")
+        return 2
+    try:
+        return 0 if job.func(**job.kwargs) else 1
+    except Exception as e:
+        logger.exception(f"任务 {name} 执行期间发生未捕获的异常: {e}")
+        return 1
+
+
+def list_jobs():
+    now = datetime.now()
+    for job in JOBS:
+        when = job.next_run(now)
+        trigger = f"{when:%Y-%m-%d %H:%M}" if when else f"在 {', '.join(job.after)} 成功后"
+        print(f"{job.name:<20} {trigger:<20} days={job.days} timeout={job.timeout:.0f}s retries={job.retries}")
 
 
 def run_scheduler():
@@ -95,18 +372,22 @@ def run_scheduler():
     print("=" * 60)
     print("按 Ctrl+C 停止调度器")
     print("=" * 60)
-    
-    setup_schedule()
-    
-    try:
-        while True:
-            schedule.run_pending()
-            time.sleep(60)  # 每分钟检查一次
-            
-    except KeyboardInterrupt:
-        print("\n调度器已停止")
-        logger.info("调度器被用户停止")
+
+    setup_timezone()
+    logger.info(f"当前时间: {datetime.now()}")
+    asyncio.run(AsyncScheduler(JOBS).run())
+    print("\n调度器已停止")
+    logger.info("调度器已停止")
 
 
 if __name__ == "__main__":
-    run_scheduler() 
\ No newline at end of file
+    args = sys.argv[1:]
+    if args[:1] == ['run'] and len(args) == 2:
+        setup_logging(args[1])
+        sys.exit(run_job(args[1]))
+    setup_logging()
+    if args[:1] == ['list']:
+        setup_timezone()
+        list_jobs()
+    else:
+        run_scheduler()
@@ -0,0 +1,650 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+表结构注册表
+为每张表声明列类型，写入前把数据规整为声明的类型（浮点/整数/日期/字典编码/嵌套类型），
+并显式检测数据源的结构漂移（缺失列、未声明的新列、无法转换的值、未知的 icons 标记）。
+
+结构演进不重写数据：每个文件的元数据记录写入时的结构版本，表的 migrations 声明各版本的列重命名
+和新增列的默认值；读取时 TableSchema.scan 按文件版本在扫描阶段应用重命名、类型转换、默认值和
+派生的标记位列，读者看到的总是当前结构。旧文件可以在方便时由 compact.py --upgrade 重写。
+"""
+
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# --- 配置 ---
+# 结构漂移处理策略: 'warn' 记录警告后继续写入; 'strict' 抛出 SchemaDriftError
+DRIFT_POLICY = 'warn'
+# 旧数据把缺失值序列化成了这些字符串，规整时视为缺失
+NULL_TOKENS = ('', 'None', 'none', 'nan', 'NaN', 'null', 'NULL')
+# 由存储层在写入时添加的分区列，不属于数据源结构
+PARTITION_COLUMNS = ('year_month',)
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+# 字典编码的字符串类型，适用于取值很少的列
+DICT_STRING = pa.dictionary(pa.int32(), pa.string())
+
+# 集思录 icons 字段的标记位，icon_flags 列按位记录每只转债带有的标记
+ICON_FLAGS = {
+    'R': 1 << 0,   # 已公告强赎（附最后交易日/赎回价）
+    'O': 1 << 1,
+    'M': 1 << 2,
+    'G': 1 << 3,   # 公告不提前赎回
+    'EX': 1 << 4,
+    'B': 1 << 5,
+    'Q2': 1 << 6,
+}
+
+
+class SchemaDriftError(ValueError):
+    """数据与声明的表结构不一致（仅在 DRIFT_POLICY = 'strict' 时抛出）"""
+
+
+@dataclass
+class SchemaDrift:
+    """一次规整过程中发现的结构漂移"""
+    missing_columns: List[str] = field(default_factory=list)
+    unexpected_columns: List[str] = field(default_factory=list)
+    coerced_values: Dict[str, int] = field(default_factory=dict)
+    unknown_icons: List[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.missing_columns or self.unexpected_columns or self.coerced_values or self.unknown_icons)
+
+    def describe(self) -> str:
+        parts = []
+        if self.missing_columns:
+            parts.append(f"缺失列: {self.missing_columns}")
+        if self.unexpected_columns:
+            parts.append(f"未声明的新列: {self.unexpected_columns}")
+        if self.coerced_values:
+            parts.append(f"无法转换而置空的值: {self.coerced_values}")
+        if self.unknown_icons:
+            parts.append(f"未知的 icons 标记: {self.unknown_icons}")
+        return '; '.join(parts)
+
+
+def _parse_json_like(value: Any) -> Any:
+    """旧数据中的 dict/list 被序列化成了 JSON 字符串，这里还原"""
+    if isinstance(value, str):
+        if value in NULL_TOKENS:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _to_map_items(value: Any) -> Optional[list]:
+    """把 icons 的各种形态（dict / 空list / JSON字符串 / 已是键值对列表）统一成 map 的键值对列表"""
+    value = _parse_json_like(value)
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        return [(str(k), None if v is None else str(v)) for k, v in value.items()]
+    if isinstance(value, (list, tuple)):
+        return [tuple(item) for item in value if isinstance(item, (list, tuple)) and len(item) == 2]
+    return []
+
+
+def _to_string_list(value: Any) -> Optional[list]:
+    value = _parse_json_like(value)
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value]
+    return [str(value)]
+
+
+def file_schema_version(metadata: Optional[Dict[bytes, bytes]]) -> int:
+    """文件元数据中记录的结构版本；没有记录的旧文件视为版本 0"""
+    value = (metadata or {}).get(b'schema_version')
+    return int(value) if value is not None else 0
+
+
+def _may_match(statistics, op: str, value: Any) -> bool:
+    """行组的最小/最大值统计是否可能满足一个过滤条件（无法判断时返回 True）"""
+    if statistics is None or not statistics.has_min_max:
+        return True
+    low, high = statistics.min, statistics.max
+    try:
+        if op in ('=', '=='):
+            return low <= value <= high
+        if op == 'in':
+            return any(low <= item <= high for item in value)
+        if op == '<':
+            return low < value
+        if op == '<=':
+            return low <= value
+        if op == '>':
+            return high > value
+        if op == '>=':
+            return high >= value
+    except TypeError:
+        pass
+    return True
+
+
+def _matching_row_groups(parquet_file: pq.ParquetFile, filters: List[tuple]) -> List[int]:
+    """按行组统计挑出可能命中全部过滤条件的行组"""
+    metadata = parquet_file.metadata
+    if metadata.num_row_groups == 0:
+        return []
+    first = metadata.row_group(0)
+    column_index = {first.column(j).path_in_schema: j for j in range(first.num_columns)}
+    checks = [(column_index[col], op, value) for col, op, value in filters if col in column_index]
+    row_groups = []
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        if all(_may_match(row_group.column(j).statistics, op, value) for j, op, value in checks):
+            row_groups.append(i)
+    return row_groups
+
+
+@dataclass
+class SchemaMigration:
+    """
+    结构从上一版本升级到 version 时的变化，读取旧版本的文件时在扫描阶段应用。
+
+    类型变化不需要声明：扫描时总是把列转换为当前声明的类型。
+
+    Args:
+        version: 升级后的版本号。
+        renames: 旧列名 -> 新列名。
+        defaults: 本版本新增的列在旧文件中的取值。
+    """
+    version: int
+    renames: Dict[str, str] = field(default_factory=dict)
+    defaults: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Projection:
+    """某个结构版本的文件到当前结构的投影"""
+    file_version: int
+    renames: Dict[str, str] = field(default_factory=dict)
+    defaults: Dict[str, Any] = field(default_factory=dict)
+
+    def sources(self, file_columns: Sequence[str]) -> Dict[str, str]:
+        """当前列名 -> 文件中的列名（文件中已有当前列名时忽略旧列）"""
+        sources = {}
+        for col in file_columns:
+            target = self.renames.get(col, col)
+            if target != col and target in file_columns:
+                continue
+            sources[target] = col
+        return sources
+
+
+@dataclass
+class TableSchema:
+    """
+    一张表的声明式结构。
+
+    Args:
+        name: 表名。
+        version: 结构版本号，结构变化时递增。
+        fields: 列名到 Arrow 类型的映射（顺序即写入顺序）。
+        date_column: 用于按 year_month 分区的日期列。
+        key_column: 标的代码列（symbol / bond_id），用于目录统计和按标的查询。
+        flag_columns: 由 map 列派生的标记位列，{派生列名: (源列名, 标记位表)}。
+        unique_key: 唯一键，默认为 (key_column, date_column)。
+        migrations: 各版本的结构变化（按版本升序），读取旧文件时使用。
+    """
+    name: str
+    version: int
+    fields: Dict[str, pa.DataType]
+    date_column: str = 'date'
+    key_column: str = 'symbol'
+    flag_columns: Dict[str, tuple] = field(default_factory=dict)
+    unique_key: Optional[List[str]] = None
+    migrations: List[SchemaMigration] = field(default_factory=list)
+
+    @property
+    def unique_columns(self) -> List[str]:
+        """唯一键：默认为标的代码 + 日期"""
+        return list(self.unique_key) if self.unique_key else [self.key_column, self.date_column]
+
+    def column_type(self, name: str) -> Optional[pa.DataType]:
+        """返回列的声明类型，未声明的列返回 None"""
+        if name in self.fields:
+            return self.fields[name]
+        if name in self.flag_columns:
+            return pa.int32()
+        if name in PARTITION_COLUMNS:
+            return pa.string()
+        return None
+
+    def metadata(self) -> Dict[str, str]:
+        return {'table': self.name, 'schema_version': str(self.version)}
+
+    def to_arrow(self, df: pd.DataFrame) -> pa.Table:
+        """把已规整的 DataFrame 转换为 Arrow 表：声明列使用声明类型，未声明的列由 Arrow 推断"""
+        arrays = [pa.array(df[col], type=self.column_type(col), from_pandas=True) for col in df.columns]
+        table = pa.Table.from_arrays(arrays, names=list(df.columns))
+        return table.replace_schema_metadata(self.metadata())
+
+    def projection(self, file_version: int) -> Projection:
+        """合并 file_version 之后各版本的变化：连续的重命名折叠为 最早的列名 -> 当前列名"""
+        projection = Projection(file_version)
+        for migration in sorted(self.migrations, key=lambda m: m.version):
+            if migration.version <= file_version:
+                continue
+            for old, new in migration.renames.items():
+                for source, target in list(projection.renames.items()):
+                    if target == old:
+                        projection.renames[source] = new
+                if old not in projection.renames.values() and old not in projection.renames:
+                    projection.renames[old] = new
+                if old in projection.defaults:
+                    projection.defaults[new] = projection.defaults.pop(old)
+            projection.defaults.update(migration.defaults)
+        return projection
+
+    def scan(self, path: str, columns: Optional[List[str]] = None, filters: Optional[List[tuple]] = None) -> pa.Table:
+        """
+        按当前结构读取一个文件。
+
+        根据文件记录的结构版本把列重命名为当前列名、转换为声明的类型，补上新增列的默认值，
+        并为写入时还没有标记位列的文件从源列补算标记位列；文件本身不做任何修改。
+
+        Args:
+            columns: 需要的列（当前列名），None 表示文件中的全部列。
+            filters: pyarrow 风格的过滤条件（当前列名），能下推时在读取时跳过无关的行组。
+        """
+        parquet_file = pq.ParquetFile(path)
+        file_schema = parquet_file.schema_arrow
+        projection = self.projection(file_schema_version(file_schema.metadata))
+        sources = projection.sources(file_schema.names)
+        if columns is None:
+            wanted = list(sources) + [col for col in projection.defaults if col not in sources]
+            wanted += [col for col, (source_col, _) in self.flag_columns.items()
+                       if col not in wanted and source_col in sources]
+        else:
+            wanted = list(columns)
+
+        read_columns = [col for col in wanted if col in sources]
+        for col in wanted:
+            if col not in sources and col in self.flag_columns and self.flag_columns[col][0] in sources:
+                read_columns.append(self.flag_columns[col][0])
+        filters = list(filters or [])
+        filter_columns = [f[0] for f in filters]
+        read_columns += [col for col in filter_columns if col in sources]
+        read_columns = list(dict.fromkeys(read_columns))
+
+        pushdown = bool(filters) and all(
+            col in sources and file_schema.field(sources[col]).type == self.column_type(col)
+            for col in filter_columns
+        )
+        file_columns = [sources[col] for col in read_columns]
+        if pushdown:
+            file_filters = [(sources[col], op, value) for col, op, value in filters]
+            table = parquet_file.read_row_groups(_matching_row_groups(parquet_file, file_filters), columns=file_columns)
+            table = table.filter(pq.filters_to_expression(file_filters))
+        else:
+            table = parquet_file.read(columns=file_columns)
+        table = table.rename_columns(read_columns)
+        table = pa.Table.from_arrays([self._cast_column(col, table[col]) for col in read_columns], names=read_columns)
+
+        for col in wanted:
+            if col in table.column_names:
+                continue
+            if col in self.flag_columns and self.flag_columns[col][0] in table.column_names:
+                table = table.append_column(col, self._derive_flag_column(col, table))
+            elif col in projection.defaults or (columns is not None and self.column_type(col) is not None):
+                dtype = self.column_type(col)
+                value = projection.defaults.get(col)
+                table = table.append_column(pa.field(col, dtype) if dtype is not None else col,
+                                            pa.array([value] * table.num_rows, type=dtype))
+        if filters and not pushdown:
+            table = table.filter(pq.filters_to_expression(filters))
+        return table.select([col for col in wanted if col in table.column_names]).replace_schema_metadata(self.metadata())
+
+    def _cast_column(self, col: str, column: pa.ChunkedArray) -> pa.ChunkedArray:
+        """转换为声明的类型；Arrow 无法直接转换的旧数据（如字符串化的缺失值）按 conform 的规则规整"""
+        dtype = self.column_type(col)
+        if dtype is None or column.type == dtype:
+            return column
+        try:
+            return column.cast(dtype)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            series = self._conform_column(column.to_pandas(), col, dtype, SchemaDrift())
+            return pa.chunked_array([pa.array(series, type=dtype, from_pandas=True)])
+
+    def _derive_flag_column(self, flag_col: str, table: pa.Table) -> pa.Array:
+        source_col, flags = self.flag_columns[flag_col]
+        drift = SchemaDrift()
+        values = self._flags_from_map(table[source_col].to_pandas().map(_to_map_items), flags, drift)
+        if drift.unknown_icons:
+            logger.warning(f"表 {self.name} 中有未登记的 {source_col} 标记: {drift.unknown_icons}")
+        return pa.array(values, type=pa.int32())
+
+    def detect_drift(self, df: pd.DataFrame) -> SchemaDrift:
+        """只检查列集合的差异（不转换数据）"""
+        return SchemaDrift(
+            missing_columns=[col for col in self.fields if col not in df.columns],
+            unexpected_columns=[col for col in df.columns if self.column_type(col) is None],
+        )
+
+    def conform(self, df: pd.DataFrame, policy: Optional[str] = None) -> pd.DataFrame:
+        """
+        把 DataFrame 规整为声明的类型。
+
+        缺失的声明列补为空值，未声明的新列保留（嵌套对象序列化为 JSON 字符串），
+        无法转换的值置空；所有漂移按 policy（默认 DRIFT_POLICY）记录警告或抛出 SchemaDriftError。
+        """
+        policy = DRIFT_POLICY if policy is None else policy
+        drift = self.detect_drift(df)
+        df = df.copy()
+
+        for col in drift.missing_columns:
+            df[col] = None
+
+        for col, dtype in self.fields.items():
+            df[col] = self._conform_column(df[col], col, dtype, drift)
+
+        for flag_col, (source_col, flags) in self.flag_columns.items():
+            df[flag_col] = self._flags_from_map(df[source_col], flags, drift)
+
+        for col in drift.unexpected_columns:
+            if df[col].dtype == 'object':
+                df[col] = df[col].apply(
+                    lambda x: json.dumps(x, ensure_ascii=False) if isinstance(x, (dict, list)) else x
+                )
+
+        if drift:
+            message = f"表 {self.name} 结构漂移 (schema v{self.version}): {drift.describe()}"
+            if policy == 'strict':
+                raise SchemaDriftError(message)
+            logger.warning(message)
+
+        partition_columns = [col for col in PARTITION_COLUMNS if col in df.columns]
+        ordered = list(self.fields) + list(self.flag_columns) + partition_columns + drift.unexpected_columns
+        return df[ordered]
+
+    def _conform_column(self, series: pd.Series, col: str, dtype: pa.DataType, drift: SchemaDrift) -> pd.Series:
+        if pa.types.is_map(dtype):
+            return series.map(_to_map_items).astype(object)
+        if pa.types.is_list(dtype):
+            return series.map(_to_string_list).astype(object)
+
+        if series.dtype == 'object' or pd.api.types.is_string_dtype(series):
+            # 字符串列保留空字符串，只还原旧数据中被 astype(str) 写成 'None'/'nan' 的缺失值
+            is_text = pa.types.is_string(dtype) or pa.types.is_dictionary(dtype)
+            tokens = [token for token in NULL_TOKENS if token] if is_text else list(NULL_TOKENS)
+            series = series.where(~series.isin(tokens), None)
+        non_null = series.notna().sum()
+
+        if pa.types.is_floating(dtype):
+            result = pd.to_numeric(series, errors='coerce').astype('float64')
+        elif pa.types.is_integer(dtype):
+            result = pd.to_numeric(series, errors='coerce').round().astype('Int64')
+        elif pa.types.is_date(dtype):
+            result = pd.to_datetime(series, errors='coerce').dt.date.astype(object)
+            result = result.where(result.notna(), None)
+        elif pa.types.is_timestamp(dtype):
+            result = pd.to_datetime(series, errors='coerce')
+        elif pa.types.is_dictionary(dtype):
+            result = series.astype(object).where(series.notna(), None)
+            result = result.map(lambda x: x if x is None else str(x)).astype('category')
+        else:
+            result = series.astype(object).where(series.notna(), None)
+            result = result.map(lambda x: x if x is None else str(x))
+
+        coerced = int(non_null - result.notna().sum())
+        if coerced > 0:
+            drift.coerced_values[col] = coerced
+        return result
+
+    @staticmethod
+    def _flags_from_map(series: pd.Series, flags: Dict[str, int], drift: SchemaDrift) -> pd.Series:
+        unknown = set()
+
+        def to_flags(items):
+            value = 0
+            for key, _ in items or ():
+                bit = flags.get(key)
+                if bit is None:
+                    unknown.add(key)
+                else:
+                    value |= bit
+            return value
+
+        result = series.map(to_flags).astype('int32')
+        drift.unknown_icons.extend(sorted(unknown))
+        return result
+
+
+CONVERTIBLE_BONDS_SCHEMA = TableSchema(
+    name='convertible_bonds',
+    version=2,
+    fields={
+        'bond_id': pa.string(),
+        'bond_nm': pa.string(),
+        'bond_py': pa.string(),
+        'price': pa.float64(),
+        'increase_rt': pa.float64(),
+        'stock_id': pa.string(),
+        'stock_nm': pa.string(),
+        'stock_py': pa.string(),
+        'sprice': pa.float64(),
+        'sincrease_rt': pa.float64(),
+        'pb': pa.float64(),
+        'convert_price': pa.float64(),
+        'convert_value': pa.float64(),
+        'convert_dt': pa.int64(),
+        'premium_rt': pa.float64(),
+        'dblow': pa.float64(),
+        'sw_cd': pa.string(),
+        'market_cd': DICT_STRING,
+        'btype': DICT_STRING,
+        'list_dt': pa.date32(),
+        't_flag': pa.list_(pa.string()),
+        'owned': pa.int64(),
+        'hold': pa.int64(),
+        'bond_value': pa.float64(),
+        'rating_cd': DICT_STRING,
+        'option_value': pa.float64(),
+        'put_convert_price': pa.float64(),
+        'force_redeem_price': pa.float64(),
+        'convert_amt_ratio': pa.float64(),
+        'fund_rt': pa.float64(),
+        'maturity_dt': pa.date32(),
+        'year_left': pa.float64(),
+        'curr_iss_amt': pa.float64(),
+        'volume': pa.float64(),
+        'svolume': pa.float64(),
+        'turnover_rt': pa.float64(),
+        'ytm_rt': pa.float64(),
+        'put_ytm_rt': pa.float64(),
+        'noted': pa.int64(),
+        'last_time': pa.string(),
+        'qstatus': DICT_STRING,
+        'sqflag': DICT_STRING,
+        'pb_flag': DICT_STRING,
+        'adj_cnt': pa.int64(),
+        'adj_scnt': pa.int64(),
+        'convert_price_valid': DICT_STRING,
+        'convert_price_tips': DICT_STRING,
+        'convert_cd_tip': pa.string(),
+        'ref_yield_info': pa.string(),
+        'adjusted': DICT_STRING,
+        'orig_iss_amt': pa.float64(),
+        # price_tips 中包含实时全价和更新时间，几乎每行都不同，不适合字典编码
+        'price_tips': pa.string(),
+        'redeem_dt': pa.date32(),
+        'real_force_redeem_price': pa.float64(),
+        'option_tip': pa.string(),
+        'after_next_put_dt': pa.int64(),
+        'icons': pa.map_(pa.string(), pa.string()),
+        'is_min_price': pa.int64(),
+        'blocked': pa.int64(),
+        'putting': DICT_STRING,
+        'force_redeem_price_tip': DICT_STRING,
+        'notes': pa.string(),
+        'update_date': pa.timestamp('ns'),
+    },
+    date_column='update_date',
+    key_column='bond_id',
+    flag_columns={'icon_flags': ('icons', ICON_FLAGS)},
+)
+
+# 价格列保存不复权价格（price_adjust = 'raw'），复权在读取时按 adj_factors 应用（见 adjust.py）；
+# v2 之前的文件保存的是后复权价格，读取时 price_adjust 补为 'hfq'
+ETF_PRICES_SCHEMA = TableSchema(
+    name='etf_prices',
+    version=2,
+    fields={
+        'date': pa.timestamp('ns'),
+        'open': pa.float64(),
+        'close': pa.float64(),
+        'high': pa.float64(),
+        'low': pa.float64(),
+        'volume': pa.int64(),
+        'turnover': pa.float64(),
+        'amplitude': pa.float64(),
+        'change_pct': pa.float64(),
+        'change_amount': pa.float64(),
+        'turnover_rate': pa.float64(),
+        'symbol': pa.string(),
+        'price_adjust': DICT_STRING,
+    },
+    migrations=[
+        # v1: 早期文件直接使用 akshare 返回的中文列名，读取时重命名（原先由 rename_etf_columns.py 重写全部文件）
+        SchemaMigration(1, renames={
+            '日期': 'date', '开盘': 'open', '收盘': 'close', '最高': 'high', '最低': 'low',
+            '成交量': 'volume', '成交额': 'turnover', '振幅': 'amplitude',
+            '涨跌幅': 'change_pct', '涨跌额': 'change_amount', '换手率': 'turnover_rate',
+        }),
+        # v2: 改为保存不复权价格
+        SchemaMigration(2, defaults={'price_adjust': 'hfq'}),
+    ],
+)
+
+# 由 etf_prices 派生的日频特征（定义见 features.py 的 FEATURES，列需与之一致）
+ETF_FEATURES_SCHEMA = TableSchema(
+    name='etf_features',
+    version=1,
+    fields={
+        'date': pa.timestamp('ns'),
+        'symbol': pa.string(),
+        'ma_200': pa.float64(),
+        'momentum_13': pa.float64(),
+        'momentum_20': pa.float64(),
+        'momentum_60': pa.float64(),
+        'score_20': pa.float64(),
+    },
+)
+
+# A股日线（akshare stock_zh_a_hist，由 backfill.py 分块回填），与 etf_prices 一样保存不复权价格
+STOCK_DAILY_SCHEMA = TableSchema(
+    name='stock_daily',
+    version=2,
+    fields={
+        'date': pa.timestamp('ns'),
+        'open': pa.float64(),
+        'close': pa.float64(),
+        'high': pa.float64(),
+        'low': pa.float64(),
+        'volume': pa.int64(),
+        'turnover': pa.float64(),
+        'amplitude': pa.float64(),
+        'change_pct': pa.float64(),
+        'change_amount': pa.float64(),
+        'turnover_rate': pa.float64(),
+        'symbol': pa.string(),
+        'price_adjust': DICT_STRING,
+    },
+    migrations=[
+        # v2: 改为保存不复权价格
+        SchemaMigration(2, defaults={'price_adjust': 'hfq'}),
+    ],
+)
+
+# A股每日估值（akshare stock_value_em，由 backfill.py 回填）
+STOCK_VALUATION_SCHEMA = TableSchema(
+    name='stock_valuation',
+    version=1,
+    fields={
+        'date': pa.timestamp('ns'),
+        'symbol': pa.string(),
+        'close': pa.float64(),
+        'change_pct': pa.float64(),
+        'total_market_cap': pa.float64(),
+        'float_market_cap': pa.float64(),
+        'total_shares': pa.float64(),
+        'float_shares': pa.float64(),
+        'pe_ttm': pa.float64(),
+        'pe_static': pa.float64(),
+        'pb': pa.float64(),
+        'peg': pa.float64(),
+        'pcfr': pa.float64(),
+        'psr': pa.float64(),
+    },
+)
+
+# 除权除息事件：ratio 为前一交易日收盘价 / 除权参考价，按日期累乘即为后复权因子（见 adjust.py）
+ADJ_FACTORS_SCHEMA = TableSchema(
+    name='adj_factors',
+    version=1,
+    fields={
+        'date': pa.timestamp('ns'),
+        'symbol': pa.string(),
+        'table_name': pa.string(),
+        'ratio': pa.float64(),
+        'prev_close': pa.float64(),
+        'ref_price': pa.float64(),
+    },
+    unique_key=['table_name', 'symbol', 'date'],
+)
+
+# 更新运行的结构化指标（长表，见 run_metrics.py）；旧格式的逐次运行记录只有 id ~ created_at 几列
+UPDATE_LOGS_SCHEMA = TableSchema(
+    name='update_logs',
+    version=2,
+    fields={
+        'run_id': pa.string(),
+        'seq': pa.int32(),
+        'table_name': DICT_STRING,
+        'update_date': pa.timestamp('ns'),
+        'created_at': pa.timestamp('ns'),
+        'stage': DICT_STRING,
+        'source': DICT_STRING,
+        'partition': pa.string(),
+        'symbol': pa.string(),
+        'metric': DICT_STRING,
+        'value': pa.float64(),
+        'unit': DICT_STRING,
+        'records_count': pa.int64(),
+        'status': DICT_STRING,
+        'error_message': pa.string(),
+        'execution_time_ms': pa.int64(),
+    },
+    date_column='update_date',
+    key_column='run_id',
+    unique_key=['run_id', 'seq'],
+)
+
+SCHEMAS = {schema.name: schema for schema in (CONVERTIBLE_BONDS_SCHEMA, ETF_PRICES_SCHEMA, ETF_FEATURES_SCHEMA,
+                                              STOCK_DAILY_SCHEMA, STOCK_VALUATION_SCHEMA, ADJ_FACTORS_SCHEMA,
+                                              UPDATE_LOGS_SCHEMA)}
+
+
+def get_schema(table_name: str) -> Optional[TableSchema]:
+    """返回表的声明结构，未注册的表返回 None"""
+    return SCHEMAS.get(table_name)
+
+
+def icon_mask(*keys: str) -> int:
+    """返回若干 icons 标记对应的位掩码，例如 icon_mask('R', 'O')"""
+    return sum(ICON_FLAGS[key] for key in keys)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+热表的内存映射 Arrow 快照
+每次更新后把常用的数据（最近几年的 etf_prices、最新一天的 convertible_bonds 快照）发布为一个
+未压缩的 Arrow IPC 文件。读取端用 memory-map 打开，数值列直接得到零拷贝的 NumPy 视图：
+多个 notebook / 优化器进程 / 筛选脚本同时读取时共用同一份页缓存，不再各自解压 zstd Parquet。
+
+  - 每张表一个文件 data/_snapshot/<表名>.arrow，单个 record batch，列在文件中连续存放
+  - 浮点列的缺失值写为 NaN（没有 validity bitmap，才能零拷贝转换为 NumPy）
+  - etf_prices 的开高低收按读取时后复权（hfq）发布：后复权价格不随新的除权除息事件改变，
+    零拷贝的 close 可以直接用于策略（见 adjust.py）
+  - 文件元数据记录快照的日期范围和来源分区（复权时还有 adj_factors 分区）的目录版本，
+    读取时据此判断快照是否落后于分区数据
+  - 发布时先写临时文件再原子替换，已经映射旧文件的进程不受影响，重新打开后读到新快照
+
+用法:
+    from snapshot import open_snapshot, snapshot_arrays
+    table = open_snapshot('etf_prices')                        # pyarrow.Table（内存映射）
+    arrays = snapshot_arrays('etf_prices', ['date', 'symbol', 'close'])
+    close = arrays['close']                                    # 只读的 float64 视图，不拷贝
+
+    python snapshot.py [表名 ...]     发布快照（不传表名时发布全部热表）
+    python snapshot.py status         查看快照的范围和是否最新
+"""
+
+import os
+import sys
+import json
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from catalog import load_catalog, prune_partitions, read_table
+from run_metrics import current_run
+from schemas import get_schema
+
+# --- 配置 ---
+# Parquet文件的根目录（默认使用本文件旁边的 data 目录，便于从 strategy/ 下的 notebook 调用）
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# 快照目录（位于 OUTPUT_DIR 下）
+SNAPSHOT_DIR = '_snapshot'
+# 快照格式版本，文件结构变化时递增
+SNAPSHOT_FORMAT = 4
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class HotTable:
+    """
+    一张热表的快照范围。
+
+    Args:
+        name: 表名（需在 schemas 中注册）。
+        years: 只保留最近 years 年的数据，None 表示全部历史。
+        latest_only: 只保留最新一天的数据（如可转债的每日全市场快照）。
+        columns: 快照包含的列，None 表示全部列。
+        adjust: 价格的复权方式（见 adjust.read_adjusted），None 表示按存储的原值发布。
+    """
+    name: str
+    years: Optional[float] = None
+    latest_only: bool = False
+    columns: Optional[List[str]] = None
+    adjust: Optional[str] = None
+
+
+HOT_TABLES = {table.name: table for table in (
+    HotTable('etf_prices', years=5, adjust='hfq'),
+    HotTable('convertible_bonds', latest_only=True),
+)}
+
+
+def snapshot_path(table_name: str, output_dir: str = OUTPUT_DIR) -> str:
+    return os.path.join(output_dir, SNAPSHOT_DIR, f"{table_name}.arrow")
+
+
+def _source_partitions(hot: HotTable, catalog: Dict[str, Any]) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """快照的起始日期和来源分区（用于读取数据和判断快照是否最新）"""
+    partitions = prune_partitions(catalog)
+    if not partitions:
+        return None, []
+    last_date = max(entry['max_date'] for entry in partitions)
+    if hot.latest_only:
+        start = last_date
+    elif hot.years is not None:
+        start = (pd.Timestamp(last_date) - pd.DateOffset(days=int(round(hot.years * 365)))).strftime('%Y-%m-%d')
+    else:
+        start = None
+    return start, prune_partitions(catalog, start=start)
+
+
+def _signature(hot: HotTable, partitions: List[Dict[str, Any]], output_dir: str) -> List[List[Any]]:
+    signature = [[entry['year_month'], entry['version']] for entry in partitions]
+    if hot.adjust is not None:
+        from adjust import FACTOR_TABLE
+        signature += [[FACTOR_TABLE, entry['year_month'], entry['version']]
+                      for entry in prune_partitions(load_catalog(output_dir, FACTOR_TABLE))]
+    return signature
+
+
+def _to_snapshot_table(df: pd.DataFrame, table_name: str) -> pa.Table:
+    """
+    按 (标的代码, 日期) 排序，浮点缺失值写为 NaN，date32 列转换为 timestamp（NumPy 没有对应 date32 的类型，
+    只有 datetime64 能零拷贝），合并为单个连续的 chunk
+    """
+    schema = get_schema(table_name)
+    table = schema.to_arrow(df)
+    table = table.sort_by([(schema.key_column, 'ascending'), (schema.date_column, 'ascending')])
+    columns = []
+    for column in table.columns:
+        if pa.types.is_floating(column.type) and column.null_count:
+            column = pc.fill_null(column, np.nan)
+        elif pa.types.is_date32(column.type):
+            column = column.cast(pa.timestamp('s'))
+        columns.append(column)
+    return pa.Table.from_arrays(columns, names=table.column_names).combine_chunks()
+
+
+def publish(table_name: str, output_dir: str = OUTPUT_DIR) -> Optional[str]:
+    """
+    按 HOT_TABLES 中的范围发布一张表的快照。
+
+    Returns:
+        快照文件路径；表没有数据时返回 None。
+    """
+    hot = HOT_TABLES[table_name]
+    catalog = load_catalog(output_dir, table_name)
+    start, partitions = _source_partitions(hot, catalog)
+    if not partitions:
+        logger.warning(f"表 {table_name} 没有数据，跳过快照发布。")
+        return None
+
+    run = current_run()
+    with run.timer('snapshot', source=table_name):
+        if hot.adjust is not None:
+            from adjust import read_adjusted
+            df = read_adjusted(output_dir, table_name, columns=hot.columns, start=start, adjust=hot.adjust)
+        else:
+            df = read_table(output_dir, table_name, columns=hot.columns, start=start)
+        # 筛选依赖标记位列（如双低的 R/O 位掩码），旧文件的标记位列由读取时补算，快照中必须存在
+        missing = [col for col, (source_col, _) in get_schema(table_name).flag_columns.items()
+                   if source_col in df.columns and col not in df.columns]
+        if missing:
+            raise ValueError(f"表 {table_name} 的快照缺少标记位列: {missing}")
+        table = _to_snapshot_table(df, table_name)
+        metadata = dict(table.schema.metadata or {})
+        metadata.update({
+            'snapshot_format': str(SNAPSHOT_FORMAT),
+            'adjust': hot.adjust or '',
+            'start': start or '',
+            'end': max(entry['max_date'] for entry in partitions),
+            'published_at': datetime.now().isoformat(timespec='seconds'),
+            'partitions': json.dumps(_signature(hot, partitions, output_dir)),
+        })
+        table = table.replace_schema_metadata(metadata)
+
+        path = snapshot_path(table_name, output_dir)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        run.record('snapshot', 'bytes_written', os.path.getsize(tmp_path), unit='bytes', source=table_name)
+        os.replace(tmp_path, path)
+    logger.info(f"✅ 已发布 {table_name} 快照: {table.num_rows} 行，{metadata['start'] or '全部'} ~ {metadata['end']}")
+    return path
+
+
+def publish_after_write(output_dir: str, table_name: str):
+    """
+    由更新脚本在写入后调用：重新发布热表的快照，其他表不做任何事。
+    发布失败只记录错误，不影响已经完成的 Parquet 写入。
+    """
+    if table_name not in HOT_TABLES:
+        return
+    try:
+        publish(table_name, output_dir)
+    except Exception as e:
+        logger.error(f"❌ 发布 {table_name} 快照失败（Parquet 数据已写入，可稍后执行 snapshot.py）: {e}")
+
+
+def open_snapshot(table_name: str, output_dir: str = OUTPUT_DIR, check: bool = True) -> pa.Table:
+    """
+    以内存映射方式打开快照，返回的 Arrow 表直接引用映射的文件，不读取也不解压数据。
+
+    Args:
+        check: 快照落后于分区数据（之后有新的写入但没有重新发布）时记录警告。
+
+    Raises:
+        FileNotFoundError: 快照尚未发布。
+    """
+    path = snapshot_path(table_name, output_dir)
+    source = pa.memory_map(path, 'r')
+    table = pa.ipc.open_file(source).read_all()
+    if check and not _is_current(table, table_name, output_dir):
+        logger.warning(f"{table_name} 快照落后于分区数据，可执行 python snapshot.py {table_name} 重新发布")
+    return table
+
+
+def _is_current(table: pa.Table, table_name: str, output_dir: str) -> bool:
+    metadata = table.schema.metadata or {}
+    if int(metadata.get(b'snapshot_format', 0)) != SNAPSHOT_FORMAT:
+        return False
+    hot = HOT_TABLES[table_name]
+    _, partitions = _source_partitions(hot, load_catalog(output_dir, table_name))
+    return json.loads(metadata.get(b'partitions', b'[]')) == _signature(hot, partitions, output_dir)
+
+
+def snapshot_arrays(table_name: str, columns: Optional[List[str]] = None,
+                    output_dir: str = OUTPUT_DIR) -> Dict[str, np.ndarray]:
+    """
+    把快照的列转换为 NumPy 数组。
+
+    没有缺失值的整数、浮点和时间戳列是映射文件上的只读零拷贝视图；字符串列、字典编码列、布尔列和含缺失值的列
+    需要转换，返回的数组会拷贝。
+    """
+    table = open_snapshot(table_name, output_dir)
+    arrays = {}
+    for name in columns or table.column_names:
+        column = table[name]
+        chunk = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+        if pa.types.is_dictionary(chunk.type):
+            chunk = chunk.dictionary_decode()
+        zero_copy = chunk.null_count == 0 and (pa.types.is_integer(chunk.type) or pa.types.is_floating(chunk.type)
+                                               or pa.types.is_timestamp(chunk.type))
+        arrays[name] = chunk.to_numpy(zero_copy_only=zero_copy)
+    return arrays
+
+
+def load_snapshot(table_name: str, columns: Optional[List[str]] = None,
+                  output_dir: str = OUTPUT_DIR) -> pd.DataFrame:
+    """快照转换为 DataFrame（split_blocks 使没有缺失值的数值列尽量不拷贝）"""
+    table = open_snapshot(table_name, output_dir)
+    if columns is not None:
+        table = table.select(columns)
+    return table.to_pandas(split_blocks=True)
+
+
+def print_status(output_dir: str = OUTPUT_DIR):
+    for table_name in HOT_TABLES:
+        path = snapshot_path(table_name, output_dir)
+        if not os.path.exists(path):
+            print(f"{table_name:<20} 未发布")
+            continue
+        table = open_snapshot(table_name, output_dir, check=False)
+        metadata = table.schema.metadata or {}
+        state = '最新' if _is_current(table, table_name, output_dir) else '已过期'
+        print(f"{table_name:<20} {table.num_rows:>10} 行  {os.path.getsize(path) / 1e6:>8.1f} MB  "
+              f"{metadata.get(b'start', b'').decode() or '全部'} ~ {metadata.get(b'end', b'').decode()}  "
+              f"发布于 {metadata.get(b'published_at', b'').decode()}  {state}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = sys.argv[1:]
+    if args[:1] == ['status']:
+        print_status()
+        sys.exit(0)
+    unknown = [name for name in args if name not in HOT_TABLES]
+    if unknown:
+        print(f"未配置快照的表: {unknown}，可选: {list(HOT_TABLES)}")
+        sys.exit(1)
+    for name in args or list(HOT_TABLES):
+        publish(name)
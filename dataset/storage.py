@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分区Parquet存储层
+负责 year_month 分区的读写：支持整分区合并重写（merge）和追加增量文件（append）两种写入模式，
+读取时按唯一键去重（后写入者优先），并提供把增量文件合并回基础文件的压缩（compaction）操作。
+"""
+
+import os
+import time
+import uuid
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from run_metrics import current_run
+from schemas import TableSchema
+
+# --- 配置 ---
+# 每个分区的基础数据文件名
+BASE_FILE_NAME = 'data.parquet'
+# 增量文件名前缀，文件名中包含写入时间戳，按文件名排序即为写入顺序
+DELTA_PREFIX = 'delta-'
+# 分区内增量文件数量达到该阈值时执行压缩
+COMPACT_THRESHOLD = 10
+# 支持的写入模式
+WRITE_MODES = ('merge', 'append')
+# 文件布局：行按唯一键（标的代码, 日期）排序，单个标的的记录集中在少数几个数据页内，
+# 配合列统计、页索引和标的代码列的布隆过滤器，按标的查询时可以跳过绝大部分行组和数据页
+ROW_GROUP_SIZE = 2048
+MAX_ROWS_PER_PAGE = 1024
+BLOOM_FILTER_FPP = 0.01
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+
+def get_partition_path(output_dir: str, table_name: str, year_month: str) -> str:
+    """返回指定月份分区的目录路径"""
+    return os.path.join(output_dir, table_name, f"year_month={year_month}")
+
+
+def _partition_label(partition_path: str) -> str:
+    """分区目录 -> 'YYYY-MM'，用作运行指标的分区标签"""
+    return os.path.basename(os.path.normpath(partition_path)).split('=', 1)[-1]
+
+
+def list_partitions(output_dir: str, table_name: str) -> List[str]:
+    """列出表下所有分区目录（按月份升序）"""
+    table_path = os.path.join(output_dir, table_name)
+    if not os.path.isdir(table_path):
+        return []
+    return sorted(
+        os.path.join(table_path, name)
+        for name in os.listdir(table_path)
+        if name.startswith('year_month=') and os.path.isdir(os.path.join(table_path, name))
+    )
+
+
+def list_delta_files(partition_path: str) -> List[str]:
+    """列出分区内的增量文件，按写入顺序排列"""
+    if not os.path.isdir(partition_path):
+        return []
+    return sorted(
+        os.path.join(partition_path, name)
+        for name in os.listdir(partition_path)
+        if name.startswith(DELTA_PREFIX) and name.endswith('.parquet')
+    )
+
+
+def list_partition_files(partition_path: str) -> List[str]:
+    """列出分区内需要读取的全部文件：基础文件在前，增量文件按写入顺序在后"""
+    files = []
+    base_path = os.path.join(partition_path, BASE_FILE_NAME)
+    if os.path.exists(base_path):
+        files.append(base_path)
+    files.extend(list_delta_files(partition_path))
+    return files
+
+
+def _sort_columns(schema: TableSchema, column_names: List[str]) -> List[str]:
+    """文件内的排序列：标的代码在前的唯一键（如 ['symbol', 'date']），缺少任一键列时不排序"""
+    unique_columns = schema.unique_columns
+    if schema.key_column in unique_columns:
+        unique_columns = [schema.key_column] + [col for col in unique_columns if col != schema.key_column]
+    if not all(col in column_names for col in unique_columns):
+        return []
+    return unique_columns
+
+
+def _sorted_for_layout(table: pa.Table, schema: TableSchema) -> pa.Table:
+    sort_columns = _sort_columns(schema, table.column_names)
+    if not sort_columns:
+        return table
+    return table.sort_by([(col, 'ascending') for col in sort_columns])
+
+
+def _layout_options(table: pa.Table, schema: Optional[TableSchema]) -> Dict:
+    """写入参数：行组大小、列统计、页索引，以及排序列元数据和标的代码列的布隆过滤器"""
+    options = dict(compression='zstd', row_group_size=ROW_GROUP_SIZE, max_rows_per_page=MAX_ROWS_PER_PAGE,
+                   write_statistics=True, write_page_index=True)
+    if schema is None or schema.key_column not in table.column_names:
+        return options
+    sort_columns = _sort_columns(schema, table.column_names)
+    if sort_columns:
+        options['sorting_columns'] = [pq.SortingColumn(table.column_names.index(col)) for col in sort_columns]
+    if pa.types.is_string(table.schema.field(schema.key_column).type):
+        ndv = max(len(pc.unique(table[schema.key_column])), 1)
+        options['bloom_filter_options'] = {schema.key_column: {'ndv': ndv, 'fpp': BLOOM_FILTER_FPP}}
+    return options
+
+
+def _write_parquet_atomic(df: pd.DataFrame, file_path: str, schema: Optional[TableSchema] = None):
+    """
+    先写临时文件再原子替换，避免读者看到写了一半的文件；给定 schema 时按声明的类型写入，
+    并按唯一键排序、为标的代码列写入布隆过滤器（见 ROW_GROUP_SIZE 处的说明）。
+    """
+    tmp_path = os.path.join(os.path.dirname(file_path), f".{os.path.basename(file_path)}.tmp")
+    partition = _partition_label(os.path.dirname(file_path))
+    run = current_run()
+    with run.timer('encode', partition=partition):
+        if schema is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        else:
+            table = _sorted_for_layout(schema.to_arrow(df), schema)
+        pq.write_table(table, tmp_path, **_layout_options(table, schema))
+    run.record('encode', 'bytes_written', os.path.getsize(tmp_path), unit='bytes', partition=partition)
+    os.replace(tmp_path, file_path)
+
+
+def read_partition(partition_path: str, unique_columns: List[str],
+                   columns: Optional[List[str]] = None,
+                   schema: Optional[TableSchema] = None) -> pd.DataFrame:
+    """
+    读取一个分区（基础文件 + 增量文件），并按唯一键去重，后写入的记录优先。
+
+    Args:
+        partition_path: 分区目录。
+        unique_columns: 唯一键列。
+        columns: 只读取的列，None 表示读取全部列。
+        schema: 表结构；按文件的结构版本在读取时重命名列、转换类型（见 TableSchema.scan），
+            读取全部列时再把每个文件规整为声明的类型（兼容旧的字符串化数据）。
+    """
+    files = list_partition_files(partition_path)
+    if not files:
+        return pd.DataFrame()
+
+    if columns is not None:
+        columns = list(dict.fromkeys(list(columns) + list(unique_columns)))
+    current_run().record('read', 'bytes_read', sum(os.path.getsize(path) for path in files), unit='bytes',
+                         partition=_partition_label(partition_path))
+    if schema is not None:
+        frames = [schema.scan(path, columns).to_pandas() for path in files]
+    else:
+        frames = [pd.read_parquet(path, columns=columns) for path in files]
+    if schema is not None and columns is None:
+        frames = [schema.conform(frame) for frame in frames]
+    if len(frames) == 1:
+        return frames[0]
+
+    combined_df = pd.concat(frames, ignore_index=True)
+    return combined_df.drop_duplicates(subset=unique_columns, keep='last').reset_index(drop=True)
+
+
+def write_delta(df: pd.DataFrame, partition_path: str, schema: Optional[TableSchema] = None) -> str:
+    """把新数据作为一个增量文件追加到分区，不读取也不改写已有文件"""
+    os.makedirs(partition_path, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+    file_path = os.path.join(partition_path, f"{DELTA_PREFIX}{timestamp}-{uuid.uuid4().hex[:8]}.parquet")
+    _write_parquet_atomic(df, file_path, schema)
+    return file_path
+
+
+def filter_changed_rows(df: pd.DataFrame, existing_df: pd.DataFrame, unique_columns: List[str]) -> pd.DataFrame:
+    """只保留现有数据中不存在、或值与现有记录不同的行"""
+    if existing_df.empty or df.empty:
+        return df
+
+    common_columns = [col for col in df.columns if col in existing_df.columns]
+    value_columns = [col for col in common_columns if col not in unique_columns]
+    merged = df[unique_columns].merge(
+        existing_df[common_columns].drop_duplicates(subset=unique_columns, keep='last'),
+        on=unique_columns, how='left', indicator=True
+    )
+    changed = (merged['_merge'] == 'left_only').to_numpy().copy()
+    for col in value_columns:
+        new_values = df[col].reset_index(drop=True).astype(object)
+        old_values = merged[col].astype(object)
+        same = (new_values == old_values) | (new_values.isna() & old_values.isna())
+        changed |= ~same.to_numpy(dtype=bool)
+    return df[changed]
+
+
+def merge_partition(df: pd.DataFrame, partition_path: str, unique_columns: List[str],
+                    schema: Optional[TableSchema] = None) -> pd.DataFrame:
+    """把新数据与分区现有数据合并、去重后重写基础文件，返回写入后的完整分区数据"""
+    os.makedirs(partition_path, exist_ok=True)
+    file_path = os.path.join(partition_path, BASE_FILE_NAME)
+    delta_files = list_delta_files(partition_path)
+
+    run = current_run()
+    partition = _partition_label(partition_path)
+    with run.timer('merge', partition=partition):
+        existing_df = read_partition(partition_path, unique_columns, schema=schema)
+        if not existing_df.empty:
+            logger.info(f"发现现有数据: {partition_path}，开始执行合并操作。")
+            combined_df = pd.concat([existing_df, df], ignore_index=True)
+            final_df = combined_df.drop_duplicates(subset=unique_columns, keep='last')
+            logger.info(f"合并完成: 旧记录数={len(existing_df)}, 新记录数={len(df)}, 合并后总数={len(final_df)}")
+        else:
+            logger.info("未发现现有数据，将直接写入新数据。")
+            final_df = df
+    # 新增 = 合并后比原分区多出的行；去重 = 与原分区唯一键相同而覆盖旧记录的行
+    run.record('merge', 'rows_new', len(final_df) - len(existing_df), unit='rows', partition=partition)
+    run.record('merge', 'rows_deduplicated', len(existing_df) + len(df) - len(final_df), unit='rows', partition=partition)
+
+    _write_parquet_atomic(final_df, file_path, schema)
+    # 合并时已经吸收了现有增量文件，写完基础文件后即可删除
+    for delta_path in delta_files:
+        os.remove(delta_path)
+    return final_df
+
+
+class IngestBatch:
+    """
+    列式批量数据累加器。
+
+    逐个标的调用 add() 收集 Arrow 表（不复制已收集的数据），最后调用 finish() 一次性拼接成一张表，
+    避免循环中反复 pd.concat 带来的 O(n²) 复制。
+    """
+
+    def __init__(self, date_column: Optional[str] = None):
+        self.date_column = date_column
+        self._tables: List[pa.Table] = []
+        self.num_rows = 0
+
+    def add(self, df: pd.DataFrame):
+        """加入一批数据（通常是一个标的的结果）"""
+        if df is None or df.empty:
+            return
+        if self.date_column is not None:
+            df[self.date_column] = pd.to_datetime(df[self.date_column])
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        self._tables.append(table)
+        self.num_rows += table.num_rows
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def finish(self) -> pa.Table:
+        """拼接所有批次并清空累加器；各批次列类型不一致时自动提升为兼容类型"""
+        if not self._tables:
+            return pa.table({})
+        table = pa.concat_tables(self._tables, promote_options='permissive')
+        self._tables = []
+        self.num_rows = 0
+        return table
+
+
+def partition_table(table: pa.Table, date_column: str) -> Dict[str, pa.Table]:
+    """
+    用 Arrow compute 按 year_month 切分表。
+
+    计算 year_month 列后按其稳定排序一次，每个月份对应排序后表中的一段连续切片（零拷贝）。
+    """
+    if table.num_rows == 0:
+        return {}
+    if not pa.types.is_timestamp(table.schema.field(date_column).type):
+        table = table.set_column(
+            table.schema.get_field_index(date_column), date_column,
+            pc.cast(table[date_column], pa.timestamp('ns'))
+        )
+    year_month = pc.strftime(table[date_column], format='%Y-%m')
+    if 'year_month' in table.column_names:
+        table = table.drop_columns(['year_month'])
+    table = table.append_column('year_month', year_month)
+    table = table.take(pc.sort_indices(table, sort_keys=[('year_month', 'ascending')]))
+
+    partitions = {}
+    offset = 0
+    # 排序后 value_counts 按首次出现的顺序返回，即月份升序
+    for item in pc.value_counts(table['year_month']).to_pylist():
+        partitions[item['values']] = table.slice(offset, item['counts'])
+        offset += item['counts']
+    return partitions
+
+
+def save_partitioned(data: Union[pd.DataFrame, pa.Table], output_dir: str, table_name: str,
+                     date_column: str, unique_columns: List[str], mode: str = 'merge',
+                     skip_unchanged: bool = False, schema: Optional[TableSchema] = None) -> List[str]:
+    """
+    按 year_month 分区写入数据。
+
+    Args:
+        data: 待写入数据（DataFrame 或 Arrow 表），需包含 date_column 列。
+        output_dir: Parquet文件的根目录。
+        table_name: 表名，用于创建子目录。
+        date_column: 用于分区的日期列。
+        unique_columns: 唯一键列，用于去重。
+        mode: 'merge' 读取并重写整个分区；'append' 只追加增量文件，读取时去重。
+        skip_unchanged: 先与分区现有数据比较，只写入新增或变化的行，没有变化的分区不再改写。
+        schema: 表结构，给定时写入前把数据规整为声明的类型。
+
+    Returns:
+        List[str]: 处理成功的分区月份（包括因没有变化而跳过的分区）。
+    """
+    if mode not in WRITE_MODES:
+        raise ValueError(f"不支持的写入模式: {mode}，可选: {WRITE_MODES}")
+
+    conformed = False
+    if isinstance(data, pd.DataFrame):
+        data[date_column] = pd.to_datetime(data[date_column])
+        if schema is not None:
+            # 原始数据中可能混有 dict/list 等对象，需先规整再转换为 Arrow
+            data = schema.conform(data)
+            data = schema.to_arrow(data)
+            conformed = True
+        else:
+            data = pa.Table.from_pandas(data, preserve_index=False)
+
+    # 用 Arrow compute 按 'year_month' 切分
+    partitions = partition_table(data, date_column)
+    logger.info(f"{table_name} 数据共涉及 {len(partitions)} 个 'year_month' 分区，写入模式: {mode}。")
+
+    run = current_run()
+    succeeded = []
+    # 逐月处理，每次只把一个月的数据转换为 DataFrame
+    for year_month, part_table in partitions.items():
+        partition_path = get_partition_path(output_dir, table_name, year_month)
+        logger.info(f"--- 正在处理分区: {partition_path} ---")
+        started = time.perf_counter()
+
+        try:
+            group_df = part_table.to_pandas()
+            run.record('save', 'rows_in', len(group_df), unit='rows', partition=year_month)
+            if schema is not None and not conformed:
+                group_df = schema.conform(group_df)
+            if skip_unchanged:
+                with run.timer('diff', partition=year_month):
+                    existing_df = read_partition(partition_path, unique_columns, schema=schema)
+                    changed_df = filter_changed_rows(group_df, existing_df, unique_columns)
+                run.record('diff', 'rows_unchanged', len(group_df) - len(changed_df), unit='rows', partition=year_month)
+                if changed_df.empty:
+                    logger.info(f"分区 {partition_path} 没有新增或变化的记录，跳过写入。")
+                    succeeded.append(year_month)
+                    continue
+                logger.info(f"分区 {partition_path} 中新增或变化的记录: {len(changed_df)}/{len(group_df)}")
+                group_df = changed_df
+
+            if mode == 'append':
+                file_path = write_delta(group_df, partition_path, schema)
+                logger.info(f"✅ 成功将 {len(group_df)} 条记录追加到: {file_path}")
+            else:
+                final_df = merge_partition(group_df, partition_path, unique_columns, schema)
+                logger.info(f"✅ 成功将 {len(final_df)} 条记录写入到: {partition_path}")
+            succeeded.append(year_month)
+        except Exception as e:
+            logger.error(f"❌ 处理分区 {partition_path} 时发生错误: {e}")
+            run.record('save', 'errors', 1, unit='count', partition=year_month)
+        finally:
+            run.record('save', 'seconds', time.perf_counter() - started, unit='s', partition=year_month)
+    return succeeded
+
+
+def compact_partition(partition_path: str, unique_columns: List[str],
+                      schema: Optional[TableSchema] = None, rewrite: bool = False) -> bool:
+    """
+    把分区内的增量文件合并进基础文件。
+
+    只删除本次读取到的增量文件，压缩期间新追加的增量文件会保留到下一次压缩。
+
+    Args:
+        rewrite: 没有增量文件时也重写基础文件（把旧文件转换为当前的排序和索引布局）。
+
+    Returns:
+        bool: 是否执行了压缩。
+    """
+    delta_files = list_delta_files(partition_path)
+    base_path = os.path.join(partition_path, BASE_FILE_NAME)
+    if not delta_files and not (rewrite and os.path.exists(base_path)):
+        return False
+
+    files = ([base_path] if os.path.exists(base_path) else []) + delta_files
+    if schema is not None:
+        frames = [schema.conform(schema.scan(path).to_pandas()) for path in files]
+    else:
+        frames = [pd.read_parquet(path) for path in files]
+    combined_df = pd.concat(frames, ignore_index=True)
+    final_df = combined_df.drop_duplicates(subset=unique_columns, keep='last')
+
+    _write_parquet_atomic(final_df, base_path, schema)
+    for delta_path in delta_files:
+        os.remove(delta_path)
+    logger.info(f"✅ 分区压缩完成: {partition_path}，合并 {len(delta_files)} 个增量文件，共 {len(final_df)} 条记录")
+    return True
+
+
+def compact_table(output_dir: str, table_name: str, unique_columns: List[str],
+                  threshold: int = COMPACT_THRESHOLD, schema: Optional[TableSchema] = None,
+                  rewrite: bool = False) -> List[str]:
+    """
+    压缩表内增量文件数量达到阈值的分区。
+
+    Args:
+        threshold: 增量文件数量阈值，传入 1 表示压缩所有含增量文件的分区。
+        rewrite: 忽略阈值，重写表内所有分区。
+
+    Returns:
+        List[str]: 被压缩的分区月份。
+    """
+    compacted = []
+    for partition_path in list_partitions(output_dir, table_name):
+        if not rewrite and len(list_delta_files(partition_path)) < threshold:
+            continue
+        try:
+            if compact_partition(partition_path, unique_columns, schema, rewrite=rewrite):
+                compacted.append(os.path.basename(partition_path).split('=', 1)[1])
+        except Exception as e:
+            logger.error(f"❌ 压缩分区 {partition_path} 时发生错误: {e}")
+    logger.info(f"{table_name} 压缩完毕，共压缩 {len(compacted)} 个分区。")
+    return compacted
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+确定性的合成数据生成器
+按给定规模（标的数 × 年数 × 快照宽度）生成与真实数据结构一致的 etf_prices 和 convertible_bonds，
+用于基准测试（benchmark.py）和在没有网络 / 没有历史数据的环境中试验存储与策略代码。
+
+  - etf_prices: 几何布朗运动的收盘价，开高低收自洽，约 1% 的K线缺失（停牌）
+  - convertible_bonds: 每个工作日一份全市场快照，列与集思录接口一致（icons 为 dict、评级、待上市、
+    名称中带“退”的转债等都按一定比例出现），width 控制填充的列数
+
+同一组参数和 seed 总是生成完全相同的数据。
+
+用法:
+    from synthetic import etf_prices, convertible_bonds, build_dataset
+    df = etf_prices(n_symbols=50, years=10)
+    build_dataset('/tmp/bench-data', n_symbols=50, years=10, n_bonds=400, cb_days=250)
+
+    python synthetic.py /tmp/bench-data [标的数] [年数]
+"""
+
+import sys
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from schemas import get_schema
+
+# --- 配置 ---
+DEFAULT_START = '2015-01-05'
+# ETF 日收益率的年化漂移和波动率范围
+ETF_DRIFT = (-0.05, 0.15)
+ETF_VOL = (0.12, 0.35)
+# ETF K线缺失（停牌）的比例
+ETF_MISSING_RATE = 0.01
+# 可转债快照中各类特殊记录的比例
+CB_DELISTING_RATE = 0.02   # 名称带“退”
+CB_PENDING_RATE = 0.02     # 待上市
+CB_ICON_RATE = 0.08        # 带 icons 标记（其中约一半为 R / O）
+CB_RATINGS = ['AAA', 'AA+', 'AA', 'AA-', 'A+', 'A', 'A-', 'BBB+']
+# 快照必须包含的列（双低筛选和存储需要），width 小于该数量时也会生成这些列
+CB_REQUIRED_COLUMNS = ['bond_id', 'bond_nm', 'price', 'sprice', 'premium_rt', 'dblow', 'curr_iss_amt',
+                       'rating_cd', 'price_tips', 'icons', 'update_date']
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+
+def trading_days(start: str = DEFAULT_START, years: Optional[float] = None,
+                 days: Optional[int] = None) -> pd.DatetimeIndex:
+    """从 start 开始的工作日序列（years 年或 days 天）"""
+    if days is None:
+        days = int(round((years or 1) * 252))
+    return pd.bdate_range(start=start, periods=days)
+
+
+def etf_symbols(n_symbols: int) -> List[str]:
+    """形如真实ETF代码的6位标的代码（5/1 开头交替）"""
+    return [f"{'51' if i % 2 == 0 else '15'}{9000 - i:04d}" for i in range(n_symbols)]
+
+
+def etf_prices(n_symbols: int = 12, years: float = 10, start: str = DEFAULT_START, seed: int = 0,
+               missing_rate: float = ETF_MISSING_RATE) -> pd.DataFrame:
+    """
+    生成 etf_prices 表的数据（列与 update_etf.py 写入的一致），按标的、日期排序。
+
+    Args:
+        n_symbols: 标的数量。
+        years: 年数（每年 252 个交易日）。
+        missing_rate: 随机缺失K线的比例。
+    """
+    rng = np.random.default_rng(seed)
+    dates = trading_days(start, years)
+    n_days = len(dates)
+    drift = rng.uniform(*ETF_DRIFT, n_symbols) / 252
+    vol = rng.uniform(*ETF_VOL, n_symbols) / np.sqrt(252)
+    log_returns = drift + vol * rng.standard_normal((n_days, n_symbols))
+    close = rng.uniform(0.8, 5.0, n_symbols) * np.exp(np.cumsum(log_returns, axis=0))
+    prev_close = np.vstack([close[:1] / np.exp(log_returns[:1]), close[:-1]])
+    gap = np.exp(0.3 * vol * rng.standard_normal((n_days, n_symbols)))
+    open_ = prev_close * gap
+    spread = np.abs(vol * rng.standard_normal((n_days, n_symbols))) * 0.5
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread * rng.uniform(0.5, 1.0, (n_days, n_symbols)))
+    volume = rng.lognormal(14, 1, (n_days, n_symbols)).astype('int64')
+
+    symbols = etf_symbols(n_symbols)
+    df = pd.DataFrame({
+        'date': np.tile(dates.values, n_symbols),
+        'open': open_.T.ravel().round(4),
+        'close': close.T.ravel().round(4),
+        'high': high.T.ravel().round(4),
+        'low': low.T.ravel().round(4),
+        'volume': volume.T.ravel(),
+        'symbol': np.repeat(symbols, n_days),
+    })
+    prev = prev_close.T.ravel()
+    df['turnover'] = (df['volume'] * df['close']).round(2)
+    df['amplitude'] = ((df['high'] - df['low']) / prev * 100).round(2)
+    df['change_amount'] = (df['close'] - prev).round(4)
+    df['change_pct'] = (df['change_amount'] / prev * 100).round(2)
+    df['turnover_rate'] = rng.uniform(0.1, 8.0, len(df)).round(2)
+    df['price_adjust'] = 'raw'
+    if missing_rate > 0:
+        df = df[rng.random(len(df)) >= missing_rate]
+    columns = list(get_schema('etf_prices').fields)
+    return df[columns].reset_index(drop=True)
+
+
+def _cb_filler(name: str, dtype, rng: np.random.Generator, n: int) -> np.ndarray:
+    """按列的声明类型生成非关键列的取值"""
+    if pa.types.is_floating(dtype):
+        return rng.normal(50, 30, n).round(3)
+    if pa.types.is_integer(dtype):
+        return rng.integers(0, 1000, n)
+    if pa.types.is_date(dtype):
+        return (pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 3000, n), unit='D')).date
+    if pa.types.is_dictionary(dtype):
+        return np.array(['Y', 'N', ''], dtype=object)[rng.integers(0, 3, n)]
+    if pa.types.is_list(dtype):
+        values = np.empty(n, dtype=object)
+        values[:] = [[] for _ in range(n)]
+        return values
+    return np.char.add(f'{name}-', rng.integers(0, 10000, n).astype(str)).astype(object)
+
+
+def convertible_bonds(n_bonds: int = 400, days: int = 250, start: str = DEFAULT_START,
+                      width: Optional[int] = None, seed: int = 0) -> pd.DataFrame:
+    """
+    生成 convertible_bonds 表的每日快照（与 update.py 从集思录接口得到的原始数据结构一致）。
+
+    Args:
+        n_bonds: 每天快照中的转债数量。
+        days: 快照天数（工作日）。
+        width: 生成的列数，None 表示 schema 中的全部列；至少包含 CB_REQUIRED_COLUMNS。
+    """
+    rng = np.random.default_rng(seed)
+    schema = get_schema('convertible_bonds')
+    dates = trading_days(start, days=days)
+    n = n_bonds * days
+
+    bond_ids = np.array([f"{'11' if i % 2 == 0 else '12'}{3000 + i:04d}" for i in range(n_bonds)])
+    # 价格按转债各自的随机游走演化，溢价率围绕各自的均值波动
+    price = 100 + 15 * rng.standard_normal(n_bonds) ** 2 + np.cumsum(rng.normal(0, 1.2, (days, n_bonds)), axis=0)
+    price = np.clip(price, 70, 400)
+    premium = np.clip(rng.normal(30, 25, n_bonds) + np.cumsum(rng.normal(0, 1.0, (days, n_bonds)), axis=0), -5, 200)
+    delisting = rng.random(n_bonds) < CB_DELISTING_RATE
+    names = np.where(delisting, np.char.add('退', np.char.add('债', bond_ids)), np.char.add('转债', bond_ids))
+    rating = np.array(CB_RATINGS)[rng.integers(0, len(CB_RATINGS), n_bonds)]
+    issue = rng.lognormal(1.5, 0.8, n_bonds).round(3)
+
+    icon_pool = [{}, {'R': '最后交易日：2025-09-01'}, {'O': '公告要强赎'}, {'G': '不强赎'}, {'M': ''}, {'B': ''}]
+    icon_choice = np.where(rng.random(n) < CB_ICON_RATE, rng.integers(1, len(icon_pool), n), 0)
+    pending = rng.random(n) < CB_PENDING_RATE
+
+    flat_price = price.ravel()
+    flat_premium = premium.ravel()
+    data = {
+        'bond_id': np.tile(bond_ids, days),
+        'bond_nm': np.tile(names, days).astype(object),
+        'price': flat_price.round(3),
+        'sprice': (rng.uniform(3, 40, n)).round(2),
+        'premium_rt': flat_premium.round(2),
+        'dblow': (flat_price + flat_premium).round(3),
+        'curr_iss_amt': np.tile(issue, days),
+        'rating_cd': np.tile(rating, days).astype(object),
+        'price_tips': np.where(pending, '待上市', '全价：' + np.char.mod('%.3f', flat_price).astype(object)),
+        'icons': np.array(icon_pool, dtype=object)[icon_choice],
+        'update_date': np.repeat(dates.values, n_bonds),
+    }
+    columns = list(schema.fields) if width is None else \
+        CB_REQUIRED_COLUMNS + [col for col in schema.fields if col not in CB_REQUIRED_COLUMNS][:max(width - len(CB_REQUIRED_COLUMNS), 0)]
+    for col in columns:
+        if col not in data:
+            data[col] = _cb_filler(col, schema.fields[col], rng, n)
+    return pd.DataFrame({col: data[col] for col in columns})
+
+
+def build_dataset(output_dir: str, n_symbols: int = 12, years: float = 10, n_bonds: int = 400,
+                  cb_days: int = 250, width: Optional[int] = None, seed: int = 0) -> Dict[str, int]:
+    """
+    生成合成数据并按正常写入流程（schema 规整、分区、目录）写入 output_dir。
+
+    Returns:
+        Dict[str, int]: 各表写入的行数。
+    """
+    from catalog import update_catalog
+    from storage import save_partitioned
+
+    counts = {}
+    tables = {
+        'etf_prices': etf_prices(n_symbols, years, seed=seed),
+        'convertible_bonds': convertible_bonds(n_bonds, cb_days, width=width, seed=seed),
+    }
+    for table_name, df in tables.items():
+        schema = get_schema(table_name)
+        written = save_partitioned(df, output_dir, table_name, schema.date_column, schema.unique_columns, schema=schema)
+        update_catalog(output_dir, table_name, written)
+        counts[table_name] = len(df)
+        logger.info(f"已生成 {table_name}: {len(df)} 行，{len(written)} 个分区")
+    return counts
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not sys.argv[1:]:
+        print("用法: python synthetic.py <输出目录> [标的数] [年数]")
+        sys.exit(1)
+    output_dir = sys.argv[1]
+    n_symbols = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    years = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    print(build_dataset(output_dir, n_symbols=n_symbols, years=years))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A股交易日历
+交易日列表缓存在本地状态文件中，调度器判断是否为交易日时只读取本地文件，不访问网络。
+缓存由 refresh_calendar()（调度器中的交易日历任务）从 akshare 的 tool_trade_date_hist_sina 刷新，
+该接口包含交易所已公布的全年安排。
+
+本地日历没有覆盖的日期（缓存缺失或尚未公布下一年的安排）退回为“周一至周五都是交易日”，并记录警告。
+
+用法:
+    python trade_calendar.py          刷新本地日历（已是最新时跳过）
+    python trade_calendar.py --force  强制刷新
+
+    from trade_calendar import is_trading_day
+    if is_trading_day():
+        ...
+"""
+
+import os
+import sys
+import json
+import logging
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+# --- 配置 ---
+# Parquet文件的根目录（默认使用本文件旁边的 data 目录）
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# 本地交易日历缓存
+CALENDAR_FILE = os.path.join(OUTPUT_DIR, '_state', 'trade_calendar.json')
+# 缓存超过该天数后刷新
+MAX_AGE_DAYS = 7
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+_cache = {'mtime': None, 'dates': frozenset(), 'first': None, 'last': None}
+
+
+def _load() -> dict:
+    """读取本地日历，文件变化后才重新解析"""
+    try:
+        mtime = os.path.getmtime(CALENDAR_FILE)
+    except OSError:
+        return _cache
+    if mtime != _cache['mtime']:
+        try:
+            with open(CALENDAR_FILE, 'r', encoding='utf-8') as f:
+                dates = sorted(json.load(f)['dates'])
+            _cache.update(mtime=mtime, dates=frozenset(dates),
+                          first=dates[0] if dates else None, last=dates[-1] if dates else None)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"读取交易日历失败: {e}")
+    return _cache
+
+
+def is_trading_day(day: Optional[date] = None) -> bool:
+    """day（默认今天）是否为A股交易日"""
+    day = day or datetime.now().date()
+    key = day.strftime('%Y-%m-%d')
+    calendar = _load()
+    if calendar['first'] is not None and calendar['first'] <= key <= calendar['last']:
+        return key in calendar['dates']
+    logger.warning(f"本地交易日历没有覆盖 {key}，按工作日判断。")
+    return day.weekday() < 5
+
+
+def calendar_is_stale(today: Optional[date] = None) -> bool:
+    """缓存缺失、超过 MAX_AGE_DAYS 天或没有覆盖今天时需要刷新"""
+    today = today or datetime.now().date()
+    if not os.path.exists(CALENDAR_FILE):
+        return True
+    age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(CALENDAR_FILE))
+    calendar = _load()
+    return age > timedelta(days=MAX_AGE_DAYS) or calendar['last'] is None or calendar['last'] < today.strftime('%Y-%m-%d')
+
+
+def save_calendar(dates: List[str]):
+    os.makedirs(os.path.dirname(CALENDAR_FILE), exist_ok=True)
+    tmp_path = CALENDAR_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'dates': sorted(dates)}, f)
+    os.replace(tmp_path, CALENDAR_FILE)
+
+
+def refresh_calendar(force: bool = False) -> bool:
+    """
+    从 akshare 刷新本地交易日历。
+
+    Returns:
+        bool: 刷新成功或无需刷新时为 True。
+    """
+    if not force and not calendar_is_stale():
+        logger.info("本地交易日历已是最新，跳过刷新。")
+        return True
+    import akshare as ak
+
+    df = ak.tool_trade_date_hist_sina()
+    if df is None or df.empty:
+        logger.error("未能获取交易日历。")
+        return False
+    dates = [str(value)[:10] for value in df['trade_date']]
+    save_calendar(dates)
+    logger.info(f"✅ 交易日历已更新: {dates[0]} ~ {dates[-1]}，共 {len(dates)} 个交易日。")
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(0 if refresh_calendar(force='--force' in sys.argv[1:]) else 1)
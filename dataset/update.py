@@ -9,10 +9,19 @@ import pandas as pd
 import requests
 import json
 import os
+import sys
 import logging
 from datetime import datetime
 from typing import Dict, Any, Optional
 
+from catalog import update_catalog
+from jisilu import JisiluClient, replay_cb_list
+from run_metrics import start_run
+from schemas import get_schema
+from snapshot import publish_after_write
+from storage import save_partitioned
+from warehouse import refresh_after_write
+
 # --- 配置 ---
 # Parquet文件的根目录
 OUTPUT_DIR = 'data'
@@ -22,6 +31,10 @@ TABLE_NAME = 'convertible_bonds'
 DATE_COLUMN = 'update_date'
 # 用于唯一识别记录的列，在合并数据时去重
 UNIQUE_COLUMNS = ['bond_id', 'update_date']
+# 写入模式: 'merge' 读取并重写整个分区; 'append' 追加增量文件, 由 compact.py 定期合并
+WRITE_MODE = 'merge'
+# 从归档回放重建时，每累积多少天的数据写入一次
+REPLAY_BATCH_DAYS = 31
 
 # 从环境变量读取Cookie
 COOKIE = os.getenv("JISILU_COOKIE", "")
@@ -39,7 +52,7 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def save_data_to_parquet(df: pd.DataFrame, output_dir: str, table_name: str):
+def save_data_to_parquet(df: pd.DataFrame, output_dir: str, table_name: str, mode: str = WRITE_MODE):
     """
     将DataFrame保存到分区的Parquet文件，并处理合并逻辑。
 
@@ -47,6 +60,7 @@ def save_data_to_parquet(df: pd.DataFrame, output_dir: str, table_name: str):
         df: 包含新数据的DataFrame。
         output_dir: Parquet文件的根目录。
         table_name: 表名，用于创建子目录。
+        mode: 写入模式，'merge' 重写分区，'append' 追加增量文件。
     """
     if df.empty:
         logger.warning("输入的数据为空，无需保存。\n")
@@ -59,64 +73,22 @@ def save_data_to_parquet(df: pd.DataFrame, output_dir: str, table_name: str):
     # 确保日期列是datetime类型
     df[DATE_COLUMN] = pd.to_datetime(df[DATE_COLUMN])
 
-    # 创建 'year_month' 分区列
-    df['year_month'] = df[DATE_COLUMN].dt.strftime('%Y-%m')
-    logger.info("已创建 'year_month' 分区列。\n")
-
-    # --- 通用类型问题解决方案 ---
-    # 遍历所有列，将 object 类型的列统一转换为字符串，以避免 Parquet 写入错误。
-    # 这可以处理包含列表、字典等复杂对象的列。
-    for col in df.columns:
-        if df[col].dtype == 'object':
-            # 对于list或dict类型，使用json.dumps进行序列化，其他类型直接转为字符串
-            df[col] = df[col].apply(lambda x: json.dumps(x, ensure_ascii=False) if isinstance(x, (dict, list)) else x)
-            df[col] = df[col].astype(str) # 再次确保最终类型为string
-            logger.info(f"已将 object 类型的列 '{col}' 统一转换为字符串以确保兼容性。")
-    # --- 解决方案结束 ---
-
-    # 按月份对新数据进行分组，以便逐月处理
-    for year_month, group_df in df.groupby('year_month'):
-        partition_path = os.path.join(output_dir, table_name, f"year_month={year_month}")
-        os.makedirs(partition_path, exist_ok=True)
-        
-        # 在每个分区内，我们使用一个标准的文件名
-        file_path = os.path.join(partition_path, 'data.parquet')
-        
-        logger.info(f"--- 正在处理分区: {partition_path} ---")
-
-        try:
-            # 如果该分区已存在数据文件，则执行合并操作
-            if os.path.exists(file_path):
-                logger.info(f"发现现有数据文件: {file_path}，开始执行合并操作。\n")
-                existing_df = pd.read_parquet(file_path)
-                
-                # 合并新旧数据
-                combined_df = pd.concat([existing_df, group_df], ignore_index=True)
-                
-                # 基于唯一键去重，保留最新的记录
-                merged_df = combined_df.drop_duplicates(subset=UNIQUE_COLUMNS, keep='last')
-                
-                logger.info(f"合并完成: 旧记录数={len(existing_df)}, 新记录数={len(group_df)}, 合并后总数={len(merged_df)}\n")
-                final_df = merged_df
-            else:
-                logger.info("未发现现有数据，将直接写入新数据。\n")
-                final_df = group_df
-
-            # 将最终的DataFrame写回Parquet文件，覆盖旧文件
-            final_df.to_parquet(
-                file_path,
-                compression='zstd',
-                index=False
-            )
-            logger.info(f"✅ 成功将 {len(final_df)} 条记录写入到: {file_path}\n")
-
-        except Exception as e:
-            logger.error(f"❌ 处理分区 {partition_path} 时发生错误: {e}\n")
+    # 按声明的表结构写入（数值/日期/字典编码/嵌套类型），结构漂移在规整时显式检测
+    written = save_partitioned(df, output_dir, table_name, DATE_COLUMN, UNIQUE_COLUMNS, mode=mode,
+                               schema=get_schema(table_name))
+    # 同步分区目录，读取端据此裁剪分区；启用了 DuckDB 仓库时增量刷新对应的表；重新发布热表的内存映射快照
+    update_catalog(output_dir, table_name, written)
+    refresh_after_write(output_dir, table_name)
+    publish_after_write(output_dir, table_name)
 
 
 class QuantDataManager:
     """量化数据管理器 - Parquet版本"""
 
+    def __init__(self, client: Optional[JisiluClient] = None):
+        # 共享连接池的集思录客户端，每次请求的原始响应都会归档到 data/_raw/jisilu
+        self.client = client if client is not None else JisiluClient(cookie=COOKIE)
+
     def check_cookie(self) -> bool:
         """检查Cookie是否已设置"""
         if not COOKIE or COOKIE.strip() == "":
@@ -129,25 +101,11 @@ class QuantDataManager:
         if not self.check_cookie():
             return None
             
-        url = "https://www.jisilu.cn/webapi/cb/list/"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Columns': '1,70,2,3,5,6,11,12,14,15,16,29,30,32,34,44,46,47,50,52,53,54,56,57,58,59,60,62,63,67',
-            'Init': '1',
-            'Cookie': COOKIE,
-            'Referer': 'https://www.jisilu.cn/',
-        }
-        
         try:
             logger.info("正在请求集思录可转债数据...\n")
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            logger.info(f"请求成功，状态码: {response.status_code}\n")
-            return response.json()
+            data = self.client.fetch_cb_list()
+            logger.info("请求成功，原始响应已归档。\n")
+            return data
         except requests.exceptions.RequestException as e:
             logger.error(f"请求失败: {e}\n")
             return None
@@ -177,32 +135,81 @@ class QuantDataManager:
     def update_convertible_bonds(self) -> bool:
         """获取、处理并保存可转债数据到Parquet文件"""
         start_time = datetime.now()
-        
-        try:
-            # 1. 获取数据
-            raw_data = self.fetch_cb_data()
-            if raw_data is None:
+
+        # 各阶段的耗时、行数和字节数在运行结束时写入 update_logs（见 run_metrics.py）
+        with start_run(TABLE_NAME, OUTPUT_DIR) as run:
+            try:
+                # 1. 获取数据
+                with run.timer('fetch', source='jisilu'):
+                    raw_data = self.fetch_cb_data()
+                if raw_data is None:
+                    run.fail("获取集思录数据失败")
+                    return False
+
+                # 2. 处理数据
+                with run.timer('process'):
+                    df = self.process_cb_data(raw_data)
+                if df.empty:
+                    run.fail("集思录返回的数据为空或格式不正确")
+                    return False
+                run.record('fetch', 'rows', len(df), unit='rows', source='jisilu')
+
+                # 3. 准备数据用于保存
+                # 添加/覆盖更新日期列
+                df[DATE_COLUMN] = datetime.now().date()
+
+                # 4. 保存到分区的Parquet文件（包含合并逻辑）
+                with run.timer('save'):
+                    save_data_to_parquet(df, OUTPUT_DIR, TABLE_NAME)
+                run.records_count = len(df)
+
+                execution_time = (datetime.now() - start_time).total_seconds()
+                logger.info(f"可转债数据更新成功，共处理 {len(df)} 条记录，耗时 {execution_time:.2f} 秒。\n")
+                return True
+
+            except Exception as e:
+                logger.error(f"更新可转债数据失败: {e}\n")
+                run.fail(str(e))
                 return False
-            
-            # 2. 处理数据
-            df = self.process_cb_data(raw_data)
-            if df.empty:
+
+    def rebuild_from_archive(self, start: Optional[str] = None, end: Optional[str] = None) -> bool:
+        """
+        从原始响应归档离线重建可转债表（不访问网络）。
+
+        每天取最后一次获取的有效响应，经 process_cb_data 处理后按 REPLAY_BATCH_DAYS 天一批合并写入，
+        用于修改处理逻辑或表结构后重新处理历史数据。
+
+        Args:
+            start / end: 日期范围 'YYYY-MM-DD'（含两端），None 表示归档中的全部日期。
+        """
+        with start_run(TABLE_NAME, OUTPUT_DIR) as run:
+            frames, days, total = [], 0, 0
+            for day, raw_data in replay_cb_list(start, end):
+                with run.timer('process'):
+                    df = self.process_cb_data(raw_data)
+                if df.empty:
+                    continue
+                df[DATE_COLUMN] = pd.Timestamp(day).date()
+                frames.append(df)
+                days += 1
+                if len(frames) >= REPLAY_BATCH_DAYS:
+                    total += self._save_replayed(run, frames)
+                    frames = []
+            if frames:
+                total += self._save_replayed(run, frames)
+            run.records_count = total
+            if days == 0:
+                logger.warning("归档中没有可回放的数据。")
+                run.fail("归档中没有可回放的数据")
                 return False
-            
-            # 3. 准备数据用于保存
-            # 添加/覆盖更新日期列
-            df[DATE_COLUMN] = datetime.now().date()
-            
-            # 4. 保存到分区的Parquet文件（包含合并逻辑）
-            save_data_to_parquet(df, OUTPUT_DIR, TABLE_NAME)
-            
-            execution_time = (datetime.now() - start_time).total_seconds()
-            logger.info(f"可转债数据更新成功，共处理 {len(df)} 条记录，耗时 {execution_time:.2f} 秒。\n")
+            logger.info(f"从归档重建完成: {days} 天，共 {total} 条记录。\n")
             return True
-            
-        except Exception as e:
-            logger.error(f"更新可转债数据失败: {e}\n")
-            return False
+
+    def _save_replayed(self, run, frames) -> int:
+        df = pd.concat(frames, ignore_index=True)
+        with run.timer('save'):
+            save_data_to_parquet(df, OUTPUT_DIR, TABLE_NAME)
+        return len(df)
 
 def main():
     """主函数"""
@@ -211,7 +218,15 @@ def main():
     print("=" * 60)
     
     data_manager = QuantDataManager()
-    
+
+    # python update.py --replay [起始日期] [结束日期]: 从原始响应归档离线重建
+    args = sys.argv[1:]
+    if args[:1] == ['--replay']:
+        print("\n从原始响应归档重建可转债数据...")
+        success = data_manager.rebuild_from_archive(*(args[1:3]))
+        print("\n✅ 重建完成!" if success else "\n❌ 重建失败，请查看日志 data_update.log。\n")
+        return
+
     try:
         print("\n开始更新可转债数据...")
         success = data_manager.update_convertible_bonds()
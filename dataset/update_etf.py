@@ -7,9 +7,22 @@ ETF数据更新脚本 - 使用分区Parquet文件存储
 
 import akshare as ak
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import os
+import json
 import logging
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Union
+
+from adjust import clear_legacy, derive_events, load_legacy, save_events
+from catalog import update_catalog
+from fetch_pool import FetchExecutor
+from run_metrics import current_run, start_run
+from schemas import get_schema
+from snapshot import publish_after_write
+from storage import IngestBatch, list_partitions, read_partition, save_partitioned
+from warehouse import refresh_after_write
 
 # --- 配置 ---
 # 要更新的ETF符号列表
@@ -22,6 +35,25 @@ TABLE_NAME = 'etf_prices'
 DATE_COLUMN = 'date'
 # 用于唯一识别记录的列，在合并数据时去重
 UNIQUE_COLUMNS = ['date', 'symbol']
+# 写入模式: 'merge' 读取并重写整个分区; 'append' 追加增量文件, 由 compact.py 定期合并
+WRITE_MODE = 'merge'
+# 没有历史数据的标的首次获取的回溯天数
+INITIAL_LOOKBACK_DAYS = 365
+# 在水位线之前额外重新获取的天数，用于吸收数据源的事后修正
+OVERLAP_DAYS = 7
+# 记录每个标的已存储最新日期（水位线）的状态文件（位于数据目录下）
+WATERMARK_STATE = os.path.join('_state', '{table}_watermarks.json')
+# 复权方式：保存不复权价格，复权在读取时按 adj_factors 中的除权除息事件计算（见 adjust.py）
+ADJUST = ""
+# 并发获取的线程数，以及用于限速的数据源主机名（见 fetch_pool.HOST_RATE_LIMITS）
+FETCH_WORKERS = 4
+FETCH_HOST = 'eastmoney'
+# akshare 返回的中文列名到存储列名的映射
+COLUMN_MAPPING = {
+    '日期': 'date', '开盘': 'open', '收盘': 'close', '最高': 'high', '最低': 'low',
+    '成交量': 'volume', '成交额': 'turnover', '振幅': 'amplitude',
+    '涨跌幅': 'change_pct', '涨跌额': 'change_amount', '换手率': 'turnover_rate'
+}
 # --- 配置结束 ---
 
 # 配置日志
@@ -35,99 +67,184 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def save_data_to_parquet(df: pd.DataFrame, output_dir: str, table_name: str):
+def save_data_to_parquet(df: Union[pd.DataFrame, pa.Table], output_dir: str, table_name: str,
+                         mode: str = WRITE_MODE, skip_unchanged: bool = False) -> List[str]:
     """
     将DataFrame保存到分区的Parquet文件，并处理合并逻辑。
 
     Args:
-        df: 包含新数据的DataFrame。
+        df: 包含新数据的DataFrame或Arrow表。
         output_dir: Parquet文件的根目录。
         table_name: 表名，用于创建子目录。
+        mode: 写入模式，'merge' 重写分区，'append' 追加增量文件。
+        skip_unchanged: 只写入新增或变化的记录，没有变化的分区不改写。
+
+    Returns:
+        List[str]: 处理成功的分区月份。
     """
-    if df.empty:
+    if len(df) == 0:
         logger.warning("输入的数据为空，无需保存。")
-        return
+        return []
 
-    if DATE_COLUMN not in df.columns:
+    if DATE_COLUMN not in (df.column_names if isinstance(df, pa.Table) else df.columns):
         logger.error(f"数据中缺少指定的日期列 '{DATE_COLUMN}'，无法进行分区保存。")
-        return
+        return []
 
-    # 确保日期列是datetime类型
-    df[DATE_COLUMN] = pd.to_datetime(df[DATE_COLUMN])
+    written = save_partitioned(df, output_dir, table_name, DATE_COLUMN, UNIQUE_COLUMNS,
+                               mode=mode, skip_unchanged=skip_unchanged, schema=get_schema(table_name))
+    # 同步分区目录，读取端据此裁剪分区；启用了 DuckDB 仓库时增量刷新对应的表；重新发布热表的内存映射快照
+    update_catalog(output_dir, table_name, written)
+    refresh_after_write(output_dir, table_name)
+    publish_after_write(output_dir, table_name)
+    return written
 
-    # 创建 'year_month' 分区列
-    df['year_month'] = df[DATE_COLUMN].dt.strftime('%Y-%m')
-    logger.info(f"为 {table_name} 数据创建了 'year_month' 分区列。")
-
-    # 按月份对新数据进行分组，以便逐月处理
-    for year_month, group_df in df.groupby('year_month'):
-        partition_path = os.path.join(output_dir, table_name, f"year_month={year_month}")
-        os.makedirs(partition_path, exist_ok=True)
-        
-        file_path = os.path.join(partition_path, 'data.parquet')
-        
-        logger.info(f"--- 正在处理分区: {partition_path} ---")
+def scan_watermarks(output_dir: str, table_name: str, symbols: List[str]) -> Dict[str, pd.Timestamp]:
+    """
+    从已存储的数据中扫描每个标的的最新日期。
 
+    从最新的分区开始向前读取（只读 date/symbol 两列），所有标的都找到后即停止。
+    """
+    watermarks = {}
+    remaining = set(symbols)
+    for partition_path in reversed(list_partitions(output_dir, table_name)):
+        if not remaining:
+            break
+        part_df = read_partition(partition_path, UNIQUE_COLUMNS, columns=[DATE_COLUMN, 'symbol'],
+                                 schema=get_schema(table_name))
+        if part_df.empty:
+            continue
+        part_df = part_df[part_df['symbol'].isin(remaining)]
+        for symbol, max_date in part_df.groupby('symbol')[DATE_COLUMN].max().items():
+            watermarks[symbol] = pd.Timestamp(max_date)
+            remaining.discard(symbol)
+    return watermarks
+
+def _watermark_path(output_dir: str, table_name: str) -> str:
+    return os.path.join(output_dir, WATERMARK_STATE.format(table=table_name))
+
+def load_watermarks(output_dir: str = OUTPUT_DIR, table_name: str = TABLE_NAME,
+                    symbols: Optional[List[str]] = None) -> Dict[str, pd.Timestamp]:
+    """
+    读取每个标的的水位线：优先使用状态文件，状态文件中缺失的标的从已存储数据中扫描补齐。
+    """
+    symbols = SYMBOLS if symbols is None else symbols
+    path = _watermark_path(output_dir, table_name)
+    watermarks = {}
+    if os.path.exists(path):
         try:
-            if os.path.exists(file_path):
-                logger.info(f"发现现有数据文件: {file_path}，开始执行合并操作。")
-                existing_df = pd.read_parquet(file_path)
-                combined_df = pd.concat([existing_df, group_df], ignore_index=True)
-                merged_df = combined_df.drop_duplicates(subset=UNIQUE_COLUMNS, keep='last')
-                logger.info(f"合并完成: 旧记录数={len(existing_df)}, 新记录数={len(group_df)}, 合并后总数={len(merged_df)}")
-                final_df = merged_df
-            else:
-                logger.info("未发现现有数据，将直接写入新数据。")
-                final_df = group_df
-
-            final_df.to_parquet(file_path, compression='zstd', index=False)
-            logger.info(f"✅ 成功将 {len(final_df)} 条记录写入到: {file_path}")
-
-        except Exception as e:
-            logger.error(f"❌ 处理分区 {partition_path} 时发生错误: {e}")
-
-def update_etf_data():
+            with open(path, 'r', encoding='utf-8') as f:
+                watermarks = {symbol: pd.Timestamp(value) for symbol, value in json.load(f).items()}
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取水位线状态文件失败，将从数据中重新扫描: {e}")
+            watermarks = {}
+
+    missing = [symbol for symbol in symbols if symbol not in watermarks]
+    if missing:
+        logger.info(f"从已存储数据中扫描 {len(missing)} 个标的的水位线...")
+        watermarks.update(scan_watermarks(output_dir, table_name, missing))
+    return watermarks
+
+def save_watermarks(watermarks: Dict[str, pd.Timestamp], output_dir: str = OUTPUT_DIR,
+                    table_name: str = TABLE_NAME):
+    """把水位线写入 output_dir 下的状态文件"""
+    path = _watermark_path(output_dir, table_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({symbol: ts.strftime('%Y-%m-%d') for symbol, ts in sorted(watermarks.items())}, f, indent=2)
+    os.replace(tmp_path, path)
+
+def get_fetch_start_date(watermark: Optional[pd.Timestamp], now: datetime) -> datetime:
+    """根据水位线计算请求起始日期：已有数据时从水位线前 OVERLAP_DAYS 天开始，否则回溯 INITIAL_LOOKBACK_DAYS 天"""
+    if watermark is None:
+        return now - timedelta(days=INITIAL_LOOKBACK_DAYS)
+    return watermark.to_pydatetime() - timedelta(days=OVERLAP_DAYS)
+
+def update_etf_data() -> bool:
     """
     使用akshare获取ETF价格数据并存储到分区的Parquet文件。
-    """
-    # 为了确保能覆盖到所有最近的更新，我们获取过去一年的数据
-    # 合并逻辑将处理掉重复的数据
-    start_date = (datetime.now() - timedelta(days=365)).strftime('%Y%m%d')
-    end_date = datetime.now().strftime('%Y%m%d')
-
-    all_etf_df = pd.DataFrame()
+    各标的的获取耗时和各分区的写入指标在运行结束时写入 update_logs（见 run_metrics.py）。
 
+    Returns:
+        bool: 是否获取到数据（全部标的都获取失败时为 False，调度器据此重试）。
+    """
+    with start_run(TABLE_NAME, OUTPUT_DIR) as run:
+        return _update_etf_data(run)
+
+def _update_etf_data(run) -> bool:
+    # 每个标的只请求水位线之后的数据（另加 OVERLAP_DAYS 天的重叠窗口吸收事后修正）
+    # 重叠部分中没有变化的记录会在写入前被过滤掉
+    now = datetime.now()
+    end_date = now.strftime('%Y%m%d')
+    watermarks = load_watermarks(OUTPUT_DIR, TABLE_NAME, SYMBOLS)
+    # 仍有旧版后复权行的标的从这些行的最早日期起重新获取不复权数据，确认改写完成后才移除标记
+    legacy = load_legacy(OUTPUT_DIR, TABLE_NAME)
     for symbol in SYMBOLS:
-        logger.info(f"--- 开始获取ETF: {symbol} ---")
-        try:
-            etf_hist_df = ak.fund_etf_hist_em(symbol=symbol, period="daily", start_date=start_date, end_date=end_date, adjust="hfq")
-
-            if etf_hist_df.empty:
-                logger.warning(f"未能获取到 {symbol} 的数据。")
-                continue
-
-            # 重命名列为英文
-            column_mapping = {
-                '日期': 'date', '开盘': 'open', '收盘': 'close', '最高': 'high', '最低': 'low',
-                '成交量': 'volume', '成交额': 'turnover', '振幅': 'amplitude',
-                '涨跌幅': 'change_pct', '涨跌额': 'change_amount', '换手率': 'turnover_rate'
-            }
-            etf_hist_df.rename(columns=column_mapping, inplace=True)
-
-            etf_hist_df['symbol'] = symbol
-            all_etf_df = pd.concat([all_etf_df, etf_hist_df], ignore_index=True)
-            logger.info(f"成功获取 {len(etf_hist_df)} 条 {symbol} 的数据。")
-
-        except Exception as e:
-            logger.error(f"获取 {symbol} 数据时发生错误: {e}")
-    
-    if not all_etf_df.empty:
+        if symbol in legacy:
+            logger.info(f"{symbol} 仍有旧版本的后复权数据，本次从 {legacy[symbol]:%Y-%m-%d} 起重新获取不复权数据")
+
+    def fetch_symbol(symbol: str) -> Optional[pd.DataFrame]:
+        start = get_fetch_start_date(watermarks.get(symbol), now)
+        if symbol in legacy:
+            start = min(start, legacy[symbol].to_pydatetime())
+        start_date = start.strftime('%Y%m%d')
+        logger.info(f"--- 开始获取ETF: {symbol} ({start_date} ~ {end_date}) ---")
+        etf_hist_df = ak.fund_etf_hist_em(symbol=symbol, period="daily", start_date=start_date, end_date=end_date, adjust=ADJUST)
+
+        if etf_hist_df.empty:
+            logger.warning(f"未能获取到 {symbol} 的数据。")
+            return None
+
+        # 重命名列为英文
+        etf_hist_df.rename(columns=COLUMN_MAPPING, inplace=True)
+        etf_hist_df['symbol'] = symbol
+        etf_hist_df['price_adjust'] = 'raw'
+        current_run().record('fetch', 'rows', len(etf_hist_df), unit='rows', source=FETCH_HOST, symbol=symbol)
+        logger.info(f"成功获取 {len(etf_hist_df)} 条 {symbol} 的数据。")
+        return etf_hist_df
+
+    # 并发获取各标的数据，单个标的失败不影响其他标的
+    fetch_result = FetchExecutor(max_workers=FETCH_WORKERS).fetch_all(SYMBOLS, fetch_symbol, host=FETCH_HOST)
+
+    # 把各标的结果收集为 Arrow 批次，最后一次性拼接
+    with run.timer('process'):
+        batch = IngestBatch(date_column=DATE_COLUMN)
+        for etf_hist_df in fetch_result.ordered(SYMBOLS):
+            batch.add(etf_hist_df)
+
+    if len(batch) > 0:
         logger.info(f"\n开始将所有获取到的ETF数据写入Parquet...")
-        # 调用核心函数，保存并合并数据
-        save_data_to_parquet(all_etf_df, OUTPUT_DIR, TABLE_NAME)
+        run.records_count = len(batch)
+        with run.timer('process'):
+            etf_table = batch.finish()
+        # 从本次获取的不复权日线推算除权除息事件（重叠窗口内已记录的事件不会重复写入）；
+        # 先于价格写入，写入价格后发布的快照和仓库复权表使用的是最新的事件
+        with run.timer('adjust'):
+            save_events(derive_events(etf_table.to_pandas(), TABLE_NAME), OUTPUT_DIR)
+        # 调用核心函数，保存并合并数据，只改写真正有变化的分区
+        with run.timer('save'):
+            succeeded = save_data_to_parquet(etf_table, OUTPUT_DIR, TABLE_NAME, skip_unchanged=True)
+
+        # 只推进所有分区都写入成功的标的的水位线，失败的部分下次重新获取
+        year_month = pc.strftime(etf_table[DATE_COLUMN], format='%Y-%m')
+        failed_mask = pc.invert(pc.is_in(year_month, value_set=pa.array(succeeded, pa.string())))
+        failed_symbols = set(etf_table.filter(failed_mask)['symbol'].to_pylist())
+        max_dates = etf_table.group_by('symbol').aggregate([(DATE_COLUMN, 'max')]).to_pydict()
+        refetched = []
+        for symbol, max_date in zip(max_dates['symbol'], max_dates[f'{DATE_COLUMN}_max']):
+            if symbol in failed_symbols:
+                continue
+            refetched.append(symbol)
+            max_date = pd.Timestamp(max_date)
+            previous = watermarks.get(symbol)
+            watermarks[symbol] = max(previous, max_date) if previous is not None else max_date
+        save_watermarks(watermarks, OUTPUT_DIR, TABLE_NAME)
+        clear_legacy(OUTPUT_DIR, TABLE_NAME, legacy, refetched)
         logger.info(f"所有ETF数据处理完毕。")
-    else:
-        logger.warning("未能获取到任何ETF数据，本次未写入任何文件。")
+        return True
+    logger.warning("未能获取到任何ETF数据，本次未写入任何文件。")
+    run.fail(f"{len(fetch_result.errors)}/{len(SYMBOLS)} 个标的获取失败，未获取到任何数据")
+    return False
 
 if __name__ == "__main__":
     logger.info("=" * 60)
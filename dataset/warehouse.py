@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+持久化 DuckDB 数据仓库（可选）
+把 etf_prices、convertible_bonds、etf_features、stock_daily、stock_valuation、update_logs 镜像到一个 DuckDB 文件中，并预先构建常用的宽表和视图，
+分析查询直接命中已加载的列式数据库，而不是每次冷扫描 Parquet。
+
+仓库是可选的：只有仓库文件存在时，更新脚本才会在写入后增量刷新它。
+增量刷新以分区目录（catalog）为准，只重新加载目录版本发生变化的分区。
+
+用法:
+    python warehouse.py init       创建仓库并全量加载
+    python warehouse.py refresh    增量刷新（只加载变化的分区）
+
+    from warehouse import connect
+    con = connect(read_only=True)
+    con.sql("SELECT * FROM etf_close_wide WHERE date >= '2025-01-01'").df()        # 后复权收盘价
+    con.sql("SELECT date, symbol, close_qfq FROM etf_prices_adj WHERE symbol = '513100'").df()
+"""
+
+import os
+import sys
+import logging
+from typing import Dict, Iterable, Optional
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from catalog import load_catalog, read_table
+from schemas import get_schema
+
+# --- 配置 ---
+# Parquet文件的根目录
+OUTPUT_DIR = 'data'
+# 仓库文件路径，可通过环境变量 QUANT_WAREHOUSE 覆盖
+WAREHOUSE_PATH = os.getenv(
+    'QUANT_WAREHOUSE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'quant_data.duckdb'),
+)
+# 按分区镜像的表（需在 schemas 中注册），加载时按 (标的代码, 日期) 排序并建立索引
+PARTITIONED_TABLES = ('etf_prices', 'convertible_bonds', 'etf_features', 'stock_daily', 'stock_valuation',
+                      'adj_factors')
+# 整表镜像的表（数据量小，每次刷新全量重建）
+SNAPSHOT_TABLES = ('update_logs',)
+# 记录各分区已同步版本的内部表
+SYNC_TABLE = '_warehouse_sync'
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+# 读取时复权（与 adjust.apply_adjustment 一致）：累计因子按 (标的, 日期) as-of 连接到不复权价格。
+# 全部是旧版后复权行的标的 hfq 因子为 1（原样返回）、qfq 为 NULL；同一标的混有两种行时复权列都为 NULL
+ETF_PRICES_ADJ_QUERY = """
+    WITH factors AS (
+        SELECT symbol, date,
+               product(ratio) OVER (PARTITION BY symbol ORDER BY date
+                                    ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS factor
+        FROM adj_factors WHERE table_name = 'etf_prices'
+    ), latest AS (
+        SELECT symbol, arg_max(factor, date) AS latest FROM factors GROUP BY symbol
+    ), prices AS (
+        SELECT *, bool_and(price_adjust = 'raw') OVER (PARTITION BY symbol) AS all_raw,
+                  bool_or(price_adjust = 'raw') OVER (PARTITION BY symbol) AS any_raw
+        FROM etf_prices
+    ), adjusted AS (
+        SELECT p.* EXCLUDE (all_raw, any_raw),
+               CASE WHEN p.all_raw THEN coalesce(f.factor, 1.0) WHEN NOT p.any_raw THEN 1.0 END AS hfq_factor,
+               CASE WHEN p.all_raw THEN coalesce(f.factor, 1.0) / coalesce(l.latest, 1.0) END AS qfq_factor
+        FROM prices p
+        ASOF LEFT JOIN factors f ON p.symbol = f.symbol AND p.date >= f.date
+        LEFT JOIN latest l ON p.symbol = l.symbol
+    )
+    SELECT *, close * hfq_factor AS close_hfq, close * qfq_factor AS close_qfq
+    FROM adjusted ORDER BY symbol, date
+"""
+
+# 刷新后重建的派生表：表名 -> (依赖的表, 查询)，任一依赖刷新后按声明顺序重建
+# （DuckDB 的动态 PIVOT 不能放进视图，因此物化为表）
+DERIVED_TABLES = {
+    # 带复权因子和复权收盘价的 etf_prices
+    'etf_prices_adj': (('etf_prices', 'adj_factors'), ETF_PRICES_ADJ_QUERY),
+    # 每日后复权收盘价宽表：date × symbol
+    'etf_close_wide': (('etf_prices', 'adj_factors'),
+                       "PIVOT (SELECT date, symbol, close_hfq AS close FROM etf_prices_adj) "
+                       "ON symbol USING first(close) GROUP BY date ORDER BY date"),
+}
+
+VIEWS = {
+    # 每只ETF的最新一根K线
+    'etf_latest': """
+        SELECT * FROM etf_prices
+        QUALIFY row_number() OVER (PARTITION BY symbol ORDER BY date DESC) = 1
+    """,
+    # 最新一个交易日的可转债快照
+    'cb_latest': """
+        SELECT * FROM convertible_bonds
+        WHERE update_date = (SELECT max(update_date) FROM convertible_bonds)
+    """,
+}
+
+
+def connect(path: str = WAREHOUSE_PATH, read_only: bool = False) -> duckdb.DuckDBPyConnection:
+    """
+    连接仓库。notebook 中查询请使用 read_only=True；
+    DuckDB 同一时间只允许一个进程以读写方式打开文件。
+    """
+    return duckdb.connect(path, read_only=read_only)
+
+
+def _table_exists(con: duckdb.DuckDBPyConnection, table_name: str) -> bool:
+    return con.execute(
+        "SELECT count(*) FROM information_schema.tables WHERE table_name = ?", [table_name]
+    ).fetchone()[0] > 0
+
+
+def _ensure_sync_table(con: duckdb.DuckDBPyConnection):
+    # 分区版本号由文件签名得到（见 catalog.partition_version），超出 INTEGER 范围，旧仓库的同步表需要改列类型
+    version_type = con.execute(
+        "SELECT data_type FROM information_schema.columns WHERE table_name = ? AND column_name = 'version'",
+        [SYNC_TABLE]).fetchone()
+    if version_type is not None and version_type[0] != 'BIGINT':
+        con.execute(f"ALTER TABLE {SYNC_TABLE} ALTER version TYPE BIGINT")
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SYNC_TABLE} (
+            table_name VARCHAR,
+            year_month VARCHAR,
+            version BIGINT,
+            synced_at TIMESTAMP DEFAULT current_timestamp,
+            PRIMARY KEY (table_name, year_month)
+        )
+    """)
+
+
+def _partition_arrow(output_dir: str, table_name: str, entry: Dict) -> pa.Table:
+    """读取一个分区（含增量文件、已去重）并转换为 Arrow 表；字典编码列解码为普通字符串"""
+    schema = get_schema(table_name)
+    df = read_table(output_dir, table_name, start=entry['min_date'], end=entry['max_date'])
+    # 旧结构版本写入的文件先规整到当前声明的类型
+    if any(version != schema.version for version in entry['schema_versions']):
+        df = schema.conform(df)
+    # 早期文件没有写入分区列，仓库中按 year_month 删除/重载分区，这里统一补上
+    df['year_month'] = entry['year_month']
+    table = schema.to_arrow(df)
+    columns = [
+        column.cast(column.type.value_type) if pa.types.is_dictionary(column.type) else column
+        for column in table.columns
+    ]
+    table = pa.Table.from_arrays(columns, names=table.column_names)
+    order = pc.sort_indices(table, sort_keys=[(schema.key_column, 'ascending'), (schema.date_column, 'ascending')])
+    return table.take(order)
+
+
+def _add_missing_columns(con: duckdb.DuckDBPyConnection, table_name: str, relation: duckdb.DuckDBPyRelation):
+    """数据源新增列时同步到仓库表"""
+    existing = {row[0] for row in con.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = ?", [table_name]
+    ).fetchall()}
+    for column, dtype in zip(relation.columns, relation.types):
+        if column not in existing:
+            logger.warning(f"仓库表 {table_name} 新增列: {column} {dtype}")
+            con.execute(f'ALTER TABLE {table_name} ADD COLUMN "{column}" {dtype}')
+
+
+def _create_table(con: duckdb.DuckDBPyConnection, table_name: str, relation: duckdb.DuckDBPyRelation):
+    schema = get_schema(table_name)
+    relation.create(table_name)
+    con.execute(
+        f"CREATE INDEX IF NOT EXISTS idx_{table_name}_key_date "
+        f"ON {table_name} ({schema.key_column}, {schema.date_column})"
+    )
+
+
+def _empty_arrow(table_name: str) -> pa.Table:
+    """按声明结构的空表（字典编码列为普通字符串，另加分区列）"""
+    fields = [
+        pa.field(name, dtype.value_type if pa.types.is_dictionary(dtype) else dtype)
+        for name, dtype in get_schema(table_name).fields.items()
+    ]
+    return pa.schema(fields + [pa.field('year_month', pa.string())]).empty_table()
+
+
+def _rebuild_derived(con: duckdb.DuckDBPyConnection, table_name: str):
+    """重建依赖 table_name 的派生表；其他依赖表尚未加载时（例如还没有任何除权除息事件）先建为空表"""
+    for derived_name, (sources, query) in DERIVED_TABLES.items():
+        if table_name not in sources:
+            continue
+        for source in sources:
+            if not _table_exists(con, source):
+                _create_table(con, source, con.from_arrow(_empty_arrow(source)))
+        con.execute(f"CREATE OR REPLACE TABLE {derived_name} AS {query}")
+
+
+def refresh_table(con: duckdb.DuckDBPyConnection, output_dir: str, table_name: str) -> int:
+    """
+    按分区增量刷新一张表：目录版本变化的分区先删除再重新加载，目录中已不存在的分区被删除。
+
+    Returns:
+        int: 重新加载或删除的分区数量。
+    """
+    schema = get_schema(table_name)
+    _ensure_sync_table(con)
+    catalog = load_catalog(output_dir, table_name)
+    synced = dict(con.execute(
+        f"SELECT year_month, version FROM {SYNC_TABLE} WHERE table_name = ?", [table_name]
+    ).fetchall())
+
+    changed = [
+        entry for year_month, entry in sorted(catalog['partitions'].items())
+        if synced.get(year_month) != entry['version']
+    ]
+    removed = [year_month for year_month in synced if year_month not in catalog['partitions']]
+    if not changed and not removed:
+        return 0
+
+    for year_month in removed:
+        con.execute("BEGIN TRANSACTION")
+        if _table_exists(con, table_name):
+            con.execute(f"DELETE FROM {table_name} WHERE year_month = ?", [year_month])
+        con.execute(f"DELETE FROM {SYNC_TABLE} WHERE table_name = ? AND year_month = ?", [table_name, year_month])
+        con.execute("COMMIT")
+
+    for entry in changed:
+        year_month = entry['year_month']
+        partition = _partition_arrow(output_dir, table_name, entry)
+        relation = con.from_arrow(partition)
+        con.execute("BEGIN TRANSACTION")
+        try:
+            if not _table_exists(con, table_name):
+                _create_table(con, table_name, relation)
+            else:
+                _add_missing_columns(con, table_name, relation)
+                con.execute(f"DELETE FROM {table_name} WHERE year_month = ?", [year_month])
+                con.register('_partition', partition)
+                con.execute(f"INSERT INTO {table_name} BY NAME SELECT * FROM _partition")
+                con.unregister('_partition')
+            con.execute(
+                f"INSERT OR REPLACE INTO {SYNC_TABLE} (table_name, year_month, version) VALUES (?, ?, ?)",
+                [table_name, year_month, entry['version']],
+            )
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+    _rebuild_derived(con, table_name)
+
+    logger.info(f"✅ 仓库表 {table_name} 已刷新: 加载 {len(changed)} 个分区，删除 {len(removed)} 个分区。")
+    return len(changed) + len(removed)
+
+
+def refresh_snapshot_table(con: duckdb.DuckDBPyConnection, output_dir: str, table_name: str) -> int:
+    """整表重建小表（例如 update_logs），返回行数"""
+    pattern = os.path.join(os.path.abspath(output_dir), table_name, '**', '*.parquet')
+    con.execute(
+        f"CREATE OR REPLACE TABLE {table_name} AS "
+        f"SELECT * FROM read_parquet(?, union_by_name = true, hive_partitioning = false)",
+        [pattern],
+    )
+    return con.execute(f"SELECT count(*) FROM {table_name}").fetchone()[0]
+
+
+def _create_views(con: duckdb.DuckDBPyConnection):
+    for view_name, query in VIEWS.items():
+        try:
+            con.execute(f"CREATE OR REPLACE VIEW {view_name} AS {query}")
+        except duckdb.CatalogException:
+            # 依赖的表尚未加载
+            continue
+
+
+def refresh_warehouse(output_dir: str = OUTPUT_DIR, path: str = WAREHOUSE_PATH,
+                      tables: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """
+    刷新仓库中的表（默认全部），仓库文件不存在时会被创建。
+
+    Returns:
+        Dict[str, int]: 分区表为刷新的分区数，整表镜像为当前行数。
+    """
+    tables = list(tables) if tables is not None else list(PARTITIONED_TABLES + SNAPSHOT_TABLES)
+    result = {}
+    with connect(path) as con:
+        for table_name in tables:
+            if table_name in PARTITIONED_TABLES:
+                result[table_name] = refresh_table(con, output_dir, table_name)
+            elif table_name in SNAPSHOT_TABLES:
+                if os.path.isdir(os.path.join(output_dir, table_name)):
+                    result[table_name] = refresh_snapshot_table(con, output_dir, table_name)
+            else:
+                logger.warning(f"仓库不镜像表: {table_name}")
+        _create_views(con)
+    return result
+
+
+def refresh_after_write(output_dir: str, table_name: str, path: str = WAREHOUSE_PATH):
+    """
+    由更新脚本在写入后调用：仓库文件存在时增量刷新对应的表。
+    刷新失败只记录错误，不影响已经完成的 Parquet 写入。
+    """
+    if not os.path.exists(path):
+        return
+    try:
+        refresh_warehouse(output_dir, path, tables=[table_name])
+    except Exception as e:
+        logger.error(f"❌ 刷新仓库表 {table_name} 失败（Parquet 数据已写入，可稍后执行 warehouse.py refresh）: {e}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    command = sys.argv[1] if len(sys.argv) > 1 else 'refresh'
+    if command not in ('init', 'refresh'):
+        print("用法: python warehouse.py [init|refresh]")
+        sys.exit(1)
+    if command == 'refresh' and not os.path.exists(WAREHOUSE_PATH):
+        logger.error(f"仓库文件不存在: {WAREHOUSE_PATH}，请先执行 python warehouse.py init")
+        sys.exit(1)
+    summary = refresh_warehouse(OUTPUT_DIR, WAREHOUSE_PATH)
+    logger.info(f"仓库刷新完成: {summary}")
@@ -3,16 +3,28 @@
 """
 集思录可转债数据爬取脚本
 接口地址: https://www.jisilu.cn/webapi/cb/list/
+请求通过 dataset/jisilu.py 的共享客户端发出，原始响应会归档到 dataset/data/_raw/jisilu。
+
+用法:
+    python double-low.py                      请求当天数据并筛选
+    python double-low.py --replay 2025-08-14  用归档中该日的响应离线筛选（不需要Cookie）
 """
 
 import requests
 import pandas as pd
 import json
 import os
+import sys
 from typing import Dict, Any, Optional
 
 # 从环境变量读取Cookie，更安全，避免提交泄漏
 COOKIE = os.getenv("JISILU_COOKIE", "")
+# dataset 目录（共享的集思录客户端和原始响应归档）
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataset')
+
+if DATASET_DIR not in sys.path:
+    sys.path.append(DATASET_DIR)
+from jisilu import JisiluClient, replay_cb_list  # noqa: E402
 
 
 def check_cookie() -> bool:
@@ -45,28 +57,11 @@ def fetch_cb_data() -> Optional[Dict[str, Any]]:
     if not check_cookie():
         return None
         
-    url = "https://www.jisilu.cn/webapi/cb/list/"
-    
-    # 设置请求头，模拟浏览器访问
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'Connection': 'keep-alive',
-        'Columns': '1,70,2,3,5,6,11,12,14,15,16,29,30,32,34,44,46,47,50,52,53,54,56,57,58,59,60,62,63,67',
-        'Init': '1',
-        'Cookie': COOKIE,
-        'Referer': 'https://www.jisilu.cn/',
-    }
-    
     try:
         print("正在请求集思录可转债数据...")
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()  # 检查HTTP状态码
-        
-        print(f"请求成功，状态码: {response.status_code}")
-        return response.json()
+        data = JisiluClient(cookie=COOKIE).fetch_cb_list()
+        print("请求成功，原始响应已归档")
+        return data
         
     except requests.exceptions.RequestException as e:
         print(f"请求失败: {e}")
@@ -192,6 +187,22 @@ def filter_and_sort_data(df: pd.DataFrame) -> pd.DataFrame:
         return pd.DataFrame()
 
 
+def load_archived_cb_data(day: str) -> Optional[Dict[str, Any]]:
+    """
+    从原始响应归档读取某一天的可转债数据（当天最后一次获取的有效响应）
+
+    Args:
+        day: 日期 'YYYY-MM-DD'
+
+    Returns:
+        Dict: 归档的JSON数据，归档中没有该日数据时返回None
+    """
+    for _, data in replay_cb_list(day, day):
+        return data
+    print(f"归档中没有 {day} 的数据")
+    return None
+
+
 def main():
     """
     主函数
@@ -200,8 +211,12 @@ def main():
     print("集思录可转债数据爬取工具")
     print("=" * 50)
     
-    # 获取数据
-    raw_data = fetch_cb_data()
+    # 获取数据：--replay 日期 时从归档离线读取
+    args = sys.argv[1:]
+    if args[:1] == ['--replay'] and len(args) == 2:
+        raw_data = load_archived_cb_data(args[1])
+    else:
+        raw_data = fetch_cb_data()
     
     if raw_data is None:
         print("无法获取数据，程序退出")
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+可转债双低历史回测
+对 data/convertible_bonds 中存档的每个 update_date 快照，一次性应用 double-low.py 中 filter_and_sort_data 的规则：
+  1. 剔除 bond_nm 包含 '退' 的
+  2. 剔除 price_tips 为 '待上市' 的
+  3. 剔除 icons 中有 R 或 O 的（使用 icon_flags 位掩码）
+  4. price < PRICE_CAP
+  5. rating_cd 包含 'A'
+  6. 按 rank_indicator = dblow + curr_iss_amt 升序，每天取前 TOP_N
+
+所有日期的过滤都是整表的向量运算；每天的前 N 名用分组的部分排序（argpartition）选出，不做整表排序。
+之后按选出的组合模拟轮动持仓：每 rebalance_days 个快照日等权调仓，期间持仓随价格漂移，按换手扣除交易费用。
+
+用法:
+    python double_low_backtest.py [开始日期] [结束日期]
+
+    from double_low_backtest import load_snapshots, screen, simulate_rotation
+    snapshots = load_snapshots('2024-01-01', '2025-08-29')
+    picks = screen(snapshots)
+    result = simulate_rotation(snapshots, picks, rebalance_days=5)
+"""
+
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# --- 配置 ---
+# dataset 目录（用于从本地数据仓库读取快照）
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataset')
+DATA_DIR = os.path.join(DATASET_DIR, 'data')
+TABLE_NAME = 'convertible_bonds'
+# 与 double-low.py 的 filter_and_sort_data 一致
+PRICE_CAP = 150
+TOP_N = 20
+EXCLUDED_ICONS = ('R', 'O')
+# 轮动参数：调仓间隔（快照日数）、单边交易费率
+DEFAULT_REBALANCE_DAYS = 1
+DEFAULT_FEE = 0.0005
+# 年化使用的交易日数量
+TRADING_DAYS = 252
+# --- 配置结束 ---
+
+if DATASET_DIR not in sys.path:
+    sys.path.append(DATASET_DIR)
+from catalog import read_table  # noqa: E402
+from schemas import icon_mask  # noqa: E402
+
+SNAPSHOT_COLUMNS = ['bond_nm', 'price_tips', 'price', 'rating_cd', 'dblow', 'curr_iss_amt']
+
+
+@dataclass
+class RotationResult:
+    """轮动结果：每个快照日的组合净值和调仓日的换手率"""
+    equity: pd.Series
+    turnover: pd.Series
+
+    @property
+    def returns(self) -> pd.Series:
+        return self.equity.pct_change().fillna(0.0)
+
+    def sharpe(self, periods: int = TRADING_DAYS) -> float:
+        std = self.returns.std(ddof=1)
+        return float(self.returns.mean() / std * np.sqrt(periods)) if std > 0 else 0.0
+
+    def max_drawdown(self) -> float:
+        return float((self.equity / self.equity.cummax() - 1).min())
+
+
+def load_snapshots(start: Optional[str] = None, end: Optional[str] = None,
+                   output_dir: str = DATA_DIR) -> pd.DataFrame:
+    """
+    读取区间内的全部快照（只读取筛选和模拟需要的列）。
+    写入时还没有 icon_flags 列的旧文件由 read_table 在读取时从 icons 补算。
+    """
+    df = read_table(output_dir, TABLE_NAME, columns=SNAPSHOT_COLUMNS + ['icon_flags'], start=start, end=end)
+    df['update_date'] = pd.to_datetime(df['update_date'])
+    df['bond_id'] = df['bond_id'].astype(str)
+    return df
+
+
+def eligible_mask(snapshots: pd.DataFrame, price_cap: float = PRICE_CAP) -> np.ndarray:
+    """filter_and_sort_data 的过滤条件 1-5，对所有日期一次性计算"""
+    blocked = icon_mask(*EXCLUDED_ICONS)
+    mask = ~snapshots['bond_nm'].astype(str).str.contains('退', na=False).to_numpy(dtype=bool)
+    mask &= ~snapshots['price_tips'].astype(str).str.contains('待上市', na=False).to_numpy(dtype=bool)
+    mask &= (snapshots['icon_flags'].fillna(0).to_numpy(dtype='int64') & blocked) == 0
+    mask &= snapshots['price'].to_numpy(dtype='float64', na_value=np.nan) < price_cap
+    mask &= snapshots['rating_cd'].astype(str).str.contains('A', case=False, na=False).to_numpy(dtype=bool)
+    return mask
+
+
+def screen(snapshots: pd.DataFrame, top_n: int = TOP_N, price_cap: float = PRICE_CAP) -> pd.DataFrame:
+    """
+    每个快照日选出 rank_indicator 最小的 top_n 只。
+
+    Returns:
+        [update_date, rank, bond_id, bond_nm, price, dblow, curr_iss_amt, rank_indicator]，rank 从 1 开始。
+    """
+    candidates = snapshots[eligible_mask(snapshots, price_cap)]
+    rank_indicator = (candidates['dblow'].to_numpy(dtype='float64', na_value=np.nan)
+                      + candidates['curr_iss_amt'].to_numpy(dtype='float64', na_value=np.nan))
+    # 与 sort_values 一致：缺失的排序指标排在最后
+    keys = np.where(np.isnan(rank_indicator), np.inf, rank_indicator)
+
+    codes, dates = pd.factorize(candidates['update_date'], sort=True)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(dates)))])
+
+    picked, ranks = [], []
+    for day in range(len(dates)):
+        rows = order[bounds[day]:bounds[day + 1]]
+        if len(rows) > top_n:
+            rows = rows[np.argpartition(keys[rows], top_n - 1)[:top_n]]
+        rows = rows[np.argsort(keys[rows], kind='stable')]
+        picked.append(rows)
+        ranks.append(np.arange(1, len(rows) + 1))
+
+    picked = np.concatenate(picked) if picked else np.array([], dtype='int64')
+    result = candidates.iloc[picked][['update_date', 'bond_id', 'bond_nm', 'price', 'dblow', 'curr_iss_amt']]
+    result.insert(1, 'rank', np.concatenate(ranks) if ranks else np.array([], dtype='int64'))
+    result['rank_indicator'] = rank_indicator[picked]
+    return result.reset_index(drop=True)
+
+
+def simulate_rotation(snapshots: pd.DataFrame, picks: pd.DataFrame,
+                      rebalance_days: int = DEFAULT_REBALANCE_DAYS, fee: float = DEFAULT_FEE) -> RotationResult:
+    """
+    按 screen() 的结果模拟轮动：每 rebalance_days 个快照日等权买入当日入选的可转债，持有到下一个调仓日。
+    持仓期间某只可转债没有快照（退市/强赎后）时按最后一个价格计值。
+
+    Args:
+        snapshots: load_snapshots() 的结果，用于取价格。
+        picks: screen() 的结果。
+        rebalance_days: 调仓间隔（快照日数）。
+        fee: 单边交易费率，按换手扣除。
+    """
+    dates = pd.DatetimeIndex(sorted(snapshots['update_date'].unique()))
+    bonds = pd.Index(sorted(snapshots['bond_id'].unique()))
+    prices = np.full((len(dates), len(bonds)), np.nan)
+    prices[dates.get_indexer(snapshots['update_date']), bonds.get_indexer(snapshots['bond_id'])] = \
+        snapshots['price'].to_numpy(dtype='float64', na_value=np.nan)
+    prices = pd.DataFrame(prices).ffill().to_numpy()
+
+    pick_rows = dates.get_indexer(picks['update_date'])
+    pick_cols = bonds.get_indexer(picks['bond_id'])
+
+    equity = np.full(len(dates), np.nan)
+    turnover = {}
+    value = 1.0
+    weights = np.zeros(len(bonds))
+    rebalance_rows = list(range(0, len(dates), rebalance_days))
+    for i, start in enumerate(rebalance_rows):
+        end = rebalance_rows[i + 1] if i + 1 < len(rebalance_rows) else len(dates) - 1
+        held = pick_cols[pick_rows == start]
+        target = np.zeros(len(bonds))
+        if len(held):
+            target[held] = 1.0 / len(held)
+        traded = np.abs(target - weights).sum()
+        turnover[dates[start]] = traded
+        value *= 1 - fee * traded
+        equity[start] = value
+        if not len(held):
+            equity[start:end + 1] = value
+            weights = target
+            continue
+        # 持有期内各持仓按价格漂移
+        relative = prices[start:end + 1, held] / prices[start, held]
+        path = value * relative.mean(axis=1)
+        equity[start + 1:end + 1] = path[1:]
+        value = path[-1]
+        weights = np.zeros(len(bonds))
+        weights[held] = relative[-1] / relative[-1].sum()
+
+    return RotationResult(equity=pd.Series(equity, index=dates, name='equity'),
+                          turnover=pd.Series(turnover, name='turnover'))
+
+
+if __name__ == "__main__":
+    start = sys.argv[1] if len(sys.argv) > 1 else None
+    end = sys.argv[2] if len(sys.argv) > 2 else None
+    t0 = time.time()
+    snapshots = load_snapshots(start, end)
+    t1 = time.time()
+    picks = screen(snapshots)
+    result = simulate_rotation(snapshots, picks)
+    t2 = time.time()
+    print(f"快照: {snapshots['update_date'].nunique()} 天，{len(snapshots)} 条；读取 {t1 - t0:.2f} 秒，筛选+模拟 {t2 - t1:.2f} 秒")
+    latest = picks[picks['update_date'] == picks['update_date'].max()]
+    print(f"\n最新一期 ({latest['update_date'].max():%Y-%m-%d}) 入选:")
+    print(latest.drop(columns=['update_date']).to_string(index=False))
+    print(f"\n期末净值: {result.equity.iloc[-1]:.4f}，夏普: {result.sharpe():.2f}，最大回撤: {result.max_drawdown():.2%}")
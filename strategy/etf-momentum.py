@@ -1,65 +1,229 @@
-import akshare as ak
+"""
+ETF 动量筛选
+每日从本地数据仓库（etf_prices）读取收盘价，不再每次从 akshare 下载全部历史。
+
+指标只需要最近 200 根K线，每个标的的状态（最近 200 个收盘价的环形缓冲区和滑动求和）保存在状态文件中，
+每次运行只读取上次之后新增的K线并推进状态，开销与历史长度无关。
+若仓库中上次处理的那根K线的收盘价与状态不一致（复权基准变化或历史被重写），该标的回退为全量重算。
+
+说明：仓库保存不复权价格，这里按读取时后复权（hfq）读取：新的除权除息事件只影响之后的价格，
+已处理K线的价格不变，增量状态保持有效。过滤条件（动量符号、收盘价与 MA200 的比较）与复权方式无关；
+13日动量是价格差，后复权价格差按累计因子放大，排序前除以各标的最新的累计因子，
+即按前复权价格差排序（与原先从 akshare 读取前复权数据时的排名一致）。
+
+用法:
+    python etf-momentum.py          增量更新状态并输出信号
+    python etf-momentum.py --full   忽略状态文件，全量重算
+"""
+
+import os
+import sys
+import json
+import math
+from typing import Dict, List, Optional
+
 import pandas as pd
 
-def get_etf_data(etf_code):
+# --- 配置 ---
+# dataset 目录（用于从本地数据仓库读取价格）
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataset')
+# Parquet文件的根目录
+DATA_DIR = os.path.join(DATASET_DIR, 'data')
+TABLE_NAME = 'etf_prices'
+# 指标状态文件
+STATE_FILE = os.path.join(DATA_DIR, '_state', 'etf_momentum_state.json')
+# 状态文件格式版本，结构变化时递增（旧状态会被丢弃并全量重算）
+STATE_FORMAT = 1
+ETFS = ['561300', '159726', '515100', '513500', '161119', '518880', '164824', '159985', '513330', '513100', '513030', '513520']
+# 指标参数
+MOMENTUM_FILTER = 20
+MOMENTUM_RANK = 13
+MA_WINDOW = 200
+TOP_N = 3
+# 判断复权基准是否变化时的相对误差容忍度
+BASIS_TOLERANCE = 1e-9
+# --- 配置结束 ---
+
+if DATASET_DIR not in sys.path:
+    sys.path.append(DATASET_DIR)
+from adjust import cumulative_factors, load_events, read_adjusted  # noqa: E402
+
+# 环形缓冲区需要覆盖 MA 窗口和最长的动量滞后
+BUFFER_SIZE = max(MA_WINDOW, MOMENTUM_FILTER + 1, MOMENTUM_RANK + 1)
+
+
+class RollingCloses:
     """
-    获取 ETF 的历史数据
+    最近 BUFFER_SIZE 个收盘价的环形缓冲区，维护 MA 窗口的滑动求和。
+    每写满一圈按缓冲区重新精确求和一次，避免长期累加的浮点误差。
     """
+
+    def __init__(self, values: Optional[List[float]] = None, head: int = 0, count: int = 0,
+                 last_date: Optional[str] = None):
+        self.values = values if values is not None else [0.0] * BUFFER_SIZE
+        self.head = head          # 下一个写入位置
+        self.count = count        # 该标的已处理的K线总数
+        self.last_date = last_date
+        self.ma_sum = self._exact_sum()
+
+    def lag(self, k: int) -> float:
+        """k 根K线之前的收盘价（k=0 为最新），数据不足时返回 NaN"""
+        if k >= min(self.count, BUFFER_SIZE):
+            return math.nan
+        return self.values[(self.head - 1 - k) % BUFFER_SIZE]
+
+    def _exact_sum(self) -> float:
+        n = min(self.count, MA_WINDOW)
+        return math.fsum(self.values[(self.head - 1 - k) % BUFFER_SIZE] for k in range(n))
+
+    def push(self, date: str, close: float):
+        # 移出 MA 窗口的收盘价
+        if self.count >= MA_WINDOW:
+            self.ma_sum -= self.lag(MA_WINDOW - 1)
+        self.values[self.head] = close
+        self.head = (self.head + 1) % BUFFER_SIZE
+        self.count += 1
+        self.ma_sum += close
+        self.last_date = date
+        if self.head == 0:
+            self.ma_sum = self._exact_sum()
+
+    def indicators(self) -> Dict[str, float]:
+        close = self.lag(0)
+        return {
+            'close': close,
+            'momentum_20': close - self.lag(MOMENTUM_FILTER),
+            'momentum_13': close - self.lag(MOMENTUM_RANK),
+            'ma_200': self.ma_sum / MA_WINDOW if self.count >= MA_WINDOW else math.nan,
+        }
+
+    def to_dict(self) -> Dict:
+        return {'values': self.values, 'head': self.head, 'count': self.count, 'last_date': self.last_date}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'RollingCloses':
+        return cls(values=list(data['values']), head=data['head'], count=data['count'], last_date=data['last_date'])
+
+
+def load_state() -> Dict[str, RollingCloses]:
+    if not os.path.exists(STATE_FILE):
+        return {}
     try:
-        df = ak.fund_etf_hist_em(symbol=etf_code, adjust="qfq")
-        df['日期'] = pd.to_datetime(df['日期'])
-        df.set_index('日期', inplace=True)
-        # 列名统一转为小写，方便处理
-        df.columns = [col.lower() for col in df.columns]
-        return df
-    except Exception as e:
-        print(f"获取 {etf_code} 数据失败: {e}")
-        return None
-
-def calculate_indicators(df):
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('format') != STATE_FORMAT or data.get('buffer_size') != BUFFER_SIZE:
+            print("指标状态文件格式已变化，全量重算。")
+            return {}
+        return {symbol: RollingCloses.from_dict(item) for symbol, item in data['symbols'].items()}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"读取指标状态文件失败，全量重算: {e}")
+        return {}
+
+
+def save_state(state: Dict[str, RollingCloses]):
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    tmp_path = STATE_FILE + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'format': STATE_FORMAT,
+            'buffer_size': BUFFER_SIZE,
+            'symbols': {symbol: rolling.to_dict() for symbol, rolling in sorted(state.items())},
+        }, f)
+    os.replace(tmp_path, STATE_FILE)
+
+
+def read_closes(symbols: List[str], start: Optional[str] = None) -> pd.DataFrame:
+    """读取收盘价（按标的、日期排序），start 为 None 时读取全部历史"""
+    df = read_adjusted(DATA_DIR, TABLE_NAME, columns=['close'], start=start, keys=symbols, adjust='hfq')
+    if df.empty:
+        return pd.DataFrame(columns=['date', 'symbol', 'close'])
+    df = df.dropna(subset=['close'])
+    df['date'] = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+    df['symbol'] = df['symbol'].astype(str)
+    return df.sort_values(['symbol', 'date'])
+
+
+def latest_factors(symbols: List[str]) -> Dict[str, float]:
+    """各标的最新的累计后复权因子（没有除权除息事件时为 1），hfq / 最新因子 = qfq"""
+    events = load_events(TABLE_NAME, keys=symbols, output_dir=DATA_DIR)
+    if events.empty:
+        return {}
+    factors = cumulative_factors(events)
+    return factors.groupby('symbol')['latest'].last().to_dict()
+
+
+def rebuild(history: pd.DataFrame) -> RollingCloses:
+    """全量重算：用一个标的最近 BUFFER_SIZE 根K线重建状态"""
+    rolling = RollingCloses()
+    for date, close in zip(history['date'].iloc[-BUFFER_SIZE:], history['close'].iloc[-BUFFER_SIZE:]):
+        rolling.push(date, float(close))
+    # count 反映完整历史长度，决定指标是否有足够的数据
+    rolling.count = len(history)
+    rolling.ma_sum = rolling._exact_sum()
+    return rolling
+
+
+def update_state(state: Dict[str, RollingCloses], symbols: List[str]) -> Dict[str, RollingCloses]:
     """
-    计算所需的技术指标
+    只读取各标的上次处理日期（含）之后的K线并推进状态；
+    缺少状态、或上次处理的那根K线在仓库中的收盘价已变化的标的全量重算。
     """
-    # 20日动量
-    df['momentum_20'] = df['收盘'].diff(20)
-    # 200日移动平均线
-    df['ma_200'] = df['收盘'].rolling(window=200).mean()
-    # 13日动量
-    df['momentum_13'] = df['收盘'].diff(13)
-    return df
-
-def run_strategy():
+    tracked = [symbol for symbol in symbols if symbol in state and state[symbol].last_date]
+    stale = [symbol for symbol in symbols if symbol not in tracked]
+    if tracked:
+        start = min(state[symbol].last_date for symbol in tracked)
+        recent = dict(tuple(read_closes(tracked, start=start).groupby('symbol')))
+        for symbol in tracked:
+            rolling = state[symbol]
+            rows = recent.get(symbol)
+            anchor = rows[rows['date'] == rolling.last_date] if rows is not None else None
+            if anchor is None or anchor.empty or not math.isclose(
+                    float(anchor['close'].iloc[-1]), rolling.lag(0), rel_tol=BASIS_TOLERANCE):
+                print(f"{symbol} 的历史价格已变化（复权基准变化或数据被重写），全量重算。")
+                stale.append(symbol)
+                continue
+            new_rows = rows[rows['date'] > rolling.last_date]
+            for date, close in zip(new_rows['date'], new_rows['close']):
+                rolling.push(date, float(close))
+
+    if stale:
+        histories = dict(tuple(read_closes(stale).groupby('symbol')))
+        for symbol in stale:
+            history = histories.get(symbol)
+            state[symbol] = rebuild(history) if history is not None else RollingCloses()
+    return state
+
+
+def run_strategy(full: bool = False):
     """
     执行ETF动量策略
     """
-    etfs = ['561300', '159726', '515100', '513500', '161119', '518880', '164824', '159985', '513330', '513100', '513030', '513520']
-    
-    eligible_etfs = []
+    print("开始读取和处理ETF数据...")
+    state = {} if full else load_state()
+    state = update_state(state, ETFS)
+    save_state(state)
 
-    print("开始获取和处理ETF数据...")
-    for etf_code in etfs:
-        print(f"处理ETF: {etf_code}")
-        data = get_etf_data(etf_code)
-        if data is None or data.empty:
+    factors = latest_factors(ETFS)
+    eligible_etfs = []
+    for etf_code in ETFS:
+        rolling = state[etf_code]
+        if rolling.count == 0:
+            print(f"{etf_code} 没有数据。")
             continue
-        
-        data = calculate_indicators(data)
-        
-        # 获取最新数据
-        latest_data = data.iloc[-1]
-        
+        latest_data = rolling.indicators()
+
         # 过滤条件
         # 1. 20日动量 > 0
         # 2. 收盘价 > 200MA
-        if latest_data['momentum_20'] > 0 and latest_data['收盘'] > latest_data['ma_200']:
+        if latest_data['momentum_20'] > 0 and latest_data['close'] > latest_data['ma_200']:
             eligible_etfs.append({
                 'code': etf_code,
-                'momentum_13': latest_data['momentum_13']
+                # 后复权价格差换算为前复权价格差，各标的的排名不受复权基准影响
+                'momentum_13': latest_data['momentum_13'] / factors.get(etf_code, 1.0)
             })
-            print(f"{etf_code} 符合过滤条件。")
+            print(f"{etf_code} 符合过滤条件。（{rolling.last_date}）")
         else:
-            print(f"{etf_code} 不符合过滤条件。")
-
+            print(f"{etf_code} 不符合过滤条件。（{rolling.last_date}）")
 
     if not eligible_etfs:
         print("没有符合条件的ETF。")
@@ -67,20 +231,21 @@ def run_strategy():
 
     # 根据13日动量从大到小排序
     eligible_etfs.sort(key=lambda x: x['momentum_13'], reverse=True)
-    
+
     print("\n筛选出的ETF (按13日动量排序):")
     for etf in eligible_etfs:
         print(f"代码: {etf['code']}, 13日动量: {etf['momentum_13']:.2f}")
 
     # 进场条件: 取前三
-    top_3_etfs = eligible_etfs[:3]
-    
-    print("\n最终选择的ETF (Top 3):")
-    if not top_3_etfs:
+    top_etfs = eligible_etfs[:TOP_N]
+
+    print(f"\n最终选择的ETF (Top {TOP_N}):")
+    if not top_etfs:
         print("无")
     else:
-        for etf in top_3_etfs:
+        for etf in top_etfs:
             print(f"代码: {etf['code']}")
 
+
 if __name__ == "__main__":
-    run_strategy()
+    run_strategy(full='--full' in sys.argv[1:])
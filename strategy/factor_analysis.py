@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+截面因子分析
+直接在 日期 × 股票 的宽表面板上完成 low-market-value notebook 中的因子处理和 Alphalens 分析：
+  - neutralize: 代替 neutralize_factor / neutralize_factor_nonlinear 的逐日循环。所有日期的最小二乘一次批量求解，
+    每个日期只使用因子和全部控制变量都有值的股票（掩码），支持线性和多项式控制项
+  - winsorize_wide / standardize_wide: 逐行缩尾和标准化的向量化版本
+  - forward_returns / quantize / information_coefficient / quantile_returns / quantile_turnover:
+    代替 get_clean_factor_and_forward_returns 转成长表再逐日 groupby 的做法
+
+用法:
+    from factor_analysis import neutralize, standardize_wide, analyze_factor
+
+    pe_neutral = standardize_wide(neutralize(standardize_wide(pe), np.log(market_cap)))
+    vol_neutral = neutralize(vol_4w, np.log(float_market_cap), pe_std, pb_std, degree=2)
+    report = analyze_factor(-pe_neutral, close_weekly, periods=(4, 8, 12), quantiles=5)
+    print(report.summary())
+
+说明：控制变量按传入的值使用，市值请先取对数再传入（notebook 中对已经取过对数的 log_mc_pivot 又取了一次对数）。
+"""
+
+import logging
+import warnings
+import itertools
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# --- 配置 ---
+# 默认缩尾比例（上下各 1%）
+WINSORIZE_LIMITS = (0.01, 0.01)
+# 每个日期回归所需的最少样本数（与 notebook 一致：线性 5，多项式 10）
+MIN_OBS_LINEAR = 5
+MIN_OBS_POLYNOMIAL = 10
+# 批量回归时每批的日期数，控制设计矩阵占用的内存
+CHUNK_DATES = 64
+# 默认前向收益周期（行数）和分组数
+DEFAULT_PERIODS = (4, 8, 12)
+DEFAULT_QUANTILES = 5
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+
+def _values(df: pd.DataFrame) -> np.ndarray:
+    return df.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def _like(values: np.ndarray, template: pd.DataFrame) -> pd.DataFrame:
+    return pd.DataFrame(values, index=template.index, columns=template.columns)
+
+
+def _row_quantiles(values: np.ndarray, q) -> np.ndarray:
+    """逐行分位数（忽略 NaN，线性插值，与 Series.quantile 一致），全为 NaN 的行返回 NaN"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanquantile(values, q, axis=1)
+
+
+def winsorize_wide(df: pd.DataFrame, limits: Tuple[float, float] = WINSORIZE_LIMITS) -> pd.DataFrame:
+    """逐日缩尾：把每行上下 limits 比例之外的值压缩到分位数边界"""
+    values = _values(df)
+    lower, upper = _row_quantiles(values, [limits[0], 1 - limits[1]])
+    return _like(np.clip(values, lower[:, None], upper[:, None]), df)
+
+
+def standardize_wide(df: pd.DataFrame, limits: Optional[Tuple[float, float]] = WINSORIZE_LIMITS) -> pd.DataFrame:
+    """逐日缩尾后标准化（样本标准差，标准差为 0 时只去均值），与 notebook 中的 standardize_wide 一致"""
+    values = _values(winsorize_wide(df, limits)) if limits is not None else _values(df)
+    count = np.isfinite(values).sum(axis=1)
+    mean = np.nansum(values, axis=1) / np.maximum(count, 1)
+    centered = values - mean[:, None]
+    std = np.sqrt(np.nansum(centered ** 2, axis=1) / np.maximum(count - 1, 1))
+    std = np.where((count > 1) & (std > 0), std, 1.0)
+    return _like(centered / std[:, None], df)
+
+
+def _design(controls: np.ndarray, valid: np.ndarray, degree: int) -> np.ndarray:
+    """
+    [日期, 股票, 控制变量] -> [日期, 股票, 回归项]：截距 + 全部不超过 degree 次的单项式（同 PolynomialFeatures）。
+    控制变量先逐日标准化，残差不受影响，但多项式项的数值条件好得多。无效位置整行置 0，不参与回归。
+    """
+    mask = valid[..., None]
+    count = np.maximum(valid.sum(axis=1), 1)[:, None, None]
+    x = np.where(mask, controls, 0.0)
+    x = np.where(mask, x - x.sum(axis=1, keepdims=True) / count, 0.0)
+    std = np.sqrt((x ** 2).sum(axis=1, keepdims=True) / count)
+    x = x / np.where(std > 0, std, 1.0)
+
+    columns = [valid.astype('float64')]
+    for power in range(1, degree + 1):
+        for combo in itertools.combinations_with_replacement(range(x.shape[-1]), power):
+            columns.append(np.prod(x[..., list(combo)], axis=-1))
+    return np.stack(columns, axis=-1)
+
+
+def neutralize(factor: pd.DataFrame, *controls: pd.DataFrame, degree: int = 1,
+               min_obs: Optional[int] = None) -> pd.DataFrame:
+    """
+    逐日截面回归 factor ~ 截距 + controls 的（多项式）项，返回残差面板。
+
+    Args:
+        factor: 日期 × 股票 因子面板。
+        controls: 控制变量面板（如 log 市值、标准化后的 PE/PB），按 factor 的行列对齐。
+        degree: 1 为线性中性化，2 及以上为多项式（非线性）中性化。
+        min_obs: 每个日期所需的最少有效股票数，不足的日期整行为 NaN；默认线性 5、多项式 10。
+
+    Returns:
+        与 factor 同形状的残差，缺少因子或任一控制变量的位置为 NaN。
+    """
+    if not controls:
+        raise ValueError("至少需要一个控制变量")
+    if min_obs is None:
+        min_obs = MIN_OBS_LINEAR if degree == 1 else MIN_OBS_POLYNOMIAL
+
+    y_all = _values(factor)
+    x_all = np.stack([_values(c.reindex(index=factor.index, columns=factor.columns)) for c in controls], axis=-1)
+    valid_all = np.isfinite(y_all) & np.isfinite(x_all).all(axis=-1)
+    enough = valid_all.sum(axis=1) >= min_obs
+
+    residual = np.full(y_all.shape, np.nan)
+    for start in range(0, len(factor), CHUNK_DATES):
+        rows = slice(start, start + CHUNK_DATES)
+        valid = valid_all[rows] & enough[rows, None]
+        if not valid.any():
+            continue
+        design = _design(x_all[rows], valid, degree)
+        y = np.where(valid, y_all[rows], 0.0)
+        # 伪逆给出与 LinearRegression（lstsq）相同的最小范数解，秩亏的日期也能求解
+        beta = np.linalg.pinv(design) @ y[..., None]
+        fitted = (design @ beta)[..., 0]
+        residual[rows] = np.where(valid, y - fitted, np.nan)
+
+    skipped = int((~enough & valid_all.any(axis=1)).sum())
+    if skipped:
+        logger.info(f"{skipped} 个日期的有效样本少于 {min_obs}，跳过中性化。")
+    return _like(residual, factor)
+
+
+def forward_returns(prices: pd.DataFrame, periods: Iterable[int] = DEFAULT_PERIODS) -> Dict[int, pd.DataFrame]:
+    """每个周期 p（行数）的前向收益 price[t+p] / price[t] - 1"""
+    values = _values(prices)
+    result = {}
+    for period in periods:
+        forward = np.full(values.shape, np.nan)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            forward[:-period] = values[period:] / values[:-period] - 1
+        result[period] = _like(forward, prices)
+    return result
+
+
+def quantize(factor: pd.DataFrame, quantiles: int = DEFAULT_QUANTILES) -> pd.DataFrame:
+    """逐日按因子值等分位分组（1 为最小组），与 pd.qcut(labels=False) + 1 一致；缺失值为 NaN"""
+    values = _values(factor)
+    edges = _row_quantiles(values, np.linspace(0, 1, quantiles + 1)[1:-1])
+    buckets = 1 + (values[None, :, :] > edges[:, :, None]).sum(axis=0)
+    return _like(np.where(np.isfinite(values), buckets, np.nan), factor)
+
+
+def _row_corr(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """逐行 Pearson 相关（只使用两者都有值的位置）"""
+    mask = np.isfinite(a) & np.isfinite(b)
+    count = mask.sum(axis=1)
+    a = np.where(mask, a, 0.0)
+    b = np.where(mask, b, 0.0)
+    n = np.maximum(count, 1)[:, None]
+    a = np.where(mask, a - a.sum(axis=1, keepdims=True) / n, 0.0)
+    b = np.where(mask, b - b.sum(axis=1, keepdims=True) / n, 0.0)
+    denom = np.sqrt((a ** 2).sum(axis=1) * (b ** 2).sum(axis=1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where((count > 2) & (denom > 0), (a * b).sum(axis=1) / denom, np.nan)
+
+
+def _row_rank(values: np.ndarray) -> np.ndarray:
+    """逐行平均秩（从 1 开始，并列取平均，NaN 保持为 NaN），与 DataFrame.rank(axis=1) 一致"""
+    order = np.argsort(values, axis=1)
+    ordered = np.take_along_axis(values, order, axis=1)
+    positions = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+    starts = np.ones(values.shape, dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    ends = np.ones(values.shape, dtype=bool)
+    ends[:, :-1] = starts[:, 1:]
+    first = np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+    last = np.minimum.accumulate(np.where(ends, positions, values.shape[1])[:, ::-1], axis=1)[:, ::-1]
+    ranks = np.empty(values.shape)
+    np.put_along_axis(ranks, order, (first + last) / 2 + 1, axis=1)
+    return np.where(np.isfinite(values), ranks, np.nan)
+
+
+def information_coefficient(factor: pd.DataFrame, returns: pd.DataFrame, rank: bool = True) -> pd.Series:
+    """逐日因子与前向收益的截面相关：rank=True 为 Spearman 秩相关（Alphalens 的 IC），否则为 Pearson"""
+    returns = returns.reindex(index=factor.index, columns=factor.columns)
+    a, b = _values(factor), _values(returns)
+    if rank:
+        mask = np.isfinite(a) & np.isfinite(b)
+        a = _row_rank(np.where(mask, a, np.nan))
+        b = _row_rank(np.where(mask, b, np.nan))
+    return pd.Series(_row_corr(a, b), index=factor.index)
+
+
+def quantile_returns(buckets: pd.DataFrame, returns: pd.DataFrame, quantiles: int = DEFAULT_QUANTILES) -> pd.DataFrame:
+    """逐日各分组的等权平均前向收益（日期 × 分组）"""
+    groups = _values(buckets)
+    values = _values(returns.reindex(index=buckets.index, columns=buckets.columns))
+    valid = np.isfinite(values)
+    result = {}
+    for q in range(1, quantiles + 1):
+        member = (groups == q) & valid
+        count = member.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[q] = np.where(count > 0, np.where(member, values, 0.0).sum(axis=1) / count, np.nan)
+    return pd.DataFrame(result, index=buckets.index)
+
+
+def quantile_turnover(buckets: pd.DataFrame, period: int = 1, quantiles: int = DEFAULT_QUANTILES) -> pd.DataFrame:
+    """各分组中 period 行之前不在该组的股票占比（日期 × 分组），同 Alphalens 的 quantile_turnover"""
+    groups = _values(buckets)
+    result = {}
+    for q in range(1, quantiles + 1):
+        member = groups == q
+        previous = np.zeros_like(member)
+        previous[period:] = member[:-period]
+        count = member.sum(axis=1)
+        turnover = np.where(count > 0, (member & ~previous).sum(axis=1) / np.maximum(count, 1), np.nan)
+        turnover[:period] = np.nan
+        result[q] = turnover
+    return pd.DataFrame(result, index=buckets.index)
+
+
+def factor_autocorrelation(factor: pd.DataFrame, period: int = 1) -> pd.Series:
+    """因子值与 period 行之前的截面秩相关，衡量因子的稳定性"""
+    return information_coefficient(factor, factor.shift(period), rank=True)
+
+
+@dataclass
+class FactorReport:
+    """因子分析结果，字典的键为前向收益周期"""
+    ic: pd.DataFrame
+    rank_ic: pd.DataFrame
+    quantile_returns: Dict[int, pd.DataFrame]
+    turnover: Dict[int, pd.DataFrame]
+    autocorrelation: pd.DataFrame
+    quantiles: int
+
+    def summary(self) -> pd.DataFrame:
+        """各周期的 IC 均值/标准差/IR/t 值、多空收益、最高组换手率和因子自相关"""
+        rows = {}
+        for period in self.ic.columns:
+            ic, rank_ic = self.ic[period].dropna(), self.rank_ic[period].dropna()
+            spread = (self.quantile_returns[period][self.quantiles] - self.quantile_returns[period][1]).dropna()
+            ir = ic.mean() / ic.std() if ic.std() > 0 else np.nan
+            rows[period] = {
+                'ic_mean': ic.mean(),
+                'ic_std': ic.std(),
+                'ic_ir': ir,
+                'ic_t': ir * np.sqrt(len(ic)),
+                'rank_ic_mean': rank_ic.mean(),
+                'rank_ic_ir': rank_ic.mean() / rank_ic.std() if rank_ic.std() > 0 else np.nan,
+                'top_minus_bottom': spread.mean(),
+                'top_turnover': self.turnover[period][self.quantiles].mean(),
+                'autocorrelation': self.autocorrelation[period].mean(),
+            }
+        return pd.DataFrame(rows).T.rename_axis('period')
+
+
+def analyze_factor(factor: pd.DataFrame, prices: pd.DataFrame, periods: Iterable[int] = DEFAULT_PERIODS,
+                   quantiles: int = DEFAULT_QUANTILES) -> FactorReport:
+    """
+    对齐因子和价格面板后计算 IC、秩 IC、分组收益、换手率和因子自相关。
+
+    Args:
+        factor: 日期 × 股票 因子面板。
+        prices: 同频率的价格面板（如周五收盘价），周期按行数计。
+        periods: 前向收益周期。
+        quantiles: 分组数。
+    """
+    periods = list(periods)
+    prices = prices.reindex(index=factor.index, columns=factor.columns)
+    forward = forward_returns(prices, periods)
+    buckets = quantize(factor, quantiles)
+    return FactorReport(
+        ic=pd.DataFrame({p: information_coefficient(factor, forward[p], rank=False) for p in periods}),
+        rank_ic=pd.DataFrame({p: information_coefficient(factor, forward[p], rank=True) for p in periods}),
+        quantile_returns={p: quantile_returns(buckets, forward[p], quantiles) for p in periods},
+        turnover={p: quantile_turnover(buckets, p, quantiles) for p in periods},
+        autocorrelation=pd.DataFrame({p: factor_autocorrelation(factor, p) for p in periods}),
+        quantiles=quantiles,
+    )
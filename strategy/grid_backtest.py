@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+网格交易批量回测
+按 网格交易策略规则文档.md 的规则，批量模拟整个参数网格（grid_size × grid_numbers_half，可再乘以多个标的），
+在长K线序列上也只需数秒，不为单笔交易创建 Python 对象。
+
+规则要点（详见文档）:
+  - 网格以中心价为基准: levels[k] = center * (1 + grid_size) ** (k - grid_numbers_half)，k = 0..2*grid_numbers_half
+  - 价格跌到下一条网格线买入、涨到上一条网格线卖出，一根K线跨过多条网格线按多笔交易计数
+  - 价格高于网格上限: 结算上涨收益和套利收益存入钱包，以当前价重建网格，追加 100 投入
+  - 价格低于网格下限: 结算已实现收益，把底仓和下方网格的持仓转为币（份额）持有，
+    优先用钱包补足 100 的网格资金，不足部分追加投入，以当前价重建网格
+
+价格在对数网格坐标 u = log(price / center) / log(1 + grid_size) + grid_numbers_half 下，
+网格内交易等价于 cur = clip(cur, floor(u), ceil(u))，成交次数为 cur 的变化量，可以对整条序列向量化求解。
+
+用法:
+    python grid_backtest.py [标的代码 ...]    (默认使用文档中的参数网格回测本地ETF数据)
+"""
+
+import os
+import sys
+import time
+import itertools
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+# --- 配置 ---
+# dataset 目录（用于从本地数据仓库读取价格）
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataset')
+# 文档中的测试参数
+GRID_SIZES = (0.005, 0.01, 0.015, 0.02, 0.03, 0.05, 0.07, 0.1)
+GRID_NUMBERS_HALF = (2, 3, 5, 7, 10)
+# 每个网格周期投入的资金
+GRID_CAPITAL = 100.0
+# 单边手续费率
+FEE_PCT = 0.0008
+# 查找网格突破时的初始窗口长度（K线数），未找到时按 4 倍扩大
+SEARCH_WINDOW = 32
+# 默认回测的ETF
+DEFAULT_SYMBOLS = ['561300', '159726', '515100', '513500', '161119', '518880',
+                   '164824', '159985', '513330', '513100', '513030', '513520']
+# --- 配置结束 ---
+
+RESULT_COLUMNS = ['symbol', 'grid_size', 'grid_numbers_half', 'wallet', 'money_input', 'coin', 'coin_value',
+                  'total_value', 'trade_count', 'up_breakouts', 'down_breakouts']
+
+
+def calculate_grid_levels(start_price: float, grid_size: float, grid_numbers_half: int) -> list:
+    """文档中的网格价格计算（仅用于展示/对照，模拟器内部使用对数坐标）"""
+    levels = [start_price / (1 + grid_size) ** i for i in range(grid_numbers_half, 0, -1)]
+    levels.append(start_price)
+    levels += [start_price * (1 + grid_size) ** i for i in range(1, grid_numbers_half + 1)]
+    return levels
+
+
+def _cycle_starts(log_prices: np.ndarray, first: int, inv_step: float, half: int) -> np.ndarray:
+    """
+    逐个周期查找网格重建的位置：从中心价出发，首根 |u - half| > half 的K线即为突破并成为新周期的起点。
+    指数扩大的窗口内用向量比较查找，单次查找的开销与周期长度成正比。
+    """
+    n = len(log_prices)
+    starts = [first]
+    s = first
+    while True:
+        base = log_prices[s]
+        pos, width, hit = s + 1, SEARCH_WINDOW, -1
+        while pos < n:
+            outside = np.abs((log_prices[pos:pos + width] - base) * inv_step) > half
+            i = outside.argmax()
+            if outside[i]:
+                hit = pos + i
+                break
+            pos += width
+            width *= 4
+        if hit < 0:
+            return np.array(starts)
+        starts.append(hit)
+        s = hit
+
+
+def _simulate_one(log_prices: np.ndarray, grid_size: float, half: int, fee_pct: float, capital: float) -> Dict:
+    """单个标的、单组参数的网格模拟；log_prices 已前向填充，前导 NaN 之后开始建网格"""
+    valid = np.flatnonzero(~np.isnan(log_prices))
+    result = dict(wallet=0.0, money_input=capital, coin=0.0, trade_count=0, up_breakouts=0, down_breakouts=0)
+    if not valid.size:
+        return result
+    first = valid[0]
+    lp = log_prices[first:]
+    inv_step = 1.0 / np.log1p(grid_size)
+    starts = _cycle_starts(lp, 0, inv_step, half)
+
+    # 每根K线在所属周期网格中的坐标，周期起点恰为 half
+    lengths = np.diff(np.append(starts, len(lp)))
+    base = np.repeat(lp[starts], lengths)
+    u = (lp - base) * inv_step + half
+
+    # 网格内交易 cur = clip(cur, floor(u), ceil(u))：u 落在网格线上时 cur = u；
+    # u 停留在同一格 (k, k+1) 内时 cur 不变，取决于进入该格之前的一根K线在格的上方(k+1)还是下方(k)
+    floor = np.floor(u)
+    on_line = u == floor
+    cell = np.where(on_line, floor, floor + 0.5)
+    run_start = np.empty(len(u), dtype=bool)
+    run_start[0] = True
+    run_start[1:] = cell[1:] != cell[:-1]
+    run_start[starts] = True
+    previous = np.roll(u, 1)
+    entry_level = np.where(on_line, floor, floor + (previous >= floor + 1))
+    run_index = np.maximum.accumulate(np.where(run_start, np.arange(len(u)), 0))
+    cur = entry_level[run_index]
+
+    steps = np.zeros(len(u))
+    steps[1:] = np.abs(np.diff(cur))
+    steps[starts] = 0
+    cycle_trades = np.add.reduceat(steps, starts)
+    max_level = np.maximum.reduceat(cur, starts)
+
+    # 除最后一个周期外，每个周期都以突破结束
+    closed = len(starts) - 1
+    unit_profit = capital / (2 * half) * (grid_size - fee_pct * 2)
+    trades, top = cycle_trades[:closed], max_level[:closed]
+    up = lp[starts[1:]] > lp[starts[:-1]]
+    count = np.maximum(top - half, 0)
+    profit = np.where(
+        up,
+        (half * (half + 1) / 2 + (trades - half) / 2) * unit_profit,
+        # 按文档公式：向下突破时的上涨收益为 count * (count + 1) 个单位
+        (count * (count + 1) + (trades - half - count) / 2) * unit_profit,
+    )
+
+    # 向下突破：底仓和下方网格的持仓按周期中心价折算为币
+    lower_sum = sum((1 + grid_size) ** k for k in range(1, half + 1))
+    center_price = np.exp(lp[starts[:-1]])
+    coin = ((capital / 2 + capital / (2 * half) * lower_sum) * (1 - fee_pct * 2) / center_price)[~up].sum()
+
+    # 钱包：向下突破时扣除 100 补仓，余额不足的部分追加投入并把钱包清零，
+    # 即在向下突破处反射的累积和：wallet = S + max(0, max(-S_k))，追加投入 = max(0, max(-S_k))
+    cumulative = np.cumsum(profit - np.where(up, 0.0, capital))
+    deficit = float(np.max(-cumulative[~up], initial=0.0))
+    result.update(
+        wallet=float(cumulative[-1] + deficit) if closed else 0.0,
+        money_input=capital * (1 + int(up.sum())) + deficit,
+        coin=float(coin),
+        trade_count=int(steps.sum()),
+        up_breakouts=int(up.sum()),
+        down_breakouts=int(closed - up.sum()),
+    )
+    return result
+
+
+def simulate_grid(prices: pd.DataFrame, grid_sizes: Iterable[float] = GRID_SIZES,
+                  grid_numbers_half: Iterable[int] = GRID_NUMBERS_HALF, fee_pct: float = FEE_PCT,
+                  capital: float = GRID_CAPITAL) -> pd.DataFrame:
+    """
+    对每个标的 × 每组参数运行网格策略。
+
+    只有网格重建的位置需要逐周期查找；其余计算（网格内成交、周期收益、持币、钱包补仓）
+    都是对整条价格序列的向量运算，每组参数只保留几个与K线等长的临时数组，不为单笔交易创建对象。
+
+    Args:
+        prices: 日期 × 标的 的价格面板（通常为收盘价），NaN 表示当日无价格（上市前/停牌），网格在首个有效价格处建立。
+        grid_sizes: 网格间距列表。
+        grid_numbers_half: 半网格数量列表。
+        fee_pct: 单边手续费率。
+        capital: 每个网格周期投入的资金（文档中为 100 USDT）。
+
+    Returns:
+        每个 (标的, grid_size, grid_numbers_half) 一行：钱包余额、累计投入、持有的币数量及市值、
+        网格交易次数、向上/向下突破次数。
+    """
+    if isinstance(prices, pd.Series):
+        prices = prices.to_frame()
+    # 停牌日沿用上一价格，不会触发交易
+    filled = prices.ffill()
+    log_prices = np.log(filled.to_numpy(dtype='float64'))
+    last_prices = filled.iloc[-1] if len(filled) else pd.Series(np.nan, index=prices.columns)
+
+    rows = []
+    for j, symbol in enumerate(prices.columns):
+        series = np.ascontiguousarray(log_prices[:, j])
+        for grid_size, half in itertools.product(grid_sizes, grid_numbers_half):
+            row = _simulate_one(series, float(grid_size), int(half), fee_pct, capital)
+            coin_value = row['coin'] * np.nan_to_num(last_prices[symbol])
+            rows.append({'symbol': symbol, 'grid_size': float(grid_size), 'grid_numbers_half': int(half),
+                         **row, 'coin_value': coin_value, 'total_value': row['wallet'] + coin_value})
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def load_close(symbols: Iterable[str], start: Optional[str] = None, end: Optional[str] = None) -> pd.DataFrame:
+    """从本地数据仓库读取收盘价面板"""
+    if DATASET_DIR not in sys.path:
+        sys.path.append(DATASET_DIR)
+    from panel import load_panel
+    return load_panel('etf_prices', 'close', symbols=list(symbols), start=start, end=end, fill=None,
+                      adjust='hfq')
+
+
+if __name__ == "__main__":
+    symbols = sys.argv[1:] or DEFAULT_SYMBOLS
+    close = load_close(symbols)
+    t0 = time.time()
+    result = simulate_grid(close)
+    elapsed = time.time() - t0
+    pd.set_option('display.width', 200)
+    print(result.sort_values('total_value', ascending=False).head(20).to_string(index=False))
+    print(f"\n{close.shape[0]} 根K线 × {len(result)} 个组合，耗时 {elapsed:.2f} 秒")
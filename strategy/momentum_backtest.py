@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+向量化 ETF 动量轮动回测
+复现 etf-mom.ipynb 中 backtrader 策略 MomentumTopN 的规则：
+  - 得分 = 归一化收盘价对 1..N 线性回归的 斜率 × R²（lookback_period 窗口）
+  - 每 rebalance_days 个交易日调仓，持有得分最高的 topn 只，每只分配 1/topn 的总资产
+  - 按 100 股一手取整，先卖后买
+  - 百分比佣金、百分比滑点（按成交K线的最高/最低价截断）、cheat-on-close（按下单K线收盘价成交）
+
+所有日期、所有标的的得分一次性批量计算；组合记账只在调仓/成交日循环，
+资金检查与拒单规则与 backtrader 的 BackBroker 一致，权益曲线可与 backtrader 对照。
+
+用法:
+    from momentum_backtest import load_prices, run_momentum_backtest
+
+    prices = load_prices(etfs, '2025-02-26', '2025-08-26')
+    result = run_momentum_backtest(prices, lookback_period=40, topn=4, rebalance_days=5)
+    result.equity.plot()
+"""
+
+import os
+import sys
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# --- 配置 ---
+# dataset 目录（用于从本地数据仓库读取价格面板）
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dataset')
+# 回测默认参数，与 etf-mom.ipynb 中的 cerebro 设置一致
+DEFAULT_CASH = 100_000
+DEFAULT_COMMISSION = 0.0005
+DEFAULT_SLIPPAGE = 0.002
+LOT_SIZE = 100
+# 年化使用的交易日数量
+TRADING_DAYS = 252
+# --- 配置结束 ---
+
+
+def load_prices(symbols: Iterable[str], start: Optional[str] = None, end: Optional[str] = None,
+                fields: Iterable[str] = ('open', 'high', 'low', 'close')) -> Dict[str, pd.DataFrame]:
+    """
+    从本地数据仓库读取 日期 × 标的 价格面板。
+    不做填充：缺失的K线保留为 NaN，由回测按 backtrader 的方式处理（不推进该标的，价格沿用上一根K线）。
+    """
+    if DATASET_DIR not in sys.path:
+        sys.path.append(DATASET_DIR)
+    from panel import load_panel
+    return load_panel('etf_prices', list(fields), symbols=list(symbols), start=start, end=end, fill=None,
+                      adjust='hfq')
+
+
+def _window_scores(close: np.ndarray, lookback_period: int) -> np.ndarray:
+    """(T, N) 收盘价 -> (T, N) 得分，要求窗口内的K线连续（NaN 会传播为 NaN）"""
+    n_dates, n_assets = close.shape
+    scores = np.full((n_dates, n_assets), np.nan)
+    if n_dates < lookback_period:
+        return scores
+
+    # (T - L + 1, N, L) 的滑动窗口视图，不复制数据
+    windows = sliding_window_view(close, lookback_period, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        y = windows / windows[:, :, :1]
+        x = np.arange(1, lookback_period + 1, dtype='float64')
+        x_centered = x - x.mean()
+        sxx = (x_centered ** 2).sum()
+        y_centered = y - y.mean(axis=2, keepdims=True)
+        sxy = (y_centered * x_centered).sum(axis=2)
+        syy = (y_centered ** 2).sum(axis=2)
+        slope = sxy / sxx
+        # 与 sklearn 的 r2_score 一致：y 为常数时 R² 记为 1（此时斜率为 0）
+        r2 = np.where(syy > 0, sxy ** 2 / (sxx * syy), 1.0)
+        scores[lookback_period - 1:] = slope * r2
+    return scores
+
+
+def momentum_scores(close: np.ndarray, lookback_period: int, has_bar: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    批量计算所有日期、所有标的的动量得分。
+
+    第 t 行使用标的截至 t（含）的最近 lookback_period 根K线：y = close / close[窗口首根]，x = 1..lookback_period，
+    得分 = OLS 斜率 × R²。与 backtrader 一致，窗口只包含标的自己的K线：某日没有K线（停牌/数据缺失）时
+    沿用上一根K线的得分；K线数不足 lookback_period 时为 NaN（不参与排名）。
+
+    Args:
+        close: (T, N) 收盘价矩阵（可以已前向填充）。
+        has_bar: (T, N) 标的当日是否有K线，默认取 close 中的非 NaN 位置。
+
+    Returns:
+        (T, N) 得分矩阵。
+    """
+    close = np.asarray(close, dtype='float64')
+    has_bar = np.isfinite(close) if has_bar is None else np.asarray(has_bar, dtype=bool)
+    if lookback_period < 2:
+        return np.full(close.shape, np.nan)
+
+    # 上市后K线连续的标的一次性批量计算；中间有缺口的标的压缩掉缺失日后单独计算
+    started = np.maximum.accumulate(has_bar, axis=0)
+    gapped = (started & ~has_bar).any(axis=0)
+    scores = _window_scores(np.where(has_bar, close, np.nan), lookback_period)
+    for asset in np.flatnonzero(gapped):
+        rows = np.flatnonzero(has_bar[:, asset])
+        asset_scores = np.full(len(close), np.nan)
+        asset_scores[rows] = _window_scores(close[rows, asset:asset + 1], lookback_period)[:, 0]
+        scores[:, asset] = pd.Series(asset_scores).where(has_bar[:, asset]).ffill().to_numpy()
+    return scores
+
+
+@dataclass
+class BacktestResult:
+    """回测结果：每日权益/现金/持仓、成交明细和被拒绝的订单数"""
+    equity: pd.Series
+    cash: pd.Series
+    positions: pd.DataFrame
+    trades: pd.DataFrame
+    rejected_orders: int
+
+    @property
+    def returns(self) -> pd.Series:
+        return self.equity.pct_change().fillna(0.0)
+
+    def sharpe(self, risk_free: float = 0.0, periods: int = TRADING_DAYS) -> float:
+        """年化夏普比率（日收益）"""
+        excess = self.returns - risk_free / periods
+        std = excess.std(ddof=1)
+        return float(excess.mean() / std * np.sqrt(periods)) if std > 0 else 0.0
+
+    def max_drawdown(self) -> float:
+        return float((self.equity / self.equity.cummax() - 1).min())
+
+
+def _slip_up(price: float, high: float, slippage: float) -> float:
+    if not slippage:
+        return price
+    slipped = price * (1 + slippage)
+    return slipped if slipped <= high else high
+
+
+def _slip_down(price: float, low: float, slippage: float) -> float:
+    if not slippage:
+        return price
+    slipped = price * (1 - slippage)
+    return slipped if slipped >= low else low
+
+
+def run_momentum_backtest(prices: Dict[str, pd.DataFrame], lookback_period: int = 20, topn: int = 4,
+                          rebalance_days: int = 5, lot_size: int = LOT_SIZE, cash: float = DEFAULT_CASH,
+                          commission: float = DEFAULT_COMMISSION, slippage: float = DEFAULT_SLIPPAGE,
+                          coc: bool = True, scores: Optional[np.ndarray] = None,
+                          bt_membership: bool = False) -> BacktestResult:
+    """
+    运行 MomentumTopN 回测。
+
+    Args:
+        prices: {'close': ..., 'high': ..., 'low': ...} 日期 × 标的 面板（coc=False 时还需要 'open'），
+                列顺序即 backtrader 中 adddata 的顺序（影响同分排名和下单顺序）。
+                close 中的 NaN 表示该标的当日没有K线，回测内部前向填充价格并在得分中跳过这些日期。
+        lookback_period / topn / rebalance_days / lot_size: 策略参数，含义同 MomentumTopN。
+        cash: 初始资金。
+        commission: 按成交额收取的佣金比例。
+        slippage: 百分比滑点；买入价不高于成交K线最高价，卖出价不低于成交K线最低价。
+        coc: True 按下单K线收盘价成交（cheat-on-close），False 按下一根K线开盘价成交。
+        scores: 预先计算好的 momentum_scores(close, lookback_period)，参数扫描时可复用。
+        bt_membership: 复现 notebook 中 `d in top` 的行为。backtrader 的数据对象重载了 ==，
+                       `in` 实际比较的是当日收盘价，收盘价恰好等于某只入选标的的ETF也会被当作入选并按目标仓位买入。
+                       默认关闭（按标的本身判断是否入选），与 backtrader 逐笔对账时打开。
+    """
+    close_df = prices['close']
+    dates, symbols = close_df.index, list(close_df.columns)
+    has_bar = close_df.notna().to_numpy()
+
+    def aligned(field: str) -> np.ndarray:
+        return prices[field].reindex(index=dates, columns=symbols).ffill().to_numpy(dtype='float64')
+
+    close = aligned('close')
+    high = aligned('high')
+    low = aligned('low')
+    open_ = aligned('open') if not coc else None
+    n_dates, n_assets = close.shape
+
+    if scores is None:
+        scores = momentum_scores(close, lookback_period, has_bar)
+
+    # 与 backtrader 一致：所有标的都有K线后策略才开始计数（之前为 prenext）
+    started = np.isfinite(close).all(axis=1)
+    first_bar = int(np.argmax(started)) if started.any() else n_dates
+    rebalance_bars = [t for t in range(first_bar, n_dates) if (t - first_bar + 1) % rebalance_days == 0]
+    rebalance_set = set(rebalance_bars)
+    event_bars = sorted(rebalance_set | {t + 1 for t in rebalance_bars if t + 1 < n_dates})
+
+    position = np.zeros(n_assets, dtype='int64')
+    cash_now = float(cash)
+    pending: List[tuple] = []    # (asset, size)，size > 0 买入、< 0 卖出，按下单顺序排列
+    pending_bar = -1
+    trades = []
+    rejected = 0
+
+    equity = np.empty(n_dates)
+    cash_hist = np.empty(n_dates)
+    pos_hist = np.empty((n_dates, n_assets), dtype='int64')
+    last = 0
+
+    for t in event_bars:
+        # 事件之间持仓不变，直接批量记账
+        pos_hist[last:t] = position
+        cash_hist[last:t] = cash_now
+        last = t
+
+        # --- 1. 执行上一根K线提交的订单（BackBroker.next 在策略 next 之前运行） ---
+        if pending and pending_bar == t - 1:
+            created = pending_bar
+            # 提交检查：按下单价格依次伪成交，资金为负的订单被拒绝（之后的订单沿用为负的资金继续检查）
+            check_cash = cash_now
+            accepted = []
+            for asset, size in pending:
+                price = close[created, asset]
+                check_cash -= size * price + abs(size) * price * commission
+                if check_cash >= 0:
+                    accepted.append((asset, size))
+                else:
+                    rejected += 1
+            for asset, size in accepted:
+                base = close[created, asset] if coc else open_[t, asset]
+                if size > 0:
+                    price = _slip_up(base, high[t, asset], slippage)
+                    cost = size * price
+                    fee = size * price * commission
+                    if cash_now - cost - fee < 0:
+                        # 实际成交价高于检查价格导致资金不足，订单作废
+                        rejected += 1
+                        continue
+                    cash_now -= cost + fee
+                else:
+                    price = _slip_down(base, low[t, asset], slippage)
+                    fee = -size * price * commission
+                    cash_now += -size * price - fee
+                position[asset] += size
+                trades.append((dates[t], symbols[asset], size, price, fee))
+            pending = []
+
+        # --- 2. 调仓日：选出 TopN 并生成订单 ---
+        if t in rebalance_set:
+            row = scores[t]
+            eligible = np.flatnonzero(np.isfinite(row))
+            if eligible.size:
+                # 稳定排序：同分时保持标的顺序，与 Python 的 sort(reverse=True) 一致
+                ranked = eligible[np.argsort(-row[eligible], kind='stable')]
+                top = ranked[:topn]
+                total_value = cash_now + float(position @ close[t])
+                selected = np.zeros(n_assets, dtype=bool)
+                selected[top] = True
+                if bt_membership:
+                    selected |= np.isin(close[t], close[t, top])
+                per_stock = total_value / len(top)
+                target = np.where(
+                    selected, np.maximum(0, (per_stock / close[t] // lot_size).astype('int64') * lot_size), 0
+                )
+                delta = target - position
+                sells = [(asset, int(delta[asset])) for asset in range(n_assets) if delta[asset] < 0]
+                buys = [(asset, int(delta[asset])) for asset in range(n_assets) if delta[asset] > 0]
+                pending = sells + buys
+                pending_bar = t
+
+    pos_hist[last:] = position
+    cash_hist[last:] = cash_now
+    # 上市前的价格为 NaN，对应持仓为 0，按 0 计值
+    equity[:] = cash_hist + (pos_hist * np.nan_to_num(close)).sum(axis=1)
+
+    return BacktestResult(
+        equity=pd.Series(equity, index=dates, name='equity'),
+        cash=pd.Series(cash_hist, index=dates, name='cash'),
+        positions=pd.DataFrame(pos_hist, index=dates, columns=symbols),
+        trades=pd.DataFrame(trades, columns=['date', 'symbol', 'size', 'price', 'commission']),
+        rejected_orders=rejected,
+    )
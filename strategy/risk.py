@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+蒙特卡洛风险评估（bootstrap 重采样）
+替代 etf-mom.ipynb 中逐次 np.random.choice + cumprod 的循环：
+  - 路径按块批量生成（路径数 × 期数 的矩阵），每块大小受内存上限控制，完整的模拟矩阵从不落地
+  - 重采样方式: iid（独立同分布）、block（固定长度的移动块）、stationary（块长服从几何分布的平稳 bootstrap），
+    后两者保留收益率的自相关
+  - 每块使用由 SeedSequence 派生的独立随机流，结果与进程数无关，可复现
+  - 各块只返回直方图和计数，合并后得到终值分位数、亏损概率、最大回撤分布
+
+用法:
+    from risk import simulate_paths
+
+    result = simulate_paths(returns, n_paths=1_000_000, horizon=756, method='stationary', block_size=20,
+                            checkpoints=[252, 504, 756], seed=42)
+    print(result.summary())
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# --- 配置 ---
+# 默认进程数：可用 CPU 核数
+DEFAULT_WORKERS = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+# 重采样方式
+METHODS = ('iid', 'block', 'stationary')
+# block / stationary 的（平均）块长
+DEFAULT_BLOCK_SIZE = 20
+# 每块路径占用的内存上限（字节），决定每块的路径数
+CHUNK_BYTES = 64 * 1024 ** 2
+# 默认输出的分位数
+DEFAULT_QUANTILES = (0.01, 0.025, 0.05, 0.25, 0.5, 0.75, 0.95, 0.975, 0.99)
+# 默认的亏损阈值（终值低于初始资金的倍数）
+DEFAULT_LOSS_THRESHOLDS = (1.0, 0.9, 0.8)
+# 直方图的分箱数量，分位数误差不超过一个分箱宽度
+HIST_BINS = 20_000
+# 用于确定直方图范围的试算路径数
+PILOT_PATHS = 4096
+# --- 配置结束 ---
+
+
+@dataclass
+class RiskResult:
+    """模拟结果：各检查点（期数）的终值分布、亏损概率和最大回撤分布，终值以初始资金的倍数表示"""
+    n_paths: int
+    quantiles: pd.DataFrame
+    drawdown_quantiles: pd.DataFrame
+    loss_probability: pd.DataFrame
+    mean: pd.Series
+    std: pd.Series
+    clipped: pd.Series
+
+    def summary(self) -> pd.DataFrame:
+        """每个检查点一行：均值、标准差、亏损概率、终值分位数、最大回撤中位数"""
+        return pd.concat([
+            self.mean.rename('mean'),
+            self.std.rename('std'),
+            self.loss_probability.add_prefix('P(<').add_suffix(')'),
+            self.quantiles.add_prefix('q'),
+            self.drawdown_quantiles[0.5].rename('max_drawdown_median') if 0.5 in self.drawdown_quantiles else None,
+        ], axis=1)
+
+
+def _paths_per_chunk(horizon: int, chunk_bytes: int) -> int:
+    # 每块同时存在约 4 个 路径数 × 期数 的 8 字节数组（下标、对数收益、累计值、回撤）
+    return max(1, chunk_bytes // (horizon * 8 * 4))
+
+
+def _sample_indices(rng: np.random.Generator, n_obs: int, n_paths: int, horizon: int,
+                    method: str, block_size: int) -> np.ndarray:
+    """生成 (n_paths, horizon) 的重采样下标；块在序列末尾循环回到开头"""
+    if method == 'iid' or block_size <= 1:
+        return rng.integers(0, n_obs, size=(n_paths, horizon))
+    steps = np.arange(horizon)
+    if method == 'block':
+        new_block = np.broadcast_to(steps % block_size == 0, (n_paths, horizon))
+    else:
+        new_block = rng.random((n_paths, horizon)) < 1.0 / block_size
+        new_block[:, 0] = True
+    # 每一步所在块的起点位置，块内下标依次递增
+    block_start = np.maximum.accumulate(np.where(new_block, steps, 0), axis=1)
+    starts = rng.integers(0, n_obs, size=(n_paths, horizon))
+    indices = np.take_along_axis(starts, block_start, axis=1)
+    indices += steps - block_start
+    indices %= n_obs
+    return indices
+
+
+def iter_log_equity(returns: Iterable[float], n_paths: int, horizon: int, method: str = 'stationary',
+                    block_size: int = DEFAULT_BLOCK_SIZE, seed: Optional[int] = None,
+                    chunk_bytes: int = CHUNK_BYTES) -> Iterator[np.ndarray]:
+    """
+    逐块生成对数权益路径 (块路径数, horizon)，第 t 列为 t+1 期后的 log(权益 / 初始资金)。
+    用于自定义的流式统计；与 simulate_paths 使用相同的块划分和随机流。
+    """
+    log_returns = _log_returns(returns)
+    for seed_seq, size in _chunk_plan(n_paths, horizon, seed, chunk_bytes)[1]:
+        rng = np.random.default_rng(seed_seq)
+        indices = _sample_indices(rng, len(log_returns), size, horizon, method, block_size)
+        yield np.cumsum(log_returns[indices], axis=1)
+
+
+def _log_returns(returns: Iterable[float]) -> np.ndarray:
+    values = np.asarray(pd.Series(returns).dropna(), dtype='float64')
+    if not values.size:
+        raise ValueError("收益率序列为空")
+    if (values <= -1).any():
+        raise ValueError("收益率不能小于等于 -100%")
+    return np.log1p(values)
+
+
+def _chunk_plan(n_paths: int, horizon: int, seed: Optional[int], chunk_bytes: int):
+    """(试算随机流, [(每块随机流, 路径数)])；块划分只取决于路径数和内存上限，与进程数无关"""
+    pilot_seq, work_seq = np.random.SeedSequence(seed).spawn(2)
+    per_chunk = _paths_per_chunk(horizon, chunk_bytes)
+    sizes = [per_chunk] * (n_paths // per_chunk) + ([n_paths % per_chunk] if n_paths % per_chunk else [])
+    return pilot_seq, list(zip(work_seq.spawn(len(sizes)), sizes))
+
+
+def _histogram(values: np.ndarray, low: np.ndarray, high: np.ndarray, bins: int) -> np.ndarray:
+    """按列分箱 (路径数, 检查点数) -> (检查点数, bins)；超出范围的值计入两端的分箱"""
+    scaled = (values - low) / (high - low) * bins
+    index = np.clip(scaled, 0, bins - 1).astype('int64')
+    index += np.arange(values.shape[1]) * bins
+    return np.bincount(index.ravel(), minlength=values.shape[1] * bins).reshape(values.shape[1], bins)
+
+
+# --- 工作进程状态 ---
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(params: Dict[str, Any]):
+    _worker.update(params)
+
+
+def _simulate_chunk(task) -> Dict[str, np.ndarray]:
+    """模拟一块路径，只返回可合并的统计量"""
+    seed_seq, size = task
+    p = _worker
+    rng = np.random.default_rng(seed_seq)
+    indices = _sample_indices(rng, len(p['log_returns']), size, p['horizon'], p['method'], p['block_size'])
+    log_equity = np.cumsum(p['log_returns'][indices], axis=1)
+    del indices
+    # 最大回撤（以正数表示），初始资金作为第一个高点
+    peak = np.maximum.accumulate(np.maximum(log_equity, 0.0), axis=1)
+    drawdown = np.maximum.accumulate(-np.expm1(log_equity - peak), axis=1)
+
+    columns = p['columns']
+    final = log_equity[:, columns]
+    equity = np.exp(final)
+    return {
+        'counts': _histogram(final, p['low'], p['high'], p['bins']),
+        'drawdown_counts': _histogram(drawdown[:, columns], np.zeros(len(columns)), np.ones(len(columns)), p['bins']),
+        'sum': equity.sum(axis=0),
+        'sum_sq': np.square(equity).sum(axis=0),
+        'loss': (final[:, :, None] < p['log_thresholds']).sum(axis=0),
+        'clipped': ((final < p['low']) | (final > p['high'])).sum(axis=0),
+    }
+
+
+def _hist_quantiles(counts: np.ndarray, low: np.ndarray, high: np.ndarray, quantiles: List[float]) -> np.ndarray:
+    """由直方图按分箱内线性插值求分位数 -> (检查点数, 分位数个数)"""
+    bins = counts.shape[1]
+    result = np.empty((len(counts), len(quantiles)))
+    for i, row in enumerate(counts):
+        cdf = np.concatenate([[0], np.cumsum(row)]) / row.sum()
+        edges = np.linspace(low[i], high[i], bins + 1)
+        for j, q in enumerate(quantiles):
+            k = min(max(np.searchsorted(cdf, q, side='left'), 1), bins)
+            span = cdf[k] - cdf[k - 1]
+            frac = (q - cdf[k - 1]) / span if span > 0 else 0.0
+            result[i, j] = edges[k - 1] + frac * (edges[k] - edges[k - 1])
+    return result
+
+
+def simulate_paths(returns: Iterable[float], n_paths: int = 10_000, horizon: int = 252,
+                   method: str = 'stationary', block_size: int = DEFAULT_BLOCK_SIZE,
+                   checkpoints: Optional[Iterable[int]] = None, quantiles: Iterable[float] = DEFAULT_QUANTILES,
+                   loss_thresholds: Iterable[float] = DEFAULT_LOSS_THRESHOLDS, seed: Optional[int] = None,
+                   max_workers: int = DEFAULT_WORKERS, chunk_bytes: int = CHUNK_BYTES,
+                   bins: int = HIST_BINS) -> RiskResult:
+    """
+    对收益率序列做 bootstrap 重采样，流式统计权益路径的分布。
+
+    Args:
+        returns: 单期收益率（日收益或逐笔交易收益），例如 BacktestResult.returns 或 pyfolio 的 returns。
+        n_paths: 模拟路径数。
+        horizon: 每条路径的期数。
+        method: 重采样方式，见 METHODS。
+        block_size: block 为固定块长，stationary 为平均块长。
+        checkpoints: 需要统计的期数（1..horizon），默认只统计终点。
+        quantiles: 输出的分位数。
+        loss_thresholds: 亏损阈值（权益 / 初始资金），输出权益低于阈值的概率。
+        seed: 随机种子；相同种子和 chunk_bytes 下结果与 max_workers 无关。
+        max_workers: 进程数，1 表示在当前进程中计算。
+        chunk_bytes: 每块路径占用的内存上限。
+        bins: 直方图分箱数量。
+
+    Returns:
+        RiskResult，各表以检查点为行。
+    """
+    if method not in METHODS:
+        raise ValueError(f"不支持的重采样方式: {method}，可选: {METHODS}")
+    if n_paths < 1 or horizon < 1:
+        raise ValueError("n_paths 和 horizon 必须为正整数")
+    checkpoints = sorted(set(checkpoints)) if checkpoints is not None else [horizon]
+    if checkpoints[0] < 1 or checkpoints[-1] > horizon:
+        raise ValueError(f"检查点必须在 1..{horizon} 之间")
+    quantiles = list(quantiles)
+    loss_thresholds = list(loss_thresholds)
+
+    log_returns = _log_returns(returns)
+    pilot_seq, tasks = _chunk_plan(n_paths, horizon, seed, chunk_bytes)
+    columns = np.array(checkpoints) - 1
+
+    # 试算一小批路径确定各检查点的直方图范围（两侧各留出一倍的余量），试算路径不计入结果
+    pilot_size = min(PILOT_PATHS, _paths_per_chunk(horizon, chunk_bytes), max(n_paths, 1))
+    pilot = np.cumsum(log_returns[_sample_indices(np.random.default_rng(pilot_seq), len(log_returns), pilot_size,
+                                                  horizon, method, block_size)], axis=1)[:, columns]
+    low, high = pilot.min(axis=0), pilot.max(axis=0)
+    pad = np.maximum(high - low, 1e-6)
+    low, high = low - pad, high + pad
+
+    params = dict(log_returns=log_returns, horizon=horizon, method=method, block_size=block_size,
+                  columns=columns, low=low, high=high, bins=bins, log_thresholds=np.log(loss_thresholds))
+    if max_workers <= 1 or len(tasks) <= 1:
+        _init_worker(params)
+        parts = map(_simulate_chunk, tasks)
+        totals = _merge(parts)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(params,)) as pool:
+            totals = _merge(pool.map(_simulate_chunk, tasks))
+
+    mean = totals['sum'] / n_paths
+    std = np.sqrt(np.maximum(totals['sum_sq'] / n_paths - mean ** 2, 0.0) * n_paths / max(n_paths - 1, 1))
+    index = pd.Index(checkpoints, name='horizon')
+    return RiskResult(
+        n_paths=n_paths,
+        quantiles=pd.DataFrame(np.exp(_hist_quantiles(totals['counts'], low, high, quantiles)),
+                               index=index, columns=quantiles),
+        drawdown_quantiles=pd.DataFrame(_hist_quantiles(totals['drawdown_counts'], np.zeros(len(columns)),
+                                                        np.ones(len(columns)), quantiles),
+                                        index=index, columns=quantiles),
+        loss_probability=pd.DataFrame(totals['loss'] / n_paths, index=index, columns=loss_thresholds),
+        mean=pd.Series(mean, index=index),
+        std=pd.Series(std, index=index),
+        clipped=pd.Series(totals['clipped'] / n_paths, index=index),
+    )
+
+
+def _merge(parts: Iterable[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """按块顺序累加各块的统计量"""
+    totals: Dict[str, np.ndarray] = {}
+    for part in parts:
+        for key, value in part.items():
+            totals[key] = totals[key] + value if key in totals else value
+    return totals
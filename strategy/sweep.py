@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并行参数扫描
+替代 etf-mom.ipynb 中每个 trial 都重建 bt.Cerebro 的 optuna objective：
+  - 价格面板只加载一次，放入共享内存，工作进程直接映射，不复制也不重新 pivot/ffill
+  - 进程池大小默认等于可用 CPU 核数
+  - 每个进程按 lookback_period 缓存得分矩阵，同一 lookback 下不同 topn / rebalance_days 的 trial 直接复用；
+    网格扫描按 lookback 分组派发，保证缓存命中
+  - 结果逐个写入 optuna study（可使用 sqlite 等持久化 storage），也可用 optuna 采样器驱动并行搜索
+
+用法:
+    from momentum_backtest import load_prices
+    from sweep import SharedPanels, grid_sweep, optuna_sweep
+
+    prices = load_prices(etfs, '2020-01-01', '2025-08-26')
+    with SharedPanels(prices) as shared:
+        df = grid_sweep(shared, {'lookback_period': range(10, 61, 5), 'topn': range(3, 7), 'rebalance_days': range(3, 11)},
+                        study=optuna.create_study(direction='maximize', storage='sqlite:///sweep.db', study_name='etf-mom'))
+"""
+
+import os
+import time
+import logging
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from momentum_backtest import momentum_scores, run_momentum_backtest
+
+try:
+    import optuna
+except ImportError:  # optuna 只在写入 study 时需要
+    optuna = None
+
+# --- 配置 ---
+# 默认进程数：可用 CPU 核数
+DEFAULT_WORKERS = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+# 每个进程缓存的得分矩阵数量（按 lookback_period）
+SCORE_CACHE_SIZE = 16
+# 网格扫描时每个任务包含的 trial 数量，减少进程间通信
+CHUNK_SIZE = 8
+# 共享内存中保存的价格字段
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+# 可选的优化目标
+METRICS = ('sharpe', 'total_return', 'max_drawdown')
+# --- 配置结束 ---
+
+logger = logging.getLogger(__name__)
+
+
+class SharedPanels:
+    """
+    把 日期 × 标的 价格面板放进一块共享内存。
+
+    主进程创建（with 语句结束时释放）；spec 可以 pickle 后传给工作进程，由 attach() 映射为零拷贝的 DataFrame。
+    """
+
+    def __init__(self, prices: Dict[str, pd.DataFrame]):
+        close = prices['close']
+        self.index = close.index
+        self.columns = list(close.columns)
+        self.fields = [field for field in PRICE_FIELDS if field in prices]
+        shape = (len(self.fields), len(self.index), len(self.columns))
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * 8))
+        values = np.ndarray(shape, dtype='float64', buffer=self._shm.buf)
+        for i, field in enumerate(self.fields):
+            values[i] = prices[field].reindex(index=self.index, columns=self.columns).to_numpy(dtype='float64')
+        self.spec = {
+            'name': self._shm.name,
+            'shape': shape,
+            'fields': self.fields,
+            'index': self.index,
+            'columns': self.columns,
+        }
+
+    @staticmethod
+    def attach(spec: Dict[str, Any]) -> Tuple[shared_memory.SharedMemory, Dict[str, pd.DataFrame]]:
+        """在工作进程中映射共享内存，返回 (共享内存句柄, 价格面板)；句柄需在进程存活期间保持引用"""
+        shm = shared_memory.SharedMemory(name=spec['name'])
+        values = np.ndarray(spec['shape'], dtype='float64', buffer=shm.buf)
+        values.flags.writeable = False
+        prices = {
+            field: pd.DataFrame(values[i], index=spec['index'], columns=spec['columns'], copy=False)
+            for i, field in enumerate(spec['fields'])
+        }
+        return shm, prices
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# --- 工作进程状态 ---
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(spec: Dict[str, Any], backtest_kwargs: Dict[str, Any]):
+    shm, prices = SharedPanels.attach(spec)
+    close = prices['close']
+    _worker.update(
+        shm=shm,
+        prices=prices,
+        close=close.ffill().to_numpy(dtype='float64'),
+        has_bar=close.notna().to_numpy(),
+        backtest_kwargs=backtest_kwargs,
+        scores={},
+    )
+
+
+def _scores_for(lookback_period: int) -> np.ndarray:
+    """按 lookback_period 缓存得分矩阵（简单 LRU）"""
+    cache = _worker['scores']
+    if lookback_period in cache:
+        cache[lookback_period] = cache.pop(lookback_period)
+        return cache[lookback_period]
+    scores = momentum_scores(_worker['close'], lookback_period, _worker['has_bar'])
+    cache[lookback_period] = scores
+    while len(cache) > SCORE_CACHE_SIZE:
+        cache.pop(next(iter(cache)))
+    return scores
+
+
+def _metric(result, metric: str) -> float:
+    if metric == 'sharpe':
+        return result.sharpe()
+    if metric == 'total_return':
+        return float(result.equity.iloc[-1] / result.equity.iloc[0] - 1)
+    if metric == 'max_drawdown':
+        return result.max_drawdown()
+    raise ValueError(f"不支持的优化目标: {metric}，可选: {METRICS}")
+
+
+def _run_trials(trials: List[Tuple[Any, Dict[str, int]]], metric: str) -> List[Tuple[Any, Dict[str, int], float, float]]:
+    """在工作进程中运行一组 trial，返回 [(trial 标识, 参数, 目标值, 耗时秒)]"""
+    results = []
+    for key, params in trials:
+        t0 = time.perf_counter()
+        scores = _scores_for(params['lookback_period'])
+        result = run_momentum_backtest(_worker['prices'], scores=scores, **params, **_worker['backtest_kwargs'])
+        results.append((key, params, _metric(result, metric), time.perf_counter() - t0))
+    return results
+
+
+def _record_trial(study, params: Dict[str, int], value: float, search_space: Dict[str, Iterable[int]]):
+    """把网格扫描的结果作为已完成的 trial 写入 optuna study"""
+    distributions = {
+        name: optuna.distributions.CategoricalDistribution(sorted(set(values)))
+        for name, values in search_space.items()
+    }
+    study.add_trial(optuna.trial.create_trial(params=params, distributions=distributions, value=value))
+
+
+def grid_sweep(shared: SharedPanels, search_space: Dict[str, Iterable[int]], metric: str = 'sharpe',
+               study=None, max_workers: int = DEFAULT_WORKERS, chunk_size: int = CHUNK_SIZE,
+               **backtest_kwargs) -> pd.DataFrame:
+    """
+    并行扫描参数网格。
+
+    Args:
+        shared: 价格面板的共享内存。
+        search_space: {参数名: 取值列表}，参数名同 run_momentum_backtest（必须包含 lookback_period）。
+        metric: 优化目标，见 METRICS。
+        study: optuna study；传入时每个结果返回后立即写入其 storage。
+        max_workers: 进程数。
+        chunk_size: 每个任务包含的 trial 数。
+        **backtest_kwargs: 传给 run_momentum_backtest 的其他参数（cash / commission / slippage 等）。
+
+    Returns:
+        每组参数的目标值，按目标值降序排列。
+    """
+    search_space = {name: list(values) for name, values in search_space.items()}
+    if 'lookback_period' not in search_space:
+        raise ValueError("search_space 必须包含 lookback_period")
+    if study is not None and optuna is None:
+        raise ImportError("写入 study 需要安装 optuna")
+
+    names = list(search_space)
+    grid = [dict(zip(names, map(int, combo))) for combo in itertools.product(*search_space.values())]
+    # 按 lookback 分组切块：同一任务内的 trial 共享同一个得分矩阵
+    grid.sort(key=lambda params: params['lookback_period'])
+    chunks = [
+        [(i, params) for i, params in enumerate(grid[start:start + chunk_size], start)]
+        for start in range(0, len(grid), chunk_size)
+    ]
+
+    rows = []
+    t0 = time.time()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(shared.spec, backtest_kwargs)) as pool:
+        futures = [pool.submit(_run_trials, chunk, metric) for chunk in chunks]
+        for future in as_completed(futures):
+            for _, params, value, elapsed in future.result():
+                rows.append({**params, metric: value, 'elapsed_ms': elapsed * 1000})
+                if study is not None:
+                    _record_trial(study, params, value, search_space)
+
+    elapsed = time.time() - t0
+    logger.info(f"网格扫描完成: {len(grid)} 组参数，{max_workers} 个进程，耗时 {elapsed:.2f} 秒 "
+                f"({len(grid) / max(elapsed, 1e-9):.1f} trial/秒)")
+    # 三个目标都是越大越好（max_drawdown 为负数）
+    return pd.DataFrame(rows).sort_values(metric, ascending=False).reset_index(drop=True)
+
+
+def optuna_sweep(shared: SharedPanels, study, search_space: Dict[str, Tuple[int, int, int]], n_trials: int,
+                 metric: str = 'sharpe', max_workers: int = DEFAULT_WORKERS, **backtest_kwargs):
+    """
+    用 optuna 采样器驱动的并行搜索（ask/tell）：保持 max_workers 个 trial 同时运行，结果返回后立即 tell。
+
+    Args:
+        study: optuna study（采样器、方向和 storage 由调用方决定）。
+        search_space: {参数名: (low, high, step)}，对应 trial.suggest_int。
+        n_trials: trial 总数。
+
+    Returns:
+        study。
+    """
+    if optuna is None:
+        raise ImportError("optuna_sweep 需要安装 optuna")
+
+    def ask():
+        trial = study.ask()
+        params = {name: trial.suggest_int(name, low, high, step=step)
+                  for name, (low, high, step) in search_space.items()}
+        return trial, params
+
+    t0 = time.time()
+    submitted = 0
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(shared.spec, backtest_kwargs)) as pool:
+        running = {}
+        while submitted < n_trials or running:
+            while submitted < n_trials and len(running) < max_workers:
+                trial, params = ask()
+                running[pool.submit(_run_trials, [(trial.number, params)], metric)] = trial
+                submitted += 1
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                trial = running.pop(future)
+                try:
+                    (_, _, value, _), = future.result()
+                    study.tell(trial, value)
+                except Exception as e:
+                    logger.error(f"trial {trial.number} 失败: {e}")
+                    study.tell(trial, state=optuna.trial.TrialState.FAIL)
+
+    logger.info(f"optuna 搜索完成: {n_trials} 个 trial，{max_workers} 个进程，耗时 {time.time() - t0:.2f} 秒")
+    return study
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+"""测试直接导入 dataset/ 和 strategy/ 下的模块（与脚本和 notebook 的用法一致）"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in ('dataset', 'strategy'):
+    path = os.path.join(ROOT, directory)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""多个进程同时更新同一张表的目录时不丢失分区"""
+
+import multiprocessing
+import os
+
+from catalog import CATALOG_DIR, load_catalog, update_catalog
+from schemas import get_schema
+from storage import save_partitioned
+from synthetic import etf_prices
+
+WRITERS = 6
+
+
+def write_month(output_dir: str, month: int):
+    schema = get_schema('etf_prices')
+    df = etf_prices(n_symbols=2, years=1, start='2020-01-01', seed=month, missing_rate=0)
+    df = df[df['date'].dt.month == month]
+    for _ in range(3):
+        written = save_partitioned(df, output_dir, 'etf_prices', schema.date_column, schema.unique_columns,
+                                   schema=schema, mode='append')
+        update_catalog(output_dir, 'etf_prices', written)
+
+
+def test_concurrent_updates_keep_all_partitions(tmp_path):
+    output_dir = str(tmp_path)
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=write_month, args=(output_dir, month)) for month in range(1, WRITERS + 1)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert all(process.exitcode == 0 for process in processes)
+
+    catalog = load_catalog(output_dir, 'etf_prices', rebuild_if_missing=False)
+    assert sorted(catalog['partitions']) == [f'2020-{month:02d}' for month in range(1, WRITERS + 1)]
+    assert all(len(entry['files']) == 3 for entry in catalog['partitions'].values())
+    # 没有遗留的临时文件
+    assert not [name for name in os.listdir(os.path.join(output_dir, CATALOG_DIR)) if name.endswith('.tmp')]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""FetchExecutor 的错误隔离、重试和限速（使用 StubDataSource，不访问网络）"""
+
+import time
+
+from fetch_pool import FetchExecutor, StubDataSource
+
+SYMBOLS = ['510300', '510500', '159915', '512100']
+
+
+def no_sleep(seconds: float):
+    pass
+
+
+def test_failing_symbol_does_not_affect_others():
+    source = StubDataSource(lambda symbol: f'data-{symbol}', latency=0, fail_symbols=['159915'])
+    executor = FetchExecutor(max_workers=4, max_retries=2, sleep=no_sleep)
+
+    result = executor.fetch_all(SYMBOLS, source, host='test')
+
+    assert set(result.errors) == {'159915'}
+    assert isinstance(result.errors['159915'], ConnectionError)
+    assert result.results == {symbol: f'data-{symbol}' for symbol in SYMBOLS if symbol != '159915'}
+    # 失败的标的用完全部重试，其他标的只请求一次
+    assert result.attempts['159915'] == 3
+    assert source.calls['159915'] == 3
+    assert all(result.attempts[symbol] == 1 for symbol in result.results)
+
+
+def test_retry_succeeds_after_injected_failures():
+    source = StubDataSource(lambda symbol: symbol, latency=0, fail_first=2)
+    delays = []
+    executor = FetchExecutor(max_workers=2, max_retries=3, backoff_base=0.5, backoff_max=10, sleep=delays.append)
+
+    result = executor.fetch_all(SYMBOLS, source, host='test')
+
+    assert not result.errors
+    assert result.results == {symbol: symbol for symbol in SYMBOLS}
+    assert all(result.attempts[symbol] == 3 for symbol in SYMBOLS)
+    assert len(delays) == 2 * len(SYMBOLS)
+    assert all(0 <= delay <= 0.5 * 2 for delay in delays)
+
+
+def test_retry_on_can_stop_retries():
+    source = StubDataSource(lambda symbol: symbol, latency=0, fail_first=1)
+    executor = FetchExecutor(max_retries=3, retry_on=lambda e: not isinstance(e, ConnectionError), sleep=no_sleep)
+
+    result = executor.fetch_all(SYMBOLS, source, host='test')
+
+    assert set(result.errors) == set(SYMBOLS)
+    assert all(source.calls[symbol] == 1 for symbol in SYMBOLS)
+
+
+def test_token_bucket_limits_request_rate():
+    rate, requests = 20.0, 30
+    symbols = [f'{i:06d}' for i in range(requests)]
+    source = StubDataSource(lambda symbol: symbol, latency=0)
+    executor = FetchExecutor(max_workers=8, rate_limits={'limited': rate})
+
+    started = time.monotonic()
+    result = executor.fetch_all(symbols, source, host='limited')
+    elapsed = time.monotonic() - started
+
+    assert len(result.results) == requests
+    # 令牌桶初始有 rate 个令牌，其余请求按每秒 rate 个放行
+    assert elapsed >= (requests - rate) / rate * 0.9
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""向量化动量回测与 etf-mom.ipynb 中 backtrader 策略 MomentumTopN 的对照"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+bt = pytest.importorskip('backtrader')
+LinearRegression = pytest.importorskip('sklearn.linear_model').LinearRegression
+
+from momentum_backtest import run_momentum_backtest
+from synthetic import etf_prices
+
+PARAMS = {'lookback_period': 20, 'topn': 3, 'rebalance_days': 5}
+CASH = 100_000
+COMMISSION = 0.0005
+SLIPPAGE = 0.002
+# 逐日权益的最大相对误差（手工对照时观察到约 3e-15）
+TOLERANCE = 1e-12
+
+
+def calculate_score(data: np.ndarray) -> float:
+    """与 notebook 相同：归一化收盘价对 1..N 回归的 斜率 × R²"""
+    x = np.arange(1, len(data) + 1).reshape(-1, 1)
+    y = data / data[0]
+    reg = LinearRegression().fit(x, y)
+    return reg.coef_[0] * reg.score(x, y)
+
+
+class MomentumTopN(bt.Strategy):
+    """etf-mom.ipynb 中的策略（去掉调试输出），另外记录每根K线结束时的账户权益"""
+    params = (
+        ('lookback_period', 20),
+        ('topn', 4),
+        ('rebalance_days', 5),
+        ('lot_size', 100),
+    )
+
+    def __init__(self):
+        self.counter = 0
+        self.values = {}
+
+    def next(self):
+        self.values[self.datetime.date(0)] = self.broker.getvalue()
+        self.counter += 1
+        if self.counter % self.p.rebalance_days != 0:
+            return
+
+        eligible = []
+        scores = {}
+        for d in self.datas:
+            if len(d) >= self.p.lookback_period:
+                scores[d] = calculate_score(np.array(d.get(size=self.p.lookback_period)))
+                eligible.append(d)
+        eligible.sort(key=lambda d: scores[d], reverse=True)
+        top = eligible[:self.p.topn]
+        if not top:
+            return
+
+        target_per_stock = self.broker.getvalue() / len(top)
+        targets = {}
+        for d in self.datas:
+            if d in top:
+                target_size = int(target_per_stock / d.close[0] // self.p.lot_size) * self.p.lot_size
+                targets[d] = max(0, target_size)
+            else:
+                targets[d] = 0
+        for d in self.datas:
+            if self.getposition(d).size > targets[d]:
+                self.order_target_size(d, targets[d])
+        for d in self.datas:
+            if self.getposition(d).size < targets[d]:
+                self.order_target_size(d, targets[d])
+
+
+def run_backtrader(df: pd.DataFrame, symbols) -> pd.Series:
+    cerebro = bt.Cerebro()
+    for symbol in symbols:
+        df_sym = df[df['symbol'] == symbol].set_index('date')[['open', 'high', 'low', 'close', 'volume']]
+        cerebro.adddata(bt.feeds.PandasData(dataname=df_sym, name=symbol))
+    cerebro.addstrategy(MomentumTopN, **PARAMS)
+    cerebro.broker.setcommission(commission=COMMISSION)
+    cerebro.broker.set_slippage_perc(SLIPPAGE)
+    cerebro.broker.set_coc(True)
+    cerebro.broker.setcash(CASH)
+    strategy = cerebro.run()[0]
+    values = pd.Series(strategy.values)
+    values.index = pd.to_datetime(values.index)
+    return values
+
+
+@pytest.mark.parametrize('missing_rate', [0.0, 0.02])
+def test_equity_matches_backtrader(missing_rate):
+    df = etf_prices(n_symbols=6, years=1, seed=7, missing_rate=missing_rate)
+    symbols = list(dict.fromkeys(df['symbol']))
+    prices = {field: df.pivot(index='date', columns='symbol', values=field)[symbols]
+              for field in ('open', 'high', 'low', 'close')}
+
+    result = run_momentum_backtest(prices, cash=CASH, commission=COMMISSION, slippage=SLIPPAGE,
+                                   bt_membership=True, **PARAMS)
+    expected = run_backtrader(df, symbols)
+
+    assert len(result.trades) > 0
+    equity = result.equity.reindex(expected.index)
+    assert equity.notna().all()
+    np.testing.assert_allclose(equity.to_numpy(), expected.to_numpy(), rtol=TOLERANCE, atol=0)
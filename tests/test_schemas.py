@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""按结构版本读取旧文件：写入时还没有的标记位列在读取时从源列补算"""
+
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from catalog import read_table
+from schemas import ICON_FLAGS, get_schema
+from storage import get_partition_path
+
+ICONS = [{}, {'R': '最后交易日：2025-09-01'}, {'O': '公告要强赎', 'G': '不强赎'}]
+
+
+def write_old_convertible_bonds(output_dir: str) -> str:
+    """写入一个没有结构版本元数据、没有 icon_flags 列、icons 为 JSON 字符串的旧文件"""
+    partition_path = get_partition_path(output_dir, 'convertible_bonds', '2024-01')
+    os.makedirs(partition_path, exist_ok=True)
+    path = os.path.join(partition_path, 'data.parquet')
+    table = pa.table({
+        'bond_id': ['113001', '113002', '123003'],
+        'bond_nm': ['转债A', '转债B', '转债C'],
+        'price': [101.5, 130.2, 99.8],
+        'icons': [json.dumps(icons, ensure_ascii=False) for icons in ICONS],
+        'update_date': pd.to_datetime(['2024-01-05'] * 3),
+    })
+    pq.write_table(table, path)
+    return path
+
+
+def expected_flags():
+    return [sum(ICON_FLAGS[key] for key in icons) for icons in ICONS]
+
+
+def test_scan_all_columns_derives_flag_columns(tmp_path):
+    path = write_old_convertible_bonds(str(tmp_path))
+
+    table = get_schema('convertible_bonds').scan(path)
+
+    assert 'icons' in table.column_names
+    assert table['icon_flags'].to_pylist() == expected_flags()
+
+
+def test_read_table_all_columns_derives_flag_columns(tmp_path):
+    write_old_convertible_bonds(str(tmp_path))
+
+    df = read_table(str(tmp_path), 'convertible_bonds').sort_values('bond_id')
+
+    assert df['icon_flags'].tolist() == expected_flags()
+    assert df['price'].tolist() == [101.5, 130.2, 99.8]
+
+
+def test_snapshot_of_old_files_has_flag_columns(tmp_path):
+    from snapshot import publish, snapshot_arrays
+
+    write_old_convertible_bonds(str(tmp_path))
+    publish('convertible_bonds', str(tmp_path))
+
+    arrays = snapshot_arrays('convertible_bonds', ['bond_id', 'icon_flags'], output_dir=str(tmp_path))
+    assert dict(zip(arrays['bond_id'], arrays['icon_flags'])) == dict(zip(['113001', '113002', '123003'],
+                                                                          expected_flags()))